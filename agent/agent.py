@@ -1,12 +1,10 @@
 """Handcrafted dialog policy for the dialog agent."""
 
-from numpy.random import binomial
-
 from agent_action import AgentActions
 from agent_state import AgentState
 from utils.params import AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY
-from utils.params import AgentActionType, AgentStateStatus, UserActionType
-from utils.params import NUM_SLOTS
+from utils.params import AgentActionType, UserActionType
+from utils.utils import get_random_state
 
 
 class Agent(object):
@@ -16,12 +14,15 @@ class Agent(object):
 
     Attributes:
         prev_agent_act (AgentAction): Agent's action at the last timestep.
+        random_state (numpy.random.RandomState or None): Source of randomness;
+            None for the global state of `numpy.random`.
         state (AgentState): Agent's current state.
     """
 
-    def __init__(self):
+    def __init__(self, random_state=None):
         self.state = AgentState()
         self.prev_agent_act = None
+        self.random_state = random_state
 
     def start_dialog(self):
         """Kicks off the dialog session by having the agent take the first
@@ -313,9 +314,7 @@ class Agent(object):
     def _mark_all_slots_as_obtained(self):
         """Marks all slots "OBTAINED"
         """
-        for id_ in xrange(NUM_SLOTS):
-            if self.state.slots[id_] is AgentStateStatus.EMPTY:
-                self.state.mark_slot_as_obtained(id_)
+        self.state.mark_all_slots_as_obtained()
 
     def _ask_or_close(self):
         """If there is an EMPTY slot, retuns an action to request that slot.
@@ -365,13 +364,22 @@ class Agent(object):
         Returns:
             AgentAction: An action to confirm a slot.
         """
-        # Controls the fraction of total confirmations that are explicit.
-        b = binomial(1, AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY)
-        if b == 1:
+        if self._choose_explicit_confirmation():
             return self._explicit_confirm()
         else:
             return self._implicit_confirm()
 
+    def _choose_explicit_confirmation(self):
+        """Randomly decides whether the next confirmation should be explicit.
+
+        Returns:
+            bool: True for an explicit confirmation, False for an implicit one.
+        """
+        # Controls the fraction of total confirmations that are explicit.
+        b = get_random_state(self.random_state).binomial(
+            1, AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY)
+        return b == 1
+
     def _explicit_confirm(self):
         """Returns an action to explicitly confirm an unconfirmed slot.
         If there is no slot that can be confirmed, then it invokes the
@@ -3,6 +3,39 @@
 from enum import Enum
 
 from utils.params import AgentActionType, NUM_SLOTS
+from utils.utils import LazyTable
+
+# Number of distinct agent actions.
+NUM_AGENT_ACTIONS = 3 + 2 * NUM_SLOTS + NUM_SLOTS**2
+
+
+def get_agent_action_code(type_, ask_id, confirm_id):
+    """Returns the code of an agent action, i.e., its index among all agent
+    actions: greet, close and bad close, followed by the requests of each
+    slot, the explicit confirmations of each slot and the implicit
+    confirmations of each pair of slots.
+
+    Args:
+        type_ (AgentActionType): Type of the action.
+        ask_id (int or None): Id of the slot requested by the action.
+        confirm_id (int or None): Id of the slot confirmed by the action.
+
+    Returns:
+        int or None: Code of the action; None for an action without a type.
+    """
+    if type_ is AgentActionType.GREET:
+        return 0
+    elif type_ is AgentActionType.CLOSE:
+        return 1
+    elif type_ is AgentActionType.BAD_CLOSE:
+        return 2
+    elif type_ is AgentActionType.ASK_SLOT:
+        return 3 + ask_id
+    elif type_ is AgentActionType.EXPLICIT_CONFIRM:
+        return 3 + NUM_SLOTS + confirm_id
+    elif type_ is AgentActionType.CONFIRM_ASK:
+        return 3 + 2 * NUM_SLOTS + confirm_id * NUM_SLOTS + ask_id
+    return None
 
 
 class AgentAction(object):
@@ -17,6 +50,8 @@ class AgentAction(object):
             action. Optionally, None.
         ask_id (TYPE): Description
         confirm_id (TYPE): Description
+        code (int): Index of the action among all agent actions; see
+            `get_agent_action_code`.
         type (AgentActionType): Type of action
     """
 
@@ -24,6 +59,7 @@ class AgentAction(object):
         self.type = type_
         self.ask_id = ask_id
         self.confirm_id = confirm_id
+        self.code = get_agent_action_code(type_, ask_id, confirm_id)
 
     def __hash__(self):
         # Only the `type` attribute is used for hashing.
@@ -49,23 +85,48 @@ class AgentActions(Enum):
     # `AgentAction` for greeting.
     greet = AgentAction(AgentActionType.GREET, None, None)
 
-    # Multiple `AgentAction`s for requesting a slot, one for each slot.
-    ask_slot = [AgentAction(AgentActionType.ASK_SLOT, i, None)
-                for i in xrange(NUM_SLOTS)]
+    # Multiple `AgentAction`s for requesting a slot, one for each slot. The
+    # slot-parameterized actions are only built when first used.
+    ask_slot = LazyTable(
+        lambda ask_id: AgentAction(AgentActionType.ASK_SLOT, ask_id, None),
+        NUM_SLOTS)
 
     # Multiple `AgentAction`s for explicitly confirming a slot, one for each
     # slot.
-    explicit_confirm = [AgentAction(AgentActionType.EXPLICIT_CONFIRM, None, i)
-                        for i in xrange(NUM_SLOTS)]
+    explicit_confirm = LazyTable(
+        lambda conf_id: AgentAction(AgentActionType.EXPLICIT_CONFIRM, None,
+                                    conf_id),
+        NUM_SLOTS)
 
     # A matrix of `AgentAction`s corresponding to implicit confirmation and
     # slot request. `AgentAction` in cell i,j performs implicit confirmation
     # for slot# i and asks for information about slot# j.
-    confirm_ask = [[AgentAction(AgentActionType.CONFIRM_ASK, ask_id, conf_id)
-                    for ask_id in xrange(NUM_SLOTS)]
-                   for conf_id in xrange(NUM_SLOTS)]
+    confirm_ask = LazyTable(
+        lambda conf_id: LazyTable(
+            lambda ask_id: AgentAction(AgentActionType.CONFIRM_ASK, ask_id,
+                                       conf_id),
+            NUM_SLOTS),
+        NUM_SLOTS)
     close = AgentAction(AgentActionType.CLOSE, None, None)
     bad_close = AgentAction(AgentActionType.BAD_CLOSE, None, None)
-    # Delete the loop variables to prevent them from being treated as
-    # enum members. Sigh.
-    del i, ask_id, conf_id
+
+
+def _get_agent_action(code):
+    """Returns the agent action with the given code; see
+    `get_agent_action_code`.
+    """
+    fixed = (AgentActions.greet, AgentActions.close, AgentActions.bad_close)
+    if code < 3:
+        return fixed[code].value
+    code -= 3
+    if code < NUM_SLOTS:
+        return AgentActions.ask_slot.value[code]
+    code -= NUM_SLOTS
+    if code < NUM_SLOTS:
+        return AgentActions.explicit_confirm.value[code]
+    code -= NUM_SLOTS
+    return AgentActions.confirm_ask.value[code // NUM_SLOTS][code % NUM_SLOTS]
+
+
+# Agent actions indexed by their codes.
+AGENT_ACTIONS_BY_CODE = LazyTable(_get_agent_action, NUM_AGENT_ACTIONS)
@@ -1,28 +1,69 @@
 """ Dialog agent's state."""
 
 from utils.params import AgentStateStatus, NUM_SLOTS
+from utils.utils import get_lowest_set_bit
+
+# Bitmask with the bits of all slots set.
+ALL_SLOTS_MASK = (1 << NUM_SLOTS) - 1
 
 
 class AgentState(object):
     """State class for dialog agent. The agent's state consists of status
         of all the slots.
 
+    The statuses are kept as two bitmasks, in which bit i is for the slot with
+    identifier i, so that the agent's queries take constant time however many
+    slots there are. A slot is "CONFIRMED" if its bit is set in neither mask.
+
     Attributes:
-        slots (dict): Dictionary of slot-status pairs. The dictionary is keyed
-            by slot identifiers, and the values correspond to the
-            status (`AgentStateStatus`) of each slot.
+        empty_mask (int): Bitmask of the "EMPTY" slots.
+        obtained_mask (int): Bitmask of the slots "OBTAINED", but not yet
+            "CONFIRMED".
+        slots (tuple of AgentStateStatus): Status of each slot, indexed by
+            slot identifiers. Setting it overwrites all statuses.
     """
 
     def __init__(self):
-        self.slots = {}
-
-        self._init_slots()
+        self.empty_mask = ALL_SLOTS_MASK
+        self.obtained_mask = 0
 
     def __str__(self):
         return "Slots: {}".format(self.slots)
 
+    @property
+    def slots(self):
+        return tuple(self.get_slot_status(id_) for id_ in xrange(NUM_SLOTS))
+
+    @slots.setter
+    def slots(self, statuses):
+        self.empty_mask = self.obtained_mask = 0
+        for slot_id, status in enumerate(statuses):
+            if status is AgentStateStatus.EMPTY:
+                self.empty_mask |= 1 << slot_id
+            elif status is AgentStateStatus.OBTAINED:
+                self.obtained_mask |= 1 << slot_id
+
+    def get_slot_status(self, slot_id):
+        """Returns the status of a slot.
+
+        Args:
+            slot_id (int): Identifier of the slot under consideration
+
+        Returns:
+            AgentStateStatus: Status of the slot.
+        """
+        bit = 1 << slot_id
+        if self.empty_mask & bit:
+            return AgentStateStatus.EMPTY
+        elif self.obtained_mask & bit:
+            return AgentStateStatus.OBTAINED
+        else:
+            return AgentStateStatus.CONFIRMED
+
     def mark_slot_as_empty(self, slot_id):
-        self.slots[slot_id] = AgentStateStatus.EMPTY
+        bit = 1 << slot_id
+        self.empty_mask |= bit
+        self.obtained_mask &= ~bit
 
     def mark_slot_as_obtained(self, slot_id, check=False):
         """Marks the given slot as "OBTAINED".
@@ -34,12 +75,20 @@ class AgentState(object):
             the slot will always be marked "OBTAINED" irrespective of its
             initial status.
         """
-        if ((not check) or
-                (self.slots[slot_id] is not AgentStateStatus.CONFIRMED)):
-            self.slots[slot_id] = AgentStateStatus.OBTAINED
+        bit = 1 << slot_id
+        if (not check) or (self.empty_mask | self.obtained_mask) & bit:
+            self.empty_mask &= ~bit
+            self.obtained_mask |= bit
 
     def mark_slot_as_confirmed(self, slot_id):
-        self.slots[slot_id] = AgentStateStatus.CONFIRMED
+        bit = 1 << slot_id
+        self.empty_mask &= ~bit
+        self.obtained_mask &= ~bit
+
+    def mark_all_slots_as_obtained(self):
+        """Marks all "EMPTY" slots as "OBTAINED"."""
+        self.obtained_mask |= self.empty_mask
+        self.empty_mask = 0
 
     def get_empty_slot(self):
         """Returns the slot identifier for an empty slot. If no slot is empty,
@@ -48,10 +97,7 @@ class AgentState(object):
         Returns:
             int or None: Slot identifier or None
         """
-        for slot_id, val in self.slots.iteritems():
-            if val is AgentStateStatus.EMPTY:
-                return slot_id
-        return None
+        return get_lowest_set_bit(self.empty_mask)
 
     def get_unconfirmed_slot(self):
         """Returns the slot identifier for an unconfirmed slot. If there is no
@@ -63,17 +109,9 @@ class AgentState(object):
         Returns:
             int or None: Slot identifier or None
         """
-        for slot_id, val in self.slots.iteritems():
-            if val is AgentStateStatus.OBTAINED:
-                return slot_id
-        return None
+        return get_lowest_set_bit(self.obtained_mask)
 
     def reset(self):
         """Resets the state so that all slots are marked "EMPTY"."""
-        self._init_slots()
-
-    def _init_slots(self):
-        """Initializes the `slots` dictionary with all slots marked "EMPTY".
-        """
-        for id_ in xrange(NUM_SLOTS):
-            self.mark_slot_as_empty(id_)
+        self.empty_mask = ALL_SLOTS_MASK
+        self.obtained_mask = 0
@@ -0,0 +1,285 @@
+"""Handcrafted dialog policy of the agent, compiled into a transition table."""
+
+import os
+
+import numpy as np
+
+from agent import Agent
+from agent_action import AGENT_ACTIONS_BY_CODE, AgentActions
+from agent_state import ALL_SLOTS_MASK
+from user.user_action import NUM_USER_ACTIONS, USER_ACTIONS_BY_CODE
+from utils.params import NUM_SLOTS, TRANSITION_TABLE_DIR
+from utils.utils import load_arrays, save_arrays
+
+# Version of the format of the cached tables; to be bumped whenever `Agent`
+# or the format changes.
+TABLE_VERSION = 1
+
+
+class ScriptedAgent(Agent):
+    """Agent whose choice between explicit and implicit confirmation is
+    dictated from outside, so that both branches can be explored.
+
+    Attributes:
+        explicit (bool): Outcome of the next choice of confirmation.
+        branched (bool): True if the choice was made since it was last reset.
+    """
+
+    def __init__(self):
+        super(ScriptedAgent, self).__init__()
+        self.explicit = True
+        self.branched = False
+
+    def _choose_explicit_confirmation(self):
+        self.branched = True
+        return self.explicit
+
+
+class TransitionTable(object):
+    """Transition table of the handcrafted `Agent`.
+
+    A configuration of the agent consists of its slot statuses and its most
+    recent action. The table is built once per number of slots by driving
+    `Agent` through every configuration reachable from a greeting, every
+    user action and both kinds of confirmation, and is cached on disk.
+
+    Attributes:
+        branches (list of list of bool): Entry [c][u] tells whether the agent
+            chooses between explicit and implicit confirmation when the user
+            takes the action with code u in configuration c.
+        config_actions (list of AgentAction): Agent's most recent action in
+            each configuration.
+        config_acts (list of int): Code of the agent's most recent action in
+            each configuration.
+        config_empty (list of int): Bitmask of the "EMPTY" slots in each
+            configuration.
+        config_obtained (list of int): Bitmask of the "OBTAINED" slots in each
+            configuration.
+        next_configs (list of list of list of int): Entry [c][u][e] is the
+            configuration following c when the user takes the action with
+            code u, where e is 1 if the agent confirms explicitly and 0
+            otherwise; -1 if the user's action is invalid in c.
+        num_configs (int): Number of configurations.
+    """
+
+    _default_table = None
+
+    def __init__(self, arrays=None):
+        """Class constructor
+
+        Args:
+            arrays (dict, optional): Arrays of a table, as returned by
+                `to_arrays`. The table is built if they are not given.
+        """
+        if arrays is None:
+            arrays = self._build()
+        self.config_empty = arrays["config_empty"].tolist()
+        self.config_obtained = arrays["config_obtained"].tolist()
+        self.config_acts = arrays["config_acts"].tolist()
+        self.config_actions = [AGENT_ACTIONS_BY_CODE[code]
+                               for code in self.config_acts]
+        self.next_configs = arrays["next_configs"].tolist()
+        self.branches = arrays["branches"].tolist()
+        self.num_configs = len(self.config_acts)
+        self._config_index = {
+            key: config for config, key in enumerate(zip(
+                self.config_empty, self.config_obtained, self.config_acts))}
+
+    @classmethod
+    def get_default(cls):
+        """Returns the table for the current number of slots, loading it from
+        the on-disk cache or building it on first use.
+
+        Returns:
+            TransitionTable: The table.
+        """
+        if cls._default_table is None:
+            filepath = cls.get_filepath()
+            arrays = load_arrays(filepath) if filepath is not None else None
+            if arrays is None:
+                cls._default_table = cls()
+                if filepath is not None:
+                    save_arrays(filepath, **cls._default_table.to_arrays())
+            else:
+                cls._default_table = cls(arrays)
+        return cls._default_table
+
+    @staticmethod
+    def get_filepath():
+        """Returns the path of the cached table for the current number of
+        slots, or None if tables are not cached on disk.
+
+        Returns:
+            str or None: Path of the `.npz` file.
+        """
+        if TRANSITION_TABLE_DIR is None:
+            return None
+        return os.path.join(TRANSITION_TABLE_DIR, "agent-v{}-{}.npz".format(
+            TABLE_VERSION, NUM_SLOTS))
+
+    def get_config(self, empty_mask, obtained_mask, act_code):
+        """Returns the configuration with the given slot statuses and most
+        recent action.
+
+        Args:
+            empty_mask (int): Bitmask of the "EMPTY" slots.
+            obtained_mask (int): Bitmask of the "OBTAINED" slots.
+            act_code (int): Code of the agent's most recent action.
+
+        Returns:
+            int: The configuration.
+
+        Raises:
+            KeyError: Configuration that the agent cannot reach.
+        """
+        return self._config_index[(empty_mask, obtained_mask, act_code)]
+
+    def to_arrays(self):
+        """Returns the table as arrays, e.g., to be saved.
+
+        Returns:
+            dict: Arrays indexed by their names.
+        """
+        return {"config_empty": np.array(self.config_empty),
+                "config_obtained": np.array(self.config_obtained),
+                "config_acts": np.array(self.config_acts),
+                "next_configs": np.array(self.next_configs, dtype=np.int32),
+                "branches": np.array(self.branches, dtype=bool)}
+
+    @staticmethod
+    def _build():
+        """Enumerates the configurations reachable from a greeting in any
+        slot statuses, along with their transitions.
+
+        Returns:
+            dict: Arrays of the table.
+        """
+        configs = []
+        config_index = {}
+
+        def get_config(state, act_code):
+            key = (state.empty_mask, state.obtained_mask, act_code)
+            if key not in config_index:
+                config_index[key] = len(configs)
+                configs.append(key)
+            return config_index[key]
+
+        # Every slot status is either "EMPTY", "OBTAINED" or "CONFIRMED".
+        agent = ScriptedAgent()
+        for empty_mask in xrange(ALL_SLOTS_MASK + 1):
+            obtained_mask = 0
+            while True:
+                agent.state.empty_mask = empty_mask
+                agent.state.obtained_mask = obtained_mask
+                get_config(agent.state, AgentActions.greet.value.code)
+                if obtained_mask == ALL_SLOTS_MASK & ~empty_mask:
+                    break
+                obtained_mask = ((obtained_mask | empty_mask) + 1) & ~empty_mask
+
+        next_configs = []
+        branches = []
+        config = 0
+        while config < len(configs):
+            empty_mask, obtained_mask, act_code = configs[config]
+            config_next = []
+            config_branches = []
+            for user_code in xrange(NUM_USER_ACTIONS):
+                successors = []
+                for explicit in (False, True):
+                    agent.state.empty_mask = empty_mask
+                    agent.state.obtained_mask = obtained_mask
+                    agent.prev_agent_act = AGENT_ACTIONS_BY_CODE[act_code]
+                    agent.explicit = explicit
+                    agent.branched = False
+                    try:
+                        next_act = agent.update_state_and_next_action(
+                            USER_ACTIONS_BY_CODE[user_code])
+                    except ValueError:
+                        successors.append(-1)
+                    else:
+                        successors.append(get_config(agent.state,
+                                                     next_act.code))
+                config_next.append(successors)
+                config_branches.append(agent.branched)
+            next_configs.append(config_next)
+            branches.append(config_branches)
+            config += 1
+
+        return {"config_empty": np.array([key[0] for key in configs]),
+                "config_obtained": np.array([key[1] for key in configs]),
+                "config_acts": np.array([key[2] for key in configs]),
+                "next_configs": np.array(next_configs, dtype=np.int32),
+                "branches": np.array(branches, dtype=bool)}
+
+
+class CompiledAgent(Agent):
+    """Handcrafted agent driven by its `TransitionTable` rather than by the
+    rules of `Agent`, which it follows exactly: given the same source of
+    randomness, both take the same actions.
+
+    The number of configurations grows exponentially with the number of
+    slots, so the table is meant for a modest number of slots.
+
+    Attributes:
+        config (int): Current configuration in the table, or None before the
+            dialog starts.
+        table (TransitionTable): Transition table of the agent.
+    """
+
+    def __init__(self, random_state=None, table=None):
+        """Class constructor
+
+        Args:
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness. Defaults to the global state of `numpy.random`.
+            table (TransitionTable, optional): Transition table. Defaults to
+                the one for the current number of slots.
+        """
+        super(CompiledAgent, self).__init__(random_state)
+        self.table = table if table is not None else \
+            TransitionTable.get_default()
+        self.config = None
+
+    def start_dialog(self):
+        """Kicks off the dialog session by having the agent take the first
+        action.
+
+        Returns:
+            AgentAction: The first action taken by the agent.
+        """
+        self.config = self.table.get_config(self.state.empty_mask,
+                                            self.state.obtained_mask,
+                                            AgentActions.greet.value.code)
+        return super(CompiledAgent, self).start_dialog()
+
+    def update_state_and_next_action(self, user_act):
+        """Updates the agent's state and returns the next action for the agent,
+        given the current configuration and the current user-action.
+
+        Args:
+            user_act (UserAction): Current user-action.
+
+        Returns:
+            AgentAction: Next action to be taken by the agent.
+
+        Raises:
+            ValueError: Invalid user action.
+        """
+        table = self.table
+        code = user_act.code
+        explicit = (table.branches[self.config][code] and
+                    self._choose_explicit_confirmation())
+        config = table.next_configs[self.config][code][explicit]
+        if config < 0:
+            raise ValueError("Invalid previous agent act {} when user-act "
+                             "is {}".format(self.prev_agent_act.type.value,
+                                            user_act.type.value))
+        self.config = config
+        self.state.empty_mask = table.config_empty[config]
+        self.state.obtained_mask = table.config_obtained[config]
+        return table.config_actions[config]
+
+    def reset(self):
+        """Resets the Agent."""
+        super(CompiledAgent, self).reset()
+        self.config = None
@@ -0,0 +1,209 @@
+"""Benchmark cases for the hot paths of the simulation, the solvers and IRL.
+
+Each case takes the number of sessions and a scratch directory, prepares its
+inputs and returns an operation. Every call of the operation runs the workload once
+and returns a `Sample`. The parameters in `utils.params` must be set before
+this module is imported, since the code under test reads them on import.
+"""
+
+import os
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy as np
+
+from agent.agent import Agent
+from agent.compiled_agent import CompiledAgent
+from harness import Sample
+from imitation_learning.checkpoint_log import CheckpointLog
+from imitation_learning.dialog_session import DialogSession
+from imitation_learning.fe_cache import FeatureExpectationCache
+from imitation_learning.irl import IRL
+from mdp.solver import BatchSarsaSolver, SarsaSolver
+from simulation.mixed_user_simulation import QpMixedUserSimulation
+from simulation.simulation_store import SimulationStore
+from simulation.user_simulation import UserSimulation
+from user.compiled_user import CompiledUser
+from user.user import User
+from utils.params import FeatureExpectationMode, UserPolicyType
+from utils.metrics import get_simulated_counts
+from utils.params import NUM_SESSIONS_FE
+
+# Number of simulations mixed by `QpMixedUserSimulation`.
+NUM_MIXED_SIMULATIONS = 20
+
+
+def agent_take_turn(num_sessions, directory):
+    """Times the calls of `Agent.take_turn` in dialog sessions."""
+    return _time_method_in_sessions(num_sessions, timed_agent=True)
+
+
+def user_take_turn(num_sessions, directory):
+    """Times the calls of `User.take_turn` in dialog sessions."""
+    return _time_method_in_sessions(num_sessions, timed_agent=False)
+
+
+def dialog_session(num_sessions, directory):
+    """Times `DialogSession.start`."""
+    return _time_sessions(num_sessions, User, Agent)
+
+
+def compiled_dialog_session(num_sessions, directory):
+    """Times `DialogSession.start` with the compiled agent and user."""
+    return _time_sessions(num_sessions, CompiledUser, CompiledAgent)
+
+
+def _time_sessions(num_sessions, user_class, agent_class):
+    """Returns an operation that times `DialogSession.start` between a user
+    and an agent of the given classes.
+    """
+    user = user_class(policy_type=UserPolicyType.handcrafted)
+    agent = agent_class()
+
+    def operation():
+        latencies = []
+        turns = 0
+        for _ in xrange(num_sessions):
+            user.reset(reset_policy=False)
+            agent.reset()
+            session = DialogSession(user, agent)
+            start = default_timer()
+            session.start()
+            latencies.append(default_timer() - start)
+            turns += session.num_turns
+        return Sample(num_sessions, turns, latencies)
+    return operation
+
+
+def calc_feature_expectation(num_sessions, directory):
+    """Times `IRL.calc_feature_expectation` in the default mode."""
+    user = User(policy_type=UserPolicyType.handcrafted)
+    agent = Agent()
+
+    def operation():
+        IRL.calc_feature_expectation(user, agent, num_sessions,
+                                     use_cache=False)
+        return Sample(num_sessions)
+    return operation
+
+
+def sarsa_solve(num_sessions, directory):
+    """Times `SarsaSolver.solve`, whose episodes are dialog sessions."""
+    weights = _get_initial_weights()
+
+    def operation():
+        solver = SarsaSolver(User(), Agent(), weights)
+        solver.solve()
+        return Sample(solver.num_episodes_used)
+    return operation
+
+
+def batch_sarsa_solve(num_sessions, directory):
+    """Times `BatchSarsaSolver.solve`, whose episodes run in lockstep."""
+    weights = _get_initial_weights()
+
+    def operation():
+        solver = BatchSarsaSolver(User(), Agent(), weights)
+        solver.solve()
+        return Sample(solver.num_episodes_used)
+    return operation
+
+
+def irl_iteration(num_sessions, directory):
+    """Times the first iteration of `IRL.run_irl`."""
+
+    def operation():
+        irl = IRL()
+        filepath = os.path.join(directory, "checkpoint")
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        irl.checkpoint_log = CheckpointLog(filepath)
+        start_sessions = get_simulated_counts()[0]
+        try:
+            irl._run_first_iteration()
+        finally:
+            irl.checkpoint_log.close()
+        # The feature expectations and the solver run as many sessions as
+        # they need.
+        return Sample(get_simulated_counts()[0] - start_sessions)
+    return operation
+
+
+def solve_qp(num_sessions, directory):
+    """Times `QpMixedUserSimulation.solve_qp` in the default mode."""
+    store_path = os.path.join(directory, "simulations")
+    simulations = [
+        UserSimulation(User(policy_type=UserPolicyType.random).policy,
+                       weights=np.zeros(1), distance_to_expert=0.)
+        for _ in xrange(NUM_MIXED_SIMULATIONS)]
+    SimulationStore.from_user_simulations(simulations).save(store_path)
+    real_user = User(policy_type=UserPolicyType.handcrafted)
+
+    def operation():
+        simulation = QpMixedUserSimulation(store_path, real_user)
+        simulation.solve_qp()
+        return Sample((NUM_MIXED_SIMULATIONS + 1) * NUM_SESSIONS_FE)
+    return operation
+
+
+def _time_method_in_sessions(num_sessions, timed_agent):
+    """Returns an operation that runs dialog sessions and times each call of
+    the `take_turn` method of either the agent or the user.
+    """
+    user = User(policy_type=UserPolicyType.handcrafted)
+    agent = Agent()
+    latencies = []
+    timed = agent if timed_agent else user
+    method = timed.take_turn
+
+    def take_turn(*args):
+        start = default_timer()
+        action = method(*args)
+        latencies.append(default_timer() - start)
+        return action
+    timed.take_turn = take_turn
+
+    def operation():
+        del latencies[:]
+        turns = 0
+        for _ in xrange(num_sessions):
+            user.reset(reset_policy=False)
+            agent.reset()
+            session = DialogSession(user, agent)
+            session.start()
+            turns += session.num_turns
+        return Sample(num_sessions, turns, list(latencies))
+    return operation
+
+
+def _get_initial_weights():
+    """Returns the weights of the reward function learnt by the first
+    iteration of IRL, computed exactly.
+    """
+    exact = FeatureExpectationMode.exact
+    expert = User(policy_type=UserPolicyType.handcrafted)
+    random_user = User(policy_type=UserPolicyType.random)
+    return (IRL.calc_feature_expectation(expert, None, mode=exact,
+                                         use_cache=False) -
+            IRL.calc_feature_expectation(random_user, None, mode=exact,
+                                         use_cache=False))
+
+
+# Benchmark cases, indexed by their names.
+CASES = OrderedDict([
+    ("agent_take_turn", agent_take_turn),
+    ("user_take_turn", user_take_turn),
+    ("dialog_session", dialog_session),
+    ("compiled_dialog_session", compiled_dialog_session),
+    ("calc_feature_expectation", calc_feature_expectation),
+    ("sarsa_solve", sarsa_solve),
+    ("batch_sarsa_solve", batch_sarsa_solve),
+    ("irl_iteration", irl_iteration),
+    ("solve_qp", solve_qp),
+])
+
+
+def disable_caches():
+    """Makes feature expectations be recomputed on every call."""
+    FeatureExpectationCache._default_cache = FeatureExpectationCache(
+        directory=None, size=0)
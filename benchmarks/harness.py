@@ -0,0 +1,133 @@
+"""Harness for timing benchmark cases and comparing them with a baseline."""
+
+import os
+import resource
+import sys
+from contextlib import contextmanager
+from timeit import default_timer
+
+import numpy as np
+
+# Percentiles of the latency that are reported.
+PERCENTILES = (50, 90, 99)
+
+
+class Sample(object):
+    """Work done by one call of a benchmark operation.
+
+    Attributes:
+        latencies (list of float or None): Durations, in seconds, of the
+            timed units of work, e.g., calls of a method. None if the whole
+            call is the unit.
+        sessions (int): Number of dialog sessions simulated.
+        turns (int or None): Number of user turns simulated, if known.
+    """
+
+    def __init__(self, sessions, turns=None, latencies=None):
+        self.sessions = sessions
+        self.turns = turns
+        self.latencies = latencies
+
+
+@contextmanager
+def silence():
+    """Discards whatever is printed to the standard output."""
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def run_case(operation, repeat, warmup):
+    """Times an operation.
+
+    Args:
+        operation (callable): Operation returning a `Sample`.
+        repeat (int): Number of timed calls.
+        warmup (int): Number of untimed calls made first.
+
+    Returns:
+        dict: Wall time, throughput in sessions/s and turns/s, latency
+            percentiles in milliseconds, and the peak resident set size in
+            kilobytes.
+    """
+    with silence():
+        for _ in xrange(warmup):
+            operation()
+
+        seconds = 0.
+        sessions = 0
+        turns = 0
+        latencies = []
+        for _ in xrange(repeat):
+            start = default_timer()
+            sample = operation()
+            elapsed = default_timer() - start
+            seconds += elapsed
+            sessions += sample.sessions
+            if turns is not None and sample.turns is not None:
+                turns += sample.turns
+            else:
+                turns = None
+            latencies.extend(sample.latencies if sample.latencies is not None
+                             else [elapsed])
+
+    latencies = 1000. * np.array(latencies)
+    result = {
+        "seconds": seconds,
+        "sessions_per_s": sessions / seconds,
+        "turns_per_s": turns / seconds if turns is not None else None,
+        "latency_ms": {"p{}".format(q): float(np.percentile(latencies, q))
+                       for q in PERCENTILES},
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    result["latency_ms"]["max"] = float(np.max(latencies))
+    return result
+
+
+def get_key(result):
+    """Returns what identifies the configuration of a benchmark result."""
+    return result["case"], result["num_slots"], result["num_sessions"]
+
+
+def compare(results, baseline, threshold, memory_threshold):
+    """Compares benchmark results with a baseline.
+
+    Args:
+        results (list of dict): Benchmark results.
+        baseline (list of dict): Baseline results. Configurations missing
+            from it are not compared.
+        threshold (float): Largest tolerated relative drop in throughput or
+            rise in median latency.
+        memory_threshold (float): Largest tolerated relative rise in peak
+            memory.
+
+    Returns:
+        list of str: Description of each regression.
+    """
+    baseline = {get_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        key = get_key(result)
+        if key not in baseline:
+            continue
+        reference = baseline[key]
+        # Each check has a sign telling whether higher values are better.
+        checks = [
+            ("sessions/s", reference["sessions_per_s"],
+             result["sessions_per_s"], -1, threshold),
+            ("p50 latency", reference["latency_ms"]["p50"],
+             result["latency_ms"]["p50"], 1, threshold),
+            ("peak memory", reference["peak_rss_kb"], result["peak_rss_kb"],
+             1, memory_threshold),
+        ]
+        for name, old, new, sign, tolerance in checks:
+            change = (new - old) / float(old) if old else 0.
+            if sign * change > tolerance:
+                regressions.append(
+                    "{} (NUM_SLOTS={}, {} sessions): {} changed by {:+.1%}"
+                    .format(key[0], key[1], key[2], name, change))
+    return regressions
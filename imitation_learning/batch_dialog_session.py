@@ -0,0 +1,432 @@
+"""Batch of dialog sessions executed in lockstep."""
+
+import numpy as np
+
+import dialog_log
+from utils.params import AGENT_ACTION_CODES, USER_ACTION_CODES
+from utils.params import AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY
+from utils.params import AgentActionType, UserActionType
+from utils.params import MAX_DIALOG_STEPS, NUM_SLOTS
+from utils.metrics import count_simulated
+
+# Integer codes of agent action types.
+GREET = AGENT_ACTION_CODES[AgentActionType.GREET]
+ASK_SLOT = AGENT_ACTION_CODES[AgentActionType.ASK_SLOT]
+EXPLICIT_CONFIRM = AGENT_ACTION_CODES[AgentActionType.EXPLICIT_CONFIRM]
+CONFIRM_ASK = AGENT_ACTION_CODES[AgentActionType.CONFIRM_ASK]
+CLOSE = AGENT_ACTION_CODES[AgentActionType.CLOSE]
+BAD_CLOSE = AGENT_ACTION_CODES[AgentActionType.BAD_CLOSE]
+
+# Integer codes of user action types.
+SILENT = USER_ACTION_CODES[UserActionType.SILENT]
+ONE_SLOT = USER_ACTION_CODES[UserActionType.ONE_SLOT]
+ALL_SLOTS = USER_ACTION_CODES[UserActionType.ALL_SLOTS]
+CONFIRM = USER_ACTION_CODES[UserActionType.CONFIRM]
+NEGATE = USER_ACTION_CODES[UserActionType.NEGATE]
+USER_CLOSE = USER_ACTION_CODES[UserActionType.CLOSE]
+
+# Integer codes of slot statuses.
+AGENT_EMPTY, AGENT_OBTAINED, AGENT_CONFIRMED = 0, 1, 2
+USER_EMPTY, USER_PROVIDED, USER_CONFIRMED = 0, 1, 2
+
+# Marker for a missing slot identifier, i.e., `None` in `AgentAction`.
+NO_SLOT = -1
+
+
+class BatchDialogSession(object):
+    """Class for a batch of dialog sessions between the handcrafted agent and
+    users following the same policy, or the policies of the components of a
+    mixture of users. The sessions advance in lockstep, and the states of the
+    agent and the users are kept in arrays, one row per session.
+
+    It reproduces the behavior of `DialogSession` with `Agent` and `User`.
+    Action types are encoded using `AGENT_ACTION_CODES` and
+    `USER_ACTION_CODES`, and missing slot identifiers are encoded as `NO_SLOT`.
+
+    Attributes:
+        active (1D numpy.ndarray): True for sessions that have not ended.
+        agent_act (1D numpy.ndarray): Code of the agent's most recent action.
+        agent_ask_id (1D numpy.ndarray): Slot requested by the agent's most
+            recent action.
+        agent_confirm_id (1D numpy.ndarray): Slot being confirmed by the
+            agent's most recent action.
+        agent_slots (2D numpy.ndarray): Agent's slot statuses.
+        components (1D numpy.ndarray): Index of the policy followed by the
+            user of each session.
+        cumulative_policies (3D numpy.ndarray): Cumulative sums of the users'
+            action probabilities; entry [i, s] is for the i-th policy and the
+            state with code s.
+        num_sessions (int): Number of sessions in the batch.
+        num_steps (1D numpy.ndarray): Number of steps executed by each session.
+        random (numpy.random.RandomState or module): Source of randomness.
+        state_log (2D numpy.ndarray): Codes of the user's states, i.e., the
+            agent's actions, one row per session. Unused entries are -1.
+        action_log (2D numpy.ndarray): Codes of the user's actions, one row per
+            session. Unused entries are -1.
+        user_slots (2D numpy.ndarray): User's slot statuses.
+    """
+
+    def __init__(self, policy, num_sessions, random_state=None,
+                 components=None):
+        """Class constructor
+
+        Args:
+            policy (UserPolicy or list of UserPolicy): Policy followed by the
+                users, or the policies of the components of a mixture.
+            num_sessions (int): Number of sessions in the batch.
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness. Defaults to the global `numpy.random` state.
+            components (1D numpy.ndarray, optional): Index of the policy
+                followed by the user of each session; required along with a
+                list of policies. Sessions following the same policy are best
+                kept next to each other.
+        """
+        self.num_sessions = num_sessions
+        self.random = np.random if random_state is None else random_state
+        policies = policy if isinstance(policy, list) else [policy]
+        self.set_policy_matrices([policy.get_policy_matrix()
+                                  for policy in policies])
+        if components is None:
+            assert len(policies) == 1, "The sessions' policies are missing"
+            components = np.zeros(num_sessions, dtype=np.intp)
+        self.components = np.asarray(components)
+
+        n = num_sessions
+        self.agent_slots = np.zeros((n, NUM_SLOTS), dtype=np.int8)
+        self.user_slots = np.zeros((n, NUM_SLOTS), dtype=np.int8)
+        self.agent_act = np.zeros(n, dtype=np.int8)
+        self.agent_ask_id = np.zeros(n, dtype=np.int8)
+        self.agent_confirm_id = np.zeros(n, dtype=np.int8)
+        self.num_steps = np.zeros(n, dtype=np.int32)
+        self.active = np.zeros(n, dtype=bool)
+        self.state_log, self.action_log = dialog_log.create_log(n)
+
+        self.reset()
+
+    def start(self):
+        """Executes all dialog sessions until every one of them has ended.
+        """
+        while self.active.any():
+            self.step()
+
+    def reset(self, sessions=None):
+        """Resets sessions so that the agent is about to greet the user.
+
+        Args:
+            sessions (numpy.ndarray, optional): Indices or boolean mask of the
+                sessions to reset. All sessions are reset by default.
+        """
+        if sessions is None:
+            sessions = slice(None)
+        self.agent_slots[sessions] = AGENT_EMPTY
+        self.user_slots[sessions] = USER_EMPTY
+        self.agent_act[sessions] = GREET
+        self.agent_ask_id[sessions] = NO_SLOT
+        self.agent_confirm_id[sessions] = NO_SLOT
+        self.num_steps[sessions] = 0
+        self.active[sessions] = True
+        self.state_log[sessions] = -1
+        self.action_log[sessions] = -1
+
+    def set_policy_matrices(self, matrices):
+        """Changes the policies followed by the users, e.g., between steps.
+
+        Args:
+            matrices (list of 2D numpy.ndarray or 3D numpy.ndarray): Action
+                probabilities of each policy, as returned by
+                `UserPolicy.get_policy_matrix`.
+        """
+        self.cumulative_policies = np.cumsum(matrices, axis=2)
+        # Guard against probabilities that don't quite sum to one.
+        self.cumulative_policies[:, :, -1] = np.inf
+
+    def step(self):
+        """Executes one user turn, followed by the agent's response, in every
+        active session.
+
+        Random numbers are drawn for all sessions, active or not, so that the
+        stream of random numbers consumed by a session doesn't depend on the
+        user policy.
+
+        Returns:
+            (1D numpy.ndarray, 1D numpy.ndarray, 1D numpy.ndarray,
+                1D numpy.ndarray): Indices of the sessions that were active,
+                the codes of their states, the codes of the actions taken by
+                the users, and the codes of their next states. The next state
+                is -1 for sessions that ended in this step.
+        """
+        draws = self.random.random_sample((3, self.num_sessions))
+        lanes = np.flatnonzero(self.active)
+
+        # The agent terminates overly long sessions.
+        too_long = lanes[self.num_steps[lanes] >= MAX_DIALOG_STEPS]
+        self.agent_act[too_long] = BAD_CLOSE
+        self.agent_ask_id[too_long] = NO_SLOT
+        self.agent_confirm_id[too_long] = NO_SLOT
+
+        states = self.agent_act[lanes]
+        actions, slot_ids = self._take_user_turn(lanes, draws[0], draws[1])
+        self.state_log[lanes, self.num_steps[lanes]] = states
+        self.action_log[lanes, self.num_steps[lanes]] = actions
+
+        # A session ends once the user has responded to a (bad) close.
+        ending = (states == CLOSE) | (states == BAD_CLOSE)
+        self.active[lanes[ending]] = False
+        count_simulated(np.count_nonzero(ending), lanes.size)
+
+        continuing = ~ending
+        self._take_agent_turn(lanes[continuing], actions[continuing],
+                              slot_ids[continuing], draws[2])
+        self.num_steps[lanes[continuing]] += 1
+
+        next_states = np.full(lanes.size, -1, dtype=np.int8)
+        next_states[continuing] = self.agent_act[lanes[continuing]]
+        return lanes, states, actions, next_states
+
+    def get_discounted_counts(self):
+        """Returns the discounted number of times each state-action pair was
+        visited, summed over all sessions.
+
+        Returns:
+            2D numpy.ndarray: Array whose entry [s, a] corresponds to the state
+                with code s and the action with code a.
+        """
+        return dialog_log.get_discounted_counts(self.state_log,
+                                                self.action_log)
+
+    def get_session_feature_counts(self, features):
+        """Returns the discounted sum of feature vectors of each session.
+
+        Args:
+            features (UserFeatures): Feature function for dialog users.
+
+        Returns:
+            2D numpy.ndarray: One row per session.
+        """
+        return dialog_log.get_session_feature_counts(
+            self.state_log, self.action_log, features)
+
+    def get_feature_expectation(self, features):
+        """Returns the feature expectation of the user policy estimated from
+        the executed sessions.
+
+        Args:
+            features (UserFeatures): Feature function for dialog users.
+
+        Returns:
+            numpy.array: Feature expectation of the user's policy.
+        """
+        return dialog_log.get_feature_expectation(
+            self.state_log, self.action_log, features)
+
+    def _take_user_turn(self, lanes, action_draws, slot_draws):
+        """Samples the users' actions and updates the users' states.
+
+        Args:
+            lanes (1D numpy.ndarray): Indices of the sessions to act in.
+            action_draws (1D numpy.ndarray): Uniform draws, one per session,
+                used to sample the type of the user's action.
+            slot_draws (1D numpy.ndarray): Uniform draws, one per session,
+                used to pick a random slot.
+
+        Returns:
+            (1D numpy.ndarray, 1D numpy.ndarray): Codes of the users' actions,
+                and the slots referred to by them.
+        """
+        states = self.agent_act[lanes]
+        cumulative = self.cumulative_policies[self.components[lanes], states]
+        actions = (cumulative <= action_draws[lanes, None]).sum(axis=1)
+        actions = actions.astype(np.int8)
+
+        # Respond about the slot the agent referred to, if any. Otherwise,
+        # pick a random slot.
+        random_slot_ids = (slot_draws[lanes] * NUM_SLOTS).astype(np.int8)
+        ask_ids = self.agent_ask_id[lanes]
+        confirm_ids = self.agent_confirm_id[lanes]
+        slot_ids = np.full(lanes.size, NO_SLOT, dtype=np.int8)
+        one_slot = actions == ONE_SLOT
+        slot_ids[one_slot] = np.where(ask_ids[one_slot] != NO_SLOT,
+                                      ask_ids[one_slot],
+                                      random_slot_ids[one_slot])
+        confirm_or_negate = (actions == CONFIRM) | (actions == NEGATE)
+        slot_ids[confirm_or_negate] = np.where(
+            confirm_ids[confirm_or_negate] != NO_SLOT,
+            confirm_ids[confirm_or_negate],
+            random_slot_ids[confirm_or_negate])
+
+        self.user_slots[lanes[actions == ALL_SLOTS]] = USER_PROVIDED
+        self.user_slots[lanes[one_slot], slot_ids[one_slot]] = USER_PROVIDED
+        implicit = one_slot & (states == CONFIRM_ASK)
+        self.user_slots[lanes[implicit], confirm_ids[implicit]] = \
+            USER_CONFIRMED
+        confirm = actions == CONFIRM
+        self.user_slots[lanes[confirm], slot_ids[confirm]] = USER_CONFIRMED
+        negate = actions == NEGATE
+        self.user_slots[lanes[negate], slot_ids[negate]] = USER_EMPTY
+
+        return actions, slot_ids
+
+    def _take_agent_turn(self, lanes, user_acts, slot_ids, confirm_draws):
+        """Updates the agents' states and picks their next actions following
+        the handcrafted policy of `Agent`.
+
+        Args:
+            lanes (1D numpy.ndarray): Indices of the sessions to act in.
+            user_acts (1D numpy.ndarray): Codes of the users' actions.
+            slot_ids (1D numpy.ndarray): Slots referred to by the users'
+                actions.
+            confirm_draws (1D numpy.ndarray): Uniform draws, one per session,
+                deciding between explicit and implicit confirmation.
+        """
+        prev = self.agent_act[lanes]
+        prev_ask_ids = self.agent_ask_id[lanes]
+        prev_confirm_ids = self.agent_confirm_id[lanes]
+        slots = self.agent_slots[lanes]
+        rows = np.arange(lanes.size)
+
+        greet = prev == GREET
+        ask = prev == ASK_SLOT
+        confirming = (prev == EXPLICIT_CONFIRM) | (prev == CONFIRM_ASK)
+        implicit = prev == CONFIRM_ASK
+        close = prev == CLOSE
+
+        # Update the slot statuses. Slots marked "OBTAINED" on request of a
+        # greeting or a slot request retain a "CONFIRMED" status.
+        one_slot = user_acts == ONE_SLOT
+        obtained = np.where(greet, slot_ids, prev_ask_ids)
+        marking = one_slot & (greet | ask)
+        marking &= slots[rows, obtained] != AGENT_CONFIRMED
+        slots[rows[marking], obtained[marking]] = AGENT_OBTAINED
+        marking = one_slot & implicit
+        slots[rows[marking], prev_confirm_ids[marking]] = AGENT_CONFIRMED
+        slots[rows[marking], prev_ask_ids[marking]] = AGENT_OBTAINED
+
+        all_slots = (user_acts == ALL_SLOTS) & (greet | ask)
+        slots[all_slots] = np.where(slots[all_slots] == AGENT_EMPTY,
+                                    AGENT_OBTAINED, slots[all_slots])
+
+        matching = confirming & (prev_confirm_ids == slot_ids)
+        confirm = (user_acts == CONFIRM) & matching
+        slots[rows[confirm], slot_ids[confirm]] = AGENT_CONFIRMED
+        negate = (user_acts == NEGATE) & matching
+        slots[rows[negate], slot_ids[negate]] = AGENT_EMPTY
+
+        self.agent_slots[lanes] = slots
+
+        # Pick the next actions. By default, the agent repeats itself.
+        next_act = prev.copy()
+        next_ask_ids = prev_ask_ids.copy()
+        next_confirm_ids = prev_confirm_ids.copy()
+
+        empty_ids = _first_slot_with_status(slots, AGENT_EMPTY)
+        unconfirmed_ids = _first_slot_with_status(slots, AGENT_OBTAINED)
+        ask_confirm_or_close = _ask_confirm_or_close(empty_ids,
+                                                     unconfirmed_ids)
+        explicit = confirm_draws[lanes] < \
+            AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY
+        confirmation = _confirm(empty_ids, unconfirmed_ids, explicit)
+
+        choose_confirmation = one_slot & (greet | ask | implicit)
+        choose_ask_confirm_or_close = (
+            ((user_acts == SILENT) & greet) |
+            all_slots | confirm | negate |
+            ((user_acts == USER_CLOSE) & (ask_confirm_or_close[0] == CLOSE)))
+        choose_close = close
+
+        for mask, (act, ask_id, confirm_id) in (
+                (choose_confirmation, confirmation),
+                (choose_ask_confirm_or_close, ask_confirm_or_close)):
+            next_act[mask] = act[mask]
+            next_ask_ids[mask] = ask_id[mask]
+            next_confirm_ids[mask] = confirm_id[mask]
+        next_act[choose_close] = CLOSE
+        next_ask_ids[choose_close] = NO_SLOT
+        next_confirm_ids[choose_close] = NO_SLOT
+
+        self.agent_act[lanes] = next_act
+        self.agent_ask_id[lanes] = next_ask_ids
+        self.agent_confirm_id[lanes] = next_confirm_ids
+
+
+def _first_slot_with_status(slots, status):
+    """Returns, for each row, the lowest slot identifier with the given status.
+
+    Args:
+        slots (2D numpy.ndarray): Slot statuses, one row per session.
+        status (int): Code of the slot status.
+
+    Returns:
+        1D numpy.ndarray: Slot identifiers; `NO_SLOT` where there is no slot
+            with the given status.
+    """
+    matches = slots == status
+    slot_ids = matches.argmax(axis=1).astype(np.int8)
+    slot_ids[~matches.any(axis=1)] = NO_SLOT
+    return slot_ids
+
+
+def _ask_or_close(empty_ids):
+    """Vectorized version of `Agent._ask_or_close`.
+
+    Returns:
+        (1D numpy.ndarray, 1D numpy.ndarray, 1D numpy.ndarray): Codes of the
+            actions, and the slots requested and confirmed by them.
+    """
+    has_empty = empty_ids != NO_SLOT
+    act = np.where(has_empty, ASK_SLOT, CLOSE).astype(np.int8)
+    return act, empty_ids.copy(), np.full_like(empty_ids, NO_SLOT)
+
+
+def _ask_confirm_or_close(empty_ids, unconfirmed_ids):
+    """Vectorized version of `Agent._ask_confirm_or_close`.
+
+    Returns:
+        (1D numpy.ndarray, 1D numpy.ndarray, 1D numpy.ndarray): Codes of the
+            actions, and the slots requested and confirmed by them.
+    """
+    act, ask_ids, confirm_ids = _ask_or_close(empty_ids)
+    explicit = (empty_ids == NO_SLOT) & (unconfirmed_ids != NO_SLOT)
+    act[explicit] = EXPLICIT_CONFIRM
+    confirm_ids[explicit] = unconfirmed_ids[explicit]
+    return act, ask_ids, confirm_ids
+
+
+def _explicit_confirm(empty_ids, unconfirmed_ids):
+    """Vectorized version of `Agent._explicit_confirm`.
+
+    Returns:
+        (1D numpy.ndarray, 1D numpy.ndarray, 1D numpy.ndarray): Codes of the
+            actions, and the slots requested and confirmed by them.
+    """
+    act, ask_ids, confirm_ids = _ask_or_close(empty_ids)
+    has_unconfirmed = unconfirmed_ids != NO_SLOT
+    act[has_unconfirmed] = EXPLICIT_CONFIRM
+    ask_ids[has_unconfirmed] = NO_SLOT
+    confirm_ids[has_unconfirmed] = unconfirmed_ids[has_unconfirmed]
+    return act, ask_ids, confirm_ids
+
+
+def _confirm(empty_ids, unconfirmed_ids, explicit):
+    """Vectorized version of `Agent._confirm`.
+
+    Args:
+        empty_ids (1D numpy.ndarray): First "EMPTY" slot of each session.
+        unconfirmed_ids (1D numpy.ndarray): First "OBTAINED" slot of each
+            session.
+        explicit (1D numpy.ndarray): True for sessions where the agent goes
+            for an explicit confirmation.
+
+    Returns:
+        (1D numpy.ndarray, 1D numpy.ndarray, 1D numpy.ndarray): Codes of the
+            actions, and the slots requested and confirmed by them.
+    """
+    # Implicit confirmation needs both an EMPTY slot to request and an
+    # unconfirmed slot to confirm; otherwise it falls back to the same actions
+    # as the explicit confirmation.
+    act, ask_ids, confirm_ids = _explicit_confirm(empty_ids, unconfirmed_ids)
+    implicit = ((~explicit) & (empty_ids != NO_SLOT) &
+                (unconfirmed_ids != NO_SLOT))
+    act[implicit] = CONFIRM_ASK
+    ask_ids[implicit] = empty_ids[implicit]
+    confirm_ids[implicit] = unconfirmed_ids[implicit]
+    return act, ask_ids, confirm_ids
@@ -0,0 +1,235 @@
+"""Append-only log of the user simulations built by the IRL algorithm.
+
+A checkpoint log starts with `MAGIC`, followed by one record per iteration of
+the algorithm. Each record is a pickled `CheckpointRecord` preceded by its
+length and CRC-32 checksum, so that a record torn by a crash is detected and
+dropped along with anything after it.
+"""
+
+import os
+import pickle
+import struct
+import threading
+import zlib
+from Queue import Queue
+
+from utils.params import CHECKPOINT_SYNC_RECORDS
+
+# Header identifying checkpoint logs, as opposed to plain pickle dumps.
+MAGIC = "irl-checkpoint-log-1\n"
+
+# Length and checksum preceding each record.
+_FRAME = struct.Struct("<II")
+
+# Tells the writer thread to stop.
+_STOP = object()
+
+
+class CheckpointRecord(object):
+    """State of the IRL algorithm after one of its iterations.
+
+    Attributes:
+        expert_fe (1D numpy.ndarray): Expert user's feature expectation.
+        expert_variance (1D numpy.ndarray): Variance of each element of
+            `expert_fe`, or None if unknown.
+        iteration (int): Index of the iteration; 0 is the one that starts from
+            the random user.
+        mu_bar (1D numpy.ndarray): Projection of the expert's feature
+            expectation computed in the iteration. The weights of the reward
+            function are `expert_fe - mu_bar`.
+        mu_bar_variance (1D numpy.ndarray): Variance of each element of
+            `mu_bar`, or None if unknown.
+        seed (int): Seed of the dialog sessions run to calculate feature
+            expectations in the IRL run, or None if unknown.
+        simulated_fe (1D numpy.ndarray): Feature expectation of the user
+            simulation learnt in the iteration.
+        simulated_user (UserSimulation): User simulation learnt in the
+            iteration.
+        simulated_variance (1D numpy.ndarray): Variance of each element of
+            `simulated_fe`, or None if unknown.
+    """
+
+    # Defaults for records unpickled from logs predating the attributes.
+    expert_variance = None
+    simulated_variance = None
+    mu_bar_variance = None
+    seed = None
+
+    def __init__(self, iteration, simulated_user, expert_fe, simulated_fe,
+                 mu_bar, expert_variance=None, simulated_variance=None,
+                 mu_bar_variance=None, seed=None):
+        self.iteration = iteration
+        self.simulated_user = simulated_user
+        self.expert_fe = expert_fe
+        self.simulated_fe = simulated_fe
+        self.mu_bar = mu_bar
+        self.expert_variance = expert_variance
+        self.simulated_variance = simulated_variance
+        self.mu_bar_variance = mu_bar_variance
+        self.seed = seed
+
+
+class CheckpointLog(object):
+    """Checkpoint log open for appending.
+
+    Records are pickled and written by a background thread, so that appending
+    never blocks the caller on disk. The file is synced once the writer has
+    caught up with the appended records, or after `sync_records` records
+    otherwise.
+
+    Attributes:
+        filepath (str): Path of the log.
+        records (list of CheckpointRecord): Records that the log held when it
+            was opened.
+        sync_records (int): Maximum number of records written between two
+            syncs.
+    """
+
+    def __init__(self, filepath, sync_records=CHECKPOINT_SYNC_RECORDS):
+        """Opens a checkpoint log, creating it if it does not exist, and
+        drops any torn record at its end.
+
+        Args:
+            filepath (str): Path of the log.
+            sync_records (int, optional): Maximum number of records written
+                between two syncs.
+        """
+        self.filepath = filepath
+        self.sync_records = sync_records
+        self.records = []
+        self._error = None
+
+        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+            self.records, size = read_records(filepath)
+            self._file = open(filepath, "r+b")
+            self._file.truncate(size)
+            self._file.seek(size)
+        else:
+            self._file = open(filepath, "wb")
+            self._file.write(MAGIC)
+            self._sync()
+
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._write_records)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def append(self, record):
+        """Queues a record to be written to the log.
+
+        Args:
+            record (CheckpointRecord): The record.
+        """
+        self._raise_error()
+        self._queue.put(record)
+
+    def flush(self):
+        """Blocks until all appended records are synced to disk."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Writes the remaining records and closes the log."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._file.close()
+        self._raise_error()
+
+    def _write_records(self):
+        """Writes queued records until told to stop. Runs in the writer
+        thread.
+        """
+        num_unsynced = 0
+        while True:
+            record = self._queue.get()
+            try:
+                if record is _STOP:
+                    if num_unsynced:
+                        self._sync()
+                    return
+                if self._error is not None:
+                    continue
+
+                payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+                checksum = zlib.crc32(payload) & 0xffffffff
+                self._file.write(_FRAME.pack(len(payload), checksum))
+                self._file.write(payload)
+                num_unsynced += 1
+                if (num_unsynced >= self.sync_records or
+                        self._queue.empty()):
+                    self._sync()
+                    num_unsynced = 0
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise IOError("Writing checkpoint log {} failed: {}"
+                          .format(self.filepath, self._error))
+
+
+def is_checkpoint_log(filepath):
+    """Returns True if the file is a checkpoint log.
+
+    Args:
+        filepath (str): Path of the file.
+    """
+    with open(filepath, "rb") as fin:
+        return fin.read(len(MAGIC)) == MAGIC
+
+
+def read_records(filepath):
+    """Reads the intact records of a checkpoint log.
+
+    Args:
+        filepath (str): Path of the log.
+
+    Returns:
+        (list of CheckpointRecord, int): The records, and the size of the
+            part of the file that holds them.
+
+    Raises:
+        ValueError: If the file is not a checkpoint log.
+    """
+    records = []
+    with open(filepath, "rb") as fin:
+        if fin.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a checkpoint log".format(filepath))
+        size = fin.tell()
+        while True:
+            frame = fin.read(_FRAME.size)
+            if len(frame) < _FRAME.size:
+                break
+            length, checksum = _FRAME.unpack(frame)
+            payload = fin.read(length)
+            if (len(payload) < length or
+                    zlib.crc32(payload) & 0xffffffff != checksum):
+                break
+            records.append(pickle.loads(payload))
+            size = fin.tell()
+    return records, size
+
+
+def load_user_simulations(filepath):
+    """Loads the user simulations learnt by the IRL algorithm.
+
+    Args:
+        filepath (str): Path of a checkpoint log, or of a pickled list of
+            user simulations as dumped by earlier versions.
+
+    Returns:
+        list of UserSimulation: The user simulations, in the order in which
+            they were learnt.
+    """
+    if is_checkpoint_log(filepath):
+        records, _ = read_records(filepath)
+        return [record.simulated_user for record in records]
+    with open(filepath, "r") as fin:
+        return pickle.load(fin)
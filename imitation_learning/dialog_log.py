@@ -0,0 +1,141 @@
+"""Integer-coded logs of the user's states and actions in dialog sessions.
+
+A batch of logs is a pair of 2D arrays, `state_log` and `action_log`, with one
+row per session and one column per user turn. Entries hold the codes of the
+user's states, i.e., the agent's actions (`AGENT_ACTION_CODES`), and of the
+user's actions (`USER_ACTION_CODES`). Entries past the end of a session are -1.
+"""
+
+import numpy as np
+
+from utils.params import AGENT_ACTION_CODES, USER_ACTION_CODES
+from utils.params import AgentActionType, UserActionType
+from utils.params import GAMMA, MAX_DIALOG_STEPS
+
+# Enum members indexed by their codes.
+AGENT_ACTION_TYPES = [action for action in AgentActionType]
+USER_ACTION_TYPES = [action for action in UserActionType]
+
+# Maximum number of user turns in a session.
+MAX_TURNS = MAX_DIALOG_STEPS + 1
+
+
+def get_feature_tensor(features):
+    """Returns the feature vectors of all state-action pairs.
+
+    Args:
+        features (UserFeatures): Feature function for dialog users.
+
+    Returns:
+        3D numpy.ndarray: Array whose entry [s, a] is the feature vector for
+            the state with code s and the action with code a.
+    """
+    return features.matrix.reshape(len(AgentActionType), len(UserActionType),
+                                   -1)
+
+
+def create_log(num_sessions):
+    """Returns an empty batch of logs.
+
+    Args:
+        num_sessions (int): Number of sessions in the batch.
+
+    Returns:
+        (2D numpy.ndarray, 2D numpy.ndarray): State log and action log.
+    """
+    return (np.full((num_sessions, MAX_TURNS), -1, dtype=np.int8),
+            np.full((num_sessions, MAX_TURNS), -1, dtype=np.int8))
+
+
+def get_pair_codes(state_log, action_log):
+    """Returns the codes of the state-action pairs in a batch of logs, along
+    with the session and turn of each.
+
+    Args:
+        state_log (2D numpy.ndarray): State log.
+        action_log (2D numpy.ndarray): Action log.
+
+    Returns:
+        (1D numpy.ndarray, 1D numpy.ndarray, 1D numpy.ndarray): Code of each
+            state-action pair, i.e., state code * number of actions + action
+            code; and the session and turn in which it occurred.
+    """
+    sessions, turns = np.nonzero(state_log >= 0)
+    codes = (state_log[sessions, turns].astype(np.intp) *
+             len(USER_ACTION_CODES) + action_log[sessions, turns])
+    return codes, sessions, turns
+
+
+def get_action_counts(state_log, action_log):
+    """Returns the number of times each action was taken in each state.
+
+    Args:
+        state_log (2D numpy.ndarray): State log.
+        action_log (2D numpy.ndarray): Action log.
+
+    Returns:
+        2D numpy.ndarray: Array whose entry [s, a] corresponds to the state
+            with code s and the action with code a.
+    """
+    codes, _, _ = get_pair_codes(state_log, action_log)
+    num_pairs = len(AGENT_ACTION_CODES) * len(USER_ACTION_CODES)
+    counts = np.bincount(codes, minlength=num_pairs)
+    return counts.reshape(len(AGENT_ACTION_CODES), len(USER_ACTION_CODES))
+
+
+def get_discounted_counts(state_log, action_log, gamma=GAMMA):
+    """Returns the discounted number of times each state-action pair was
+    visited, summed over all sessions.
+
+    Args:
+        state_log (2D numpy.ndarray): State log.
+        action_log (2D numpy.ndarray): Action log.
+        gamma (float, optional): Discount factor.
+
+    Returns:
+        2D numpy.ndarray: Array whose entry [s, a] corresponds to the state
+            with code s and the action with code a.
+    """
+    codes, _, turns = get_pair_codes(state_log, action_log)
+    num_pairs = len(AGENT_ACTION_CODES) * len(USER_ACTION_CODES)
+    counts = np.bincount(codes, weights=gamma ** turns, minlength=num_pairs)
+    return counts.reshape(len(AGENT_ACTION_CODES), len(USER_ACTION_CODES))
+
+
+def get_session_feature_counts(state_log, action_log, features,
+                               gamma=GAMMA):
+    """Returns the discounted sum of feature vectors of each session.
+
+    Args:
+        state_log (2D numpy.ndarray): State log.
+        action_log (2D numpy.ndarray): Action log.
+        features (UserFeatures): Feature function for dialog users.
+        gamma (float, optional): Discount factor.
+
+    Returns:
+        2D numpy.ndarray: One row per session.
+    """
+    codes, sessions, turns = get_pair_codes(state_log, action_log)
+    num_sessions = state_log.shape[0]
+    num_pairs = len(AGENT_ACTION_CODES) * len(USER_ACTION_CODES)
+    counts = np.bincount(sessions * num_pairs + codes, weights=gamma ** turns,
+                         minlength=num_sessions * num_pairs)
+    return features.get_feature_counts(counts.reshape(num_sessions,
+                                                      num_pairs))
+
+
+def get_feature_expectation(state_log, action_log, features, gamma=GAMMA):
+    """Returns the feature expectation estimated from a batch of logs.
+
+    Args:
+        state_log (2D numpy.ndarray): State log.
+        action_log (2D numpy.ndarray): Action log.
+        features (UserFeatures): Feature function for dialog users.
+        gamma (float, optional): Discount factor.
+
+    Returns:
+        numpy.array: Feature expectation.
+    """
+    counts = get_discounted_counts(state_log, action_log, gamma)
+    counts /= state_log.shape[0]
+    return features.get_feature_counts(counts.reshape(1, -1))[0]
@@ -0,0 +1,254 @@
+"""Exact model of the dialog between the handcrafted agent and a user."""
+
+import numpy as np
+
+from agent.agent_action import AgentActions
+from agent.compiled_agent import ScriptedAgent
+from user.compiled_user import ScriptedUser
+from utils.params import AGENT_ACTION_CODES, USER_ACTION_CODES
+from utils.params import AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY
+from utils.params import AgentActionType, AgentStateStatus, UserActionType
+from utils.params import GAMMA, MAX_DIALOG_STEPS, NUM_SLOTS
+
+
+class DialogModel(object):
+    """Markov chain underlying the dialog sessions between the handcrafted
+    `Agent` and a `User`.
+
+    A configuration of the chain consists of the agent's slot statuses and its
+    most recent action. The user's slot statuses are not part of it since
+    they influence neither the agent nor the user's policy. The chain is
+    enumerated once by driving `Agent` and `User` through every reachable
+    configuration, every user action, every randomly picked slot and both
+    kinds of confirmation.
+
+    Attributes:
+        agent_acts (list of AgentAction): Agent's most recent action in each
+            configuration.
+        bad_close_config (int): Configuration in which the agent terminates an
+            overly long session.
+        config_states (1D numpy.ndarray): Code of the user's state, i.e., the
+            type of the agent's most recent action, in each configuration.
+        initial_config (int): Configuration in which a session starts.
+        num_configs (int): Number of configurations.
+        transitions (3D numpy.ndarray): Transition probabilities. Entry
+            [c, a, d] is the probability of moving from configuration c to d
+            when the user takes the action with code a. Configurations in
+            which the agent closes the session have no successors.
+    """
+
+    _cached_model = None
+
+    def __init__(self):
+        self._config_index = {}
+        self.agent_acts = []
+        self._slots = []
+        self._successors = {}
+
+        empty = tuple(AgentStateStatus.EMPTY for _ in xrange(NUM_SLOTS))
+        self.initial_config = self._get_config(empty, AgentActions.greet.value)
+        self.bad_close_config = self._get_config(
+            empty, AgentActions.bad_close.value)
+        self._enumerate()
+
+        self.num_configs = len(self.agent_acts)
+        self.config_states = np.array([AGENT_ACTION_CODES[act.type]
+                                       for act in self.agent_acts])
+        self.transitions = np.zeros((self.num_configs, len(UserActionType),
+                                     self.num_configs))
+        for (config, action), successors in self._successors.iteritems():
+            for next_config, probability in successors:
+                self.transitions[config, action, next_config] += probability
+
+    @classmethod
+    def get_model(cls):
+        """Returns the dialog model, building it on first use.
+
+        Returns:
+            DialogModel: The dialog model.
+        """
+        if cls._cached_model is None:
+            cls._cached_model = cls()
+        return cls._cached_model
+
+    def get_discounted_counts(self, policy):
+        """Returns the expected discounted number of times each state-action
+        pair is visited by a user following the given policy in a session.
+
+        Args:
+            policy (UserPolicy): Policy followed by the user.
+
+        Returns:
+            2D numpy.ndarray: Array whose entry [s, a] corresponds to the state
+                with code s and the action with code a.
+        """
+        probabilities = policy.get_policy_matrix()[self.config_states]
+        chain = self.get_chain(probabilities)
+
+        occupancy = np.zeros(self.num_configs)
+        distribution = np.zeros(self.num_configs)
+        distribution[self.initial_config] = 1.
+        for t in xrange(MAX_DIALOG_STEPS + 1):
+            if t == MAX_DIALOG_STEPS:
+                # The agent terminates all sessions still running.
+                mass = np.sum(distribution)
+                distribution[:] = 0.
+                distribution[self.bad_close_config] = mass
+            occupancy += (GAMMA ** t) * distribution
+            distribution = distribution.dot(chain)
+            if not distribution.any():
+                break
+
+        counts = np.zeros((len(AgentActionType), len(UserActionType)))
+        np.add.at(counts, self.config_states,
+                  occupancy[:, None] * probabilities)
+        return counts
+
+    def get_chain(self, probabilities):
+        """Returns the configuration-to-configuration transition matrix of
+        the chain when the user follows the given action probabilities.
+
+        Args:
+            probabilities (2D numpy.ndarray): Probabilities of the user's
+                actions; row c is for configuration c.
+
+        Returns:
+            2D numpy.ndarray: Transition matrix.
+        """
+        return np.einsum('ca,cad->cd', probabilities, self.transitions)
+
+    def get_discounted_visits(self, chain, gamma=GAMMA):
+        """Returns the discounted number of visits of each configuration in
+        a session, ignoring the `MAX_DIALOG_STEPS` cutoff.
+
+        Args:
+            chain (2D numpy.ndarray): Transition matrix from `get_chain`.
+            gamma (float, optional): Discount factor.
+
+        Returns:
+            1D numpy.ndarray: Discounted number of visits.
+        """
+        start = np.zeros(self.num_configs)
+        start[self.initial_config] = 1.
+        system = np.eye(self.num_configs) - gamma * chain
+        return np.linalg.solve(system.T, start)
+
+    def average_over_states(self, config_values, visits):
+        """Averages values of configurations over those sharing the same
+        user state, i.e., the same type of agent action.
+
+        Args:
+            config_values (numpy.ndarray): Values whose first axis runs over
+                the configurations.
+            visits (1D numpy.ndarray): Weight of each configuration, usually
+                its discounted number of visits. States whose configurations
+                have no weight weigh them equally.
+
+        Returns:
+            numpy.ndarray: Averaged values whose first axis runs over the
+                codes of the user states.
+        """
+        averages = np.zeros((len(AgentActionType),) + config_values.shape[1:])
+        for state in xrange(len(AgentActionType)):
+            configs = self.config_states == state
+            weights = visits[configs]
+            if not weights.any():
+                weights = np.ones(weights.size)
+            if weights.size:
+                averages[state] = np.tensordot(
+                    weights, config_values[configs], axes=1) / np.sum(weights)
+        return averages
+
+    def get_feature_expectation(self, policy, features):
+        """Returns the exact feature expectation of a user policy.
+
+        Args:
+            policy (UserPolicy): Policy followed by the user.
+            features (UserFeatures): Feature function for dialog users.
+
+        Returns:
+            numpy.array: Feature expectation of the user's policy.
+        """
+        counts = self.get_discounted_counts(policy)
+        return features.get_feature_counts(counts.reshape(1, -1))[0]
+
+    def _get_config(self, slots, agent_act):
+        """Returns the index of a configuration, adding it if it is new.
+
+        Args:
+            slots (tuple of AgentStateStatus): Agent's slot statuses.
+            agent_act (AgentAction): Agent's most recent action.
+
+        Returns:
+            int: Index of the configuration.
+        """
+        key = (slots, agent_act.type, agent_act.ask_id, agent_act.confirm_id)
+        if key not in self._config_index:
+            self._config_index[key] = len(self.agent_acts)
+            self.agent_acts.append(agent_act)
+            self._slots.append(slots)
+        return self._config_index[key]
+
+    def _enumerate(self):
+        """Enumerates all reachable configurations and their transitions.
+        """
+        agent = ScriptedAgent()
+        user = ScriptedUser()
+        p = AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY
+
+        config = 0
+        while config < len(self.agent_acts):
+            agent_act = self.agent_acts[config]
+            if agent_act.type in (AgentActionType.CLOSE,
+                                  AgentActionType.BAD_CLOSE):
+                config += 1
+                continue
+
+            for action_type in UserActionType:
+                successors = []
+                for user_act, user_probability in self._get_user_actions(
+                        user, agent_act, action_type):
+                    for explicit in (True, False):
+                        agent.reset()
+                        agent.state.slots = self._slots[config]
+                        agent.prev_agent_act = agent_act
+                        agent.explicit = explicit
+                        agent.branched = False
+
+                        next_act = agent.update_state_and_next_action(
+                            user_act)
+                        next_config = self._get_config(agent.state.slots,
+                                                       next_act)
+
+                        if not agent.branched:
+                            successors.append((next_config, user_probability))
+                            break
+                        probability = p if explicit else 1. - p
+                        successors.append((next_config,
+                                           user_probability * probability))
+                action = USER_ACTION_CODES[action_type]
+                self._successors[(config, action)] = successors
+            config += 1
+
+    def _get_user_actions(self, user, agent_act, action_type):
+        """Returns the user actions of the given type that may be taken in
+        response to the agent's action, along with their probabilities.
+
+        Args:
+            user (ScriptedUser): User used to build the actions.
+            agent_act (AgentAction): Agent's most recent action.
+            action_type (UserActionType): Type of the user's action.
+
+        Returns:
+            list of (UserAction, float): Actions and their probabilities.
+        """
+        user.state.agent_act = agent_act
+        probabilities = {}
+        actions = {}
+        for slot_id in xrange(NUM_SLOTS):
+            user.random_slot_id = slot_id
+            user_act = user._build_action(action_type)
+            key = id(user_act)
+            actions[key] = user_act
+            probabilities[key] = probabilities.get(key, 0.) + 1. / NUM_SLOTS
+        return [(actions[key], probabilities[key]) for key in actions]
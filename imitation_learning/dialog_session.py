@@ -1,42 +1,66 @@
 """Dialog session."""
 
+import numpy as np
+
 from agent.agent import Agent
 from agent.agent_action import AgentAction, AgentActions
 from user.user import User
 from user.user_action import UserAction
-from utils.params import AgentActionType
-from utils.params import UserActionType, UserPolicyType
+from utils.params import AgentActionType, MAX_DIALOG_STEPS
+from utils.params import UserActionType, UserPolicyType, NUM_WORKERS
+from utils.params import AGENT_ACTION_CODES, USER_ACTION_CODES
+from utils.parallel import map_shards, sum_counted_shards
+from utils.metrics import count_simulated, get_simulated_counts
+from utils.metrics import take_simulated_counts
+from dialog_log import AGENT_ACTION_TYPES, USER_ACTION_TYPES, MAX_TURNS
 
 
-class DialogSession:
+class DialogSession(object):
     """Class for a single dialog session.
 
     Attributes:
+        action_codes (1D numpy.ndarray): Codes of the actions taken by the
+            user in this dialog session, i.e., values of `USER_ACTION_CODES`.
+            Entries past `num_turns` are -1.
         agent (:obj: Agent): The dialog agent.
+        num_turns (int): Number of turns taken by the user.
         prev_agent_act (AgentAction): The previous action taken by the agent.
+        state_codes (1D numpy.ndarray): Codes of the states that the user
+            underwent in this dialog session, i.e., values of
+            `AGENT_ACTION_CODES`. Entries past `num_turns` are -1.
         user (:obj: User): The user participating in the dialog.
-        user_log (list of tuples): Log of (state, action) pairs that the user
-            underwent in this dialog session in the form of a list of tuples of
-            form (AgentActionType, UserActionType).
     """
 
     def __init__(self, user, agent):
         self.user = user
         self.agent = agent
         self.num_steps = 0
-        self.user_log = []
+        self.num_turns = 0
+        self.state_codes = np.full(MAX_TURNS, -1, dtype=np.int8)
+        self.action_codes = np.full(MAX_TURNS, -1, dtype=np.int8)
         self.prev_agent_act = None
 
+    @property
+    def user_log(self):
+        """list of tuples: Log of (state, action) pairs that the user
+        underwent in this dialog session in the form of a list of tuples of
+        form (AgentActionType, UserActionType).
+        """
+        return [(AGENT_ACTION_TYPES[state], USER_ACTION_TYPES[action])
+                for state, action in zip(self.state_codes[:self.num_turns],
+                                         self.action_codes[:self.num_turns])]
+
     def start(self):
         """Executes a dialog session by having the agent and the user take
         alternating turns.
         """
+        num_turns = self.num_turns
         # The agent starts the dialog
         agent_act = self.agent.start_dialog()
         user_act = UserAction(None, None)
         while not (user_act.type is UserActionType.CLOSE and
                    agent_act.type is AgentActionType.CLOSE):
-            if self.num_steps == 100:
+            if self.num_steps == MAX_DIALOG_STEPS:
                 agent_act = AgentActions.bad_close.value
             user_act = self.user.take_turn(agent_act)
             self._save_user_state_action(user_act)
@@ -48,11 +72,14 @@ class DialogSession:
 
             agent_act = self.agent.take_turn(user_act)
             self.num_steps += 1
+        count_simulated(1, self.num_turns - num_turns)
 
     def clear_user_log(self):
         """Purges the user log and resets the number of steps.
         """
-        self.user_log[:] = []
+        self.state_codes[:] = -1
+        self.action_codes[:] = -1
+        self.num_turns = 0
         self.num_steps = 0
 
     def ask_agent_to_start(self):
@@ -73,7 +100,7 @@ class DialogSession:
                 user, and it's response from the agent.
         """
         user_act = self.user.take_turn(self.prev_agent_act)
-        if self.num_steps >= 100:
+        if self.num_steps >= MAX_DIALOG_STEPS:
             self.prev_agent_act = AgentActions.bad_close.value
         else:
             self.prev_agent_act = self.agent.take_turn(user_act)
@@ -81,7 +108,7 @@ class DialogSession:
         return user_act.type, self.prev_agent_act.type
 
     def _save_user_state_action(self, user_action):
-        """Appends the user's current state and action to the `user_log`.
+        """Appends the user's current state and action to the log.
         The state of the user is the agent's last action; other state
         attributes of UserState are ignored because they are not consequential
         to the user policy. The user action saved is the `type` of UserAction.
@@ -92,26 +119,66 @@ class DialogSession:
         # Only the `agent_act` attribute of `UserState` is consequential.
         state = self.user.state.agent_act.type
         action = user_action.type
-        self.user_log.append((state, action))
+        self.state_codes[self.num_turns] = AGENT_ACTION_CODES[state]
+        self.action_codes[self.num_turns] = USER_ACTION_CODES[action]
+        self.num_turns += 1
 
 
 ###################################################################
 # Sample usage to run a dialog session, or generate a dialog corpus
 ###################################################################
 
-def generate_dialog_corpus(num_sessions):
+def generate_dialog_corpus(num_sessions, seed=None, num_workers=NUM_WORKERS):
     """Generates a dialog corpus by executing multiple sessions successively.
 
     Args:
         num_sessions (int, optional): Number of dialog sessions to be executed.
+        seed (int, optional): Seed for the random states of the dialog
+            sessions. When given, the sessions are split into shards run by
+            `num_workers` processes, and the corpus only depends on the seed.
+            Otherwise, the global state of `numpy.random` is used.
+        num_workers (int, optional): Number of worker processes; only used
+            along with `seed`.
+
+    Returns:
+        list of list of tuples: The `DialogSession.user_log` of each session.
     """
     user = User(policy_type=UserPolicyType.handcrafted)
     agent = Agent()
+    if seed is None:
+        shards = [_generate_dialogs(user, agent, num_sessions)]
+    else:
+        shards = map_shards(_generate_dialogs, (user, agent), num_sessions,
+                            seed, num_workers)
+    return sum_counted_shards(shards)
+
+
+def _generate_dialogs(user, agent, num_sessions, random_state=None):
+    """Executes multiple dialog sessions successively.
+
+    Args:
+        user (:obj: User): The dialog user.
+        agent (:obj: Agent): The dialog agent.
+        num_sessions (int): Number of dialog sessions to be executed.
+        random_state (numpy.random.RandomState, optional): Source of
+            randomness. Defaults to the global state of `numpy.random`.
+
+    Returns:
+        (list of list of tuples, 1D numpy.ndarray): The
+            `DialogSession.user_log` of each session, and the number of
+            sessions and user turns simulated.
+    """
+    start_counts = get_simulated_counts()
+    user.set_random_state(random_state)
+    agent.random_state = random_state
+    user_logs = []
     for _ in xrange(num_sessions):
+        user.reset(reset_policy=False)
+        agent.reset()
         session = DialogSession(user, agent)
         session.start()
-        print("----")
-        session.clear_user_log()
+        user_logs.append(session.user_log)
+    return user_logs, take_simulated_counts(start_counts)
 
 
 def run_single_session():
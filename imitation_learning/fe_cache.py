@@ -0,0 +1,172 @@
+"""Cache of the feature expectations of user policies."""
+
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+from dialog_log import get_feature_tensor
+from utils.params import AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY
+from utils.params import FE_CACHE_DIR, FE_CACHE_MAX_BYTES, FE_CACHE_SIZE
+from utils.params import GAMMA, MAX_DIALOG_STEPS, NUM_SLOTS
+
+# Version of the cached feature expectations; to be bumped whenever `User`,
+# `Agent`, the dialog sessions or the features change, so that entries cached
+# by earlier code are not served.
+CACHE_VERSION = 1
+
+
+class FeatureExpectationCache(object):
+    """Two-tier cache of feature expectations and their variances.
+
+    Entries are keyed by a fingerprint of everything the feature expectation
+    depends on: the version of the code (`CACHE_VERSION`), the user's policy
+    and features, the parameters of the dialog and the way it is estimated.
+    The most recently used entries are kept in memory. All entries are also
+    saved as `.npy` files in a directory, whose least recently used files are
+    deleted once it grows too large.
+
+    Attributes:
+        directory (str or None): Directory of the on-disk tier; None if there
+            is none.
+        max_bytes (int): Maximum size of the on-disk tier.
+        size (int): Maximum number of entries kept in memory.
+    """
+
+    _default_cache = None
+
+    def __init__(self, directory=FE_CACHE_DIR, size=FE_CACHE_SIZE,
+                 max_bytes=FE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.size = size
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._disk_bytes = None
+
+    @classmethod
+    def get_default(cls):
+        """Returns the cache shared by default, creating it on first use.
+
+        Returns:
+            FeatureExpectationCache: The cache.
+        """
+        if cls._default_cache is None:
+            cls._default_cache = cls()
+        return cls._default_cache
+
+    @staticmethod
+    def get_key(policy, features, *estimator):
+        """Returns the fingerprint of a feature expectation.
+
+        Args:
+            policy (UserPolicy): Policy followed by the user.
+            features (UserFeatures): Feature function for dialog users.
+            *estimator: Values identifying how the feature expectation is
+                estimated, e.g., the mode, number of sessions and seed.
+
+        Returns:
+            str: The fingerprint.
+        """
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(policy.get_policy_matrix(),
+                                           dtype=float).tostring())
+        digest.update(np.ascontiguousarray(get_feature_tensor(features),
+                                           dtype=float).tostring())
+        dialog = (AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY,
+                  NUM_SLOTS, GAMMA, MAX_DIALOG_STEPS)
+        digest.update(repr((CACHE_VERSION,) + dialog + estimator))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns a cached feature expectation.
+
+        Args:
+            key (str): Fingerprint from `get_key`.
+
+        Returns:
+            (1D numpy.ndarray, 1D numpy.ndarray) or None: Feature expectation
+                and its variance, or None on a miss.
+        """
+        if key in self._entries:
+            entry = self._entries.pop(key)
+            self._entries[key] = entry
+            return entry[0].copy(), entry[1].copy()
+        if self.directory is None:
+            return None
+
+        filepath = self._get_filepath(key)
+        try:
+            entry = np.load(filepath)
+            os.utime(filepath, None)
+        except (IOError, OSError, ValueError):
+            return None
+        self._remember(key, entry)
+        return entry[0].copy(), entry[1].copy()
+
+    def put(self, key, mean, variance):
+        """Caches a feature expectation.
+
+        Args:
+            key (str): Fingerprint from `get_key`.
+            mean (1D numpy.ndarray): Feature expectation.
+            variance (1D numpy.ndarray): Variance of each of its elements.
+        """
+        entry = np.array([mean, variance], dtype=float)
+        self._remember(key, entry)
+        if self.directory is None:
+            return
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        filepath = self._get_filepath(key)
+        existed = os.path.exists(filepath)
+        fd, tmp_filepath = tempfile.mkstemp(dir=self.directory,
+                                            suffix=".tmp")
+        with os.fdopen(fd, "wb") as fout:
+            np.save(fout, entry)
+        os.rename(tmp_filepath, filepath)
+        if not existed and self._disk_bytes is not None:
+            self._disk_bytes += os.path.getsize(filepath)
+        self._evict()
+
+    def clear(self):
+        """Empties both tiers of the cache."""
+        self._entries.clear()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if filename.endswith(".npy"):
+                    os.remove(os.path.join(self.directory, filename))
+        self._disk_bytes = None
+
+    def _remember(self, key, entry):
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def _get_filepath(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def _evict(self):
+        """Deletes the least recently used files of the on-disk tier until it
+        fits in `max_bytes`.
+        """
+        if self._disk_bytes is not None and self._disk_bytes <= self.max_bytes:
+            return
+
+        files = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".npy"):
+                continue
+            filepath = os.path.join(self.directory, filename)
+            stat = os.stat(filepath)
+            files.append((stat.st_mtime, stat.st_size, filepath))
+        self._disk_bytes = sum(size for _, size, _ in files)
+
+        files.sort()
+        for _, size, filepath in files:
+            if self._disk_bytes <= self.max_bytes:
+                break
+            os.remove(filepath)
+            self._disk_bytes -= size
@@ -1,14 +1,35 @@
-import pickle
+import time
+
 import numpy as np
 
 from agent.agent import Agent
+import dialog_log
+from batch_dialog_session import BatchDialogSession
+from checkpoint_log import CheckpointLog, CheckpointRecord
+from dialog_model import DialogModel
 from dialog_session import DialogSession
+from fe_cache import FeatureExpectationCache
 from mdp.solver import SarsaSolver
+from simulation.simulation_store import open_simulation_store
 from simulation.user_simulation import UserSimulation
 from user.user import User
+from user.user_policy import UserPolicy
 from user.user_features import UserFeatures
-from utils.params import UserPolicyType, GAMMA, NUM_SESSIONS_FE, THRESHOLD
-from utils.params import SIMULATIONS_DUMP_FILE
+from utils.params import UserPolicyType, NUM_SESSIONS_FE, THRESHOLD
+from utils.params import SIMULATIONS_DUMP_FILE, SIMULATIONS_STORE_SUFFIX
+from utils.params import FEATURE_EXPECTATION_MODE, FeatureExpectationMode
+from utils.params import IRL_FEATURE_EXPECTATION_MODE
+from utils.params import NUM_WORKERS, VERBOSITY, Verbosity
+from utils.params import METRICS_SUFFIX, PROFILE_SUFFIX
+from utils.params import FE_CHUNK_SIZE, FE_CONFIDENCE_Z, FE_MAX_SESSIONS
+from utils.params import FE_TARGET_HALF_WIDTH
+from utils.params import IRL_MAX_ITERATIONS, IRL_MAX_SECONDS
+from utils.params import IRL_MIN_IMPROVEMENT, IRL_STALL_WINDOW, StopReason
+from utils.params import WARM_START_MIN_COSINE
+from utils.parallel import map_shards, sum_counted_shards
+from utils.metrics import MetricsLogger, get_simulated_counts
+from utils.metrics import take_simulated_counts
+from utils.utils import RunningMoments
 
 from utils.params import AgentActionType, UserActionType
 from mdp.reward import Reward
@@ -20,128 +41,368 @@ class IRL(object):
 
     Attributes:
         agent (Agent): The dialog agent class
+        checkpoint_log (CheckpointLog): Log of the iterations of the current
+            run of the IRL algorithm.
         features (UserFeatures): Feature function for dialog users.
+        fe_mode (FeatureExpectationMode): How the feature expectations of the
+            expert and of the simulated users are calculated.
+        margins (list of float): Margin of separation of each iteration.
+        metrics (MetricsLogger): Logger of the iterations of the current run.
+        profile_iteration (int): Index of the iteration to profile, or None.
         real_user (:obj: User): An expert user with a hand-crafted dialog
             policy.
+        run_seed (int): Seed of the dialog sessions run to calculate feature
+            expectations in the current run, or the last one.
+        seed (int): Seed of the dialog sessions of every run, or None to draw
+            one per run.
         simulated_users (list of :obj: UserSimulation): List of user
             simulations built during the IRL algorithm.
+        solver (MDPSolver): The MDP solver class used to learn the policy of
+            a simulated user from a reward function.
+        stop_reason (StopReason): Reason for which the last run stopped.
         user (User): The dialog user class.
+        warm_start (bool): Whether the solver of each iteration starts from
+            the Q-values and the policy learnt in the previous one.
     """
 
-    def __init__(self):
+    def __init__(self, solver=SarsaSolver, verbosity=VERBOSITY,
+                 profile_iteration=None, warm_start=False,
+                 fe_mode=IRL_FEATURE_EXPECTATION_MODE, seed=None):
+        """Class constructor
+
+        Args:
+            solver (MDPSolver, optional): The MDP solver class used to learn
+                the policies of simulated users. `SarsaSolver` by default.
+            verbosity (Verbosity, optional): Level of detail of the printed
+                messages.
+            profile_iteration (int, optional): Index of an iteration to
+                profile with `cProfile`. The statistics are dumped next to the
+                checkpoint log, with the suffix `PROFILE_SUFFIX`.
+            warm_start (bool, optional): Whether the solver of each iteration
+                starts from the Q-values and the policy learnt in the
+                previous one, when their reward functions are close. Off by
+                default: the solver then tends to learn the previous policy
+                again, and the margin stops improving for several
+                iterations.
+            fe_mode (FeatureExpectationMode, optional): How the feature
+                expectations are calculated. In the `sequential` mode, each
+                simulated user's is only as precise as its distance to the
+                expert's requires.
+            seed (int, optional): Seed of the dialog sessions run to calculate
+                feature expectations. All of them share it, so that the
+                expert's and the simulated users' are estimated with common
+                random numbers, and their differences are more accurate than
+                their values. Drawn at random once per run if not given.
+        """
         self.user = User
         self.agent = Agent
+        self.solver = solver
         self.real_user = self.user(policy_type=UserPolicyType.handcrafted)
         self.simulated_users = []
+        self.margins = []
+        self.stop_reason = None
+        self.checkpoint_log = None
+        self.profile_iteration = profile_iteration
+        self.warm_start = warm_start
+        self.fe_mode = fe_mode
+        self.seed = seed
+        self.run_seed = None
+        self.metrics = MetricsLogger(verbosity=verbosity)
         # self.features = UserFeatures()
 
-    def run_irl(self):
+    def run_irl(self, checkpoint_file=SIMULATIONS_DUMP_FILE):
         """Executes Inverse Reinforcement Learning algorithm to learn a set of
         decent user simulations. One among these is the best.
+
+        Every iteration is recorded in a checkpoint log. If `checkpoint_file`
+        already holds one, e.g., from a run that crashed, the algorithm
+        resumes after the last iteration recorded in it, with the seed of the
+        feature expectations recorded in it. The other random number
+        generators are not restored, so a resumed run does not retrace the
+        original run exactly. Once the algorithm stops, the learnt user
+        simulations are also saved as a `SimulationStore` next to the log,
+        along with the reason for stopping.
+
+        The metrics of every iteration, i.e., the time spent and the number of
+        dialog sessions simulated in each of its phases, the number of dialog
+        sessions and user turns simulated, the
+        margin of separation, the distance to the expert and the number of
+        episodes run by the solver, are appended as JSON lines to a file next
+        to the log, with the suffix `METRICS_SUFFIX`.
+
+        Args:
+            checkpoint_file (str, optional): Path of the checkpoint log.
         """
 
         # The algorithm and the terminology here is based on the "Simpler
         # Algorithm" in Section 3.1 of Abbeel and Ng 2004 paper titled:
         # "Apprenticeship Learning via Inverse Reinforcement Learning."
 
+        self.metrics = MetricsLogger(checkpoint_file + METRICS_SUFFIX,
+                                     self.metrics.verbosity,
+                                     self.profile_iteration,
+                                     checkpoint_file + PROFILE_SUFFIX)
+        self.checkpoint_log = CheckpointLog(checkpoint_file)
+        try:
+            self._run_irl()
+        finally:
+            self.checkpoint_log.close()
+            self.metrics.close()
+
+        store = open_simulation_store(checkpoint_file)
+        store.metadata.update(stop_reason=self.stop_reason.name,
+                              iterations=len(self.simulated_users),
+                              margin=float(self.margins[-1]))
+        store.save(checkpoint_file + SIMULATIONS_STORE_SUFFIX)
+
+    def _run_irl(self):
+        """Executes the iterations of the IRL algorithm that are not recorded
+        in the checkpoint log yet, until one of the stopping criteria is met;
+        see `_get_stop_reason`.
+        """
+        start_time = time.time()
+        records = self.checkpoint_log.records
+        if records:
+            self.simulated_users = [record.simulated_user
+                                    for record in records]
+            self.margins = [np.linalg.norm(record.expert_fe - record.mu_bar)
+                            for record in records]
+            last_record = records[-1]
+            mu_e = last_record.expert_fe
+            var_e = _get_recorded_variance(last_record.expert_variance, mu_e)
+            mu_curr = last_record.simulated_fe
+            var_curr = _get_recorded_variance(last_record.simulated_variance,
+                                              mu_curr)
+            mu_bar_prev = last_record.mu_bar
+            var_bar_prev = _get_recorded_variance(last_record.mu_bar_variance,
+                                                  mu_bar_prev)
+            self.run_seed = last_record.seed
+            if self.run_seed is None:
+                self.run_seed = self._draw_seed()
+            self.metrics.log(Verbosity.progress, "Resuming at iteration",
+                             len(records))
+        else:
+            self.run_seed = self._draw_seed()
+            (mu_e, var_e, mu_curr, var_curr, mu_bar_prev,
+             var_bar_prev) = self._run_first_iteration()
+
+        while True:
+            self.stop_reason = self._get_stop_reason(var_e + var_bar_prev,
+                                                     start_time)
+            if self.stop_reason is not None:
+                break
+            self.metrics.start_iteration(len(self.simulated_users))
+
+            with self.metrics.time("projection"):
+                numerator = np.dot((mu_curr - mu_bar_prev),
+                                   (mu_e - mu_bar_prev))
+                denominator = np.dot((mu_curr - mu_bar_prev),
+                                     (mu_curr - mu_bar_prev))
+                factor = mu_curr - mu_bar_prev
+
+                mu_bar_curr = mu_bar_prev + (numerator / denominator) * factor
+                w = mu_e - mu_bar_curr
+                t = np.linalg.norm(mu_e - mu_bar_curr)
+
+                # mu_bar_curr is a mix of mu_bar_prev and mu_curr, which are
+                # estimated independently.
+                step = numerator / denominator
+                var_bar_curr = ((1. - step)**2 * var_bar_prev +
+                                step**2 * var_curr)
+            self._print_weights(w, t)
+
+            # The learned weights w define a reward function. This reward
+            # function is somewhat close to the expert's reward function.
+            # Learn an optimal policy for that reward function, resulting
+            # in a decent simulated user.
+            mu_curr, var_curr = self._learn_simulated_user(
+                w, mu_e, var_e, mu_bar_curr, var_bar_curr, t)
+            mu_bar_prev = mu_bar_curr
+            var_bar_prev = var_bar_curr
+
+        self.metrics.log(Verbosity.progress, "Stopped after {} iterations: {}"
+                         .format(len(self.simulated_users),
+                                 self.stop_reason.name))
+
+    def _draw_seed(self):
+        """Returns the seed of the feature expectations of a new run.
+
+        Returns:
+            int: `seed` if given, or a random seed otherwise.
+        """
+        if self.seed is not None:
+            return self.seed
+        return np.random.randint(2**31)
+
+    def _get_stop_reason(self, margin_variance, start_time):
+        """Returns the reason for stopping the IRL algorithm, if any.
+
+        The algorithm stops once the last margin drops below `THRESHOLD`, or
+        is within the noise of the estimated feature expectations: if the
+        expert's feature expectation and its projection were equal, the
+        squared margin would be the sum of the squared errors of their
+        estimates, whose mean and variance follow from `margin_variance`. The
+        margin is then indistinguishable from zero unless it exceeds the
+        upper `FE_CONFIDENCE_Z` quantile of that sum. The algorithm also stops
+        once the margin stalls over `IRL_STALL_WINDOW` iterations, or a
+        budget is exhausted.
+
+        Args:
+            margin_variance (1D numpy.ndarray): Variance of each element of
+                the difference between the expert's feature expectation and
+                its last projection.
+            start_time (float): Time at which this run started.
+
+        Returns:
+            StopReason or None: The reason for stopping, or None to continue.
+        """
+        t = self.margins[-1]
+        noise_floor = (np.sum(margin_variance) + FE_CONFIDENCE_Z *
+                       np.sqrt(2. * np.sum(margin_variance**2)))
+        window = self.margins[-IRL_STALL_WINDOW:]
+        previous = self.margins[:-IRL_STALL_WINDOW]
+
+        if t < THRESHOLD:
+            return StopReason.converged
+        elif t**2 <= noise_floor:
+            return StopReason.noise_floor
+        elif previous and (min(window) >
+                           (1. - IRL_MIN_IMPROVEMENT) * min(previous)):
+            return StopReason.stalled
+        elif len(self.simulated_users) >= IRL_MAX_ITERATIONS:
+            return StopReason.max_iterations
+        elif (IRL_MAX_SECONDS is not None and
+              time.time() - start_time >= IRL_MAX_SECONDS):
+            return StopReason.time_budget
+        return None
+
+    def _run_first_iteration(self):
+        """Executes the first iteration of the IRL algorithm, which starts
+        from a user simulation with random policy.
+
+        Returns:
+            (1D numpy.ndarray, 1D numpy.ndarray, 1D numpy.ndarray,
+                1D numpy.ndarray, 1D numpy.ndarray, 1D numpy.ndarray):
+                Feature expectations of the expert user and of the learnt user
+                simulation, and the projection of the expert's feature
+                expectation; each followed by the variance of its elements.
+        """
+        self.metrics.start_iteration(0)
+
         # Calculate feature expectation for the expert user policy.
-        mu_e = self.calc_feature_expectation(self.real_user, self.agent())
+        with self.metrics.time("expert_fe"):
+            mu_e, var_e = self.calc_feature_expectation(
+                self.real_user, self.agent(), mode=self.fe_mode,
+                seed=self.run_seed, return_variance=True)
 
         # Start with a user simulation with random policy.
         random_user = self.user(policy_type=UserPolicyType.random)
 
         # Calculate feature expectation for the random user policy.
-        mu_curr = self.calc_feature_expectation(random_user, self.agent())
-        # print mu_e
-        # print mu_curr
-        # raw_input()
-        mu_bar_curr = mu_curr
-        w = mu_e - mu_bar_curr  # The weight vector.
-        t = np.linalg.norm(mu_e - mu_bar_curr)  # Margin of separation.
-
-        print w
-        print t
-        self._print_reward(w)
+        with self.metrics.time("policy_fe"):
+            mu_curr, var_curr = self.calc_feature_expectation(
+                random_user, self.agent(), mode=self.fe_mode,
+                seed=self.run_seed, expert_fe=mu_e, return_variance=True)
+
+        with self.metrics.time("projection"):
+            mu_bar_curr = mu_curr
+            var_bar_curr = var_curr
+            w = mu_e - mu_bar_curr  # The weight vector.
+            t = np.linalg.norm(mu_e - mu_bar_curr)  # Margin of separation.
+        self._print_weights(w, t)
 
         # The learned weights w define a reward function. This reward function
         # is somewhat close to the expert's reward function. Learn an optimal
         # policy for that reward function, resulting in a decent simulated
         # user.
-        sim_user = self.user()
-        q_learning = SarsaSolver(sim_user, self.agent(), w)
-        q_learning.solve()
-
-        print "\nQ-values"
-        print q_learning.q
-        print "\n Policy"
-        print sim_user.policy.policy
-        print "--------------------------------"
+        mu_curr, var_curr = self._learn_simulated_user(
+            w, mu_e, var_e, mu_bar_curr, var_bar_curr, t)
+        return mu_e, var_e, mu_curr, var_curr, mu_bar_curr, var_bar_curr
 
-        # Calculate feature expectation of the new policy.
-        mu_curr = self.calc_feature_expectation(sim_user, self.agent())
-
-        # Save the simulated user.
-        self._save_simulated_user(sim_user, w, q_learning.q,
-                                  mu_e, mu_curr)
-        # self._save_simulated_user(sim_user, w, None,
-        #                           mu_e, mu_curr)
+    def _learn_simulated_user(self, w, mu_e, var_e, mu_bar, var_bar, t):
+        """Learns the policy of a simulated user from a reward function,
+        saves the simulated user and ends the iteration of the metrics.
 
-        mu_bar_prev = mu_bar_curr
+        Args:
+            w (1D numpy.ndarray): Weights of the reward function.
+            mu_e (1D numpy.ndarray): Expert user's feature expectation.
+            var_e (1D numpy.ndarray): Variance of each element of `mu_e`.
+            mu_bar (1D numpy.ndarray): Projection of the expert's feature
+                expectation from which `w` was computed.
+            var_bar (1D numpy.ndarray): Variance of each element of `mu_bar`.
+            t (float): Margin of separation.
 
-        steps = 0
-        while t >= THRESHOLD:
-            print("Step-{}".format(steps))
-            # Dump the list of user simulations every 10 step.
-            if steps % 10 == 0:
-                self._dump_simulations()
+        Returns:
+            (1D numpy.ndarray, 1D numpy.ndarray): Feature expectation of the
+                simulated user, and the variance of each of its elements.
+        """
+        sim_user = self.user()
+        with self.metrics.time("solver"):
+            q_learning = self.solver(sim_user, self.agent(), w)
+            if self.warm_start and self.simulated_users:
+                self._warm_start_solver(q_learning, w)
+            q_learning.solve()
 
-            numerator = np.dot((mu_curr - mu_bar_prev), (mu_e - mu_bar_prev))
-            denominator = np.dot((mu_curr - mu_bar_prev),
-                                 (mu_curr - mu_bar_prev))
-            factor = mu_curr - mu_bar_prev
+        self.metrics.log(Verbosity.debug, "\nQ-values")
+        self.metrics.log(Verbosity.debug, q_learning.q)
+        self.metrics.log(Verbosity.debug, "\n Policy")
+        self.metrics.log(Verbosity.debug, sim_user.policy.policy)
+        self.metrics.log(Verbosity.debug, "-" * 32)
 
-            mu_bar_curr = mu_bar_prev + (numerator / denominator) * factor
-            w = mu_e - mu_bar_curr
-            t = np.linalg.norm(mu_e - mu_bar_curr)
+        # Calculate feature expectation of the new policy.
+        with self.metrics.time("policy_fe"):
+            mu_curr, var_curr = self.calc_feature_expectation(
+                sim_user, self.agent(), mode=self.fe_mode,
+                seed=self.run_seed, expert_fe=mu_e, return_variance=True)
 
-            print w
-            print t
-            self._print_reward(w)
+        # Save the simulated user.
+        with self.metrics.time("checkpoint"):
+            self._save_simulated_user(sim_user, w, q_learning.q,
+                                      mu_e, mu_curr, mu_bar,
+                                      var_e, var_curr, var_bar)
+        self.margins.append(t)
 
-            # The learned weights w define a reward function. This reward
-            # function is somewhat close to the expert's reward function.
-            # Learn an optimal policy for that reward function, resulting
-            # in a decent simulated user.
-            sim_user = self.user()
-            q_learning = SarsaSolver(sim_user, self.agent(), w)
-            q_learning.solve()
+        self.metrics.end_iteration(
+            margin=t, distance=np.linalg.norm(mu_e - mu_curr),
+            noise_floor=np.sqrt(np.sum(var_e + var_bar)),
+            episodes=q_learning.num_episodes_used)
+        return mu_curr, var_curr
 
-            print "\nQ-values"
-            print q_learning.q
-            print "\n Policy"
-            print sim_user.policy.policy
-            print "--------------------------------"
-
-            # Calculate feature expectation of the new policy.
-            mu_curr = self.calc_feature_expectation(sim_user, self.agent())
-            # print mu_curr
-            # raw_input()
-            # Save the simulated user.
-            self._save_simulated_user(sim_user, w, q_learning.q,
-                                      mu_e, mu_curr)
-            # self._save_simulated_user(sim_user, w, None,
-            #                           mu_e, mu_curr)
+    def _warm_start_solver(self, solver, w):
+        """Makes a solver start from the Q-values and the policy of the last
+        simulated user, including one restored from the checkpoint log.
 
-            mu_bar_prev = mu_bar_curr
-            steps += 1
+        Q-values are linear in the reward, so they are first scaled by the
+        ratio of the norms of the weights. The solver starts from scratch if
+        the direction of the weights changed by too much, i.e., if their
+        cosine similarity is below `WARM_START_MIN_COSINE`.
 
-        # Dump the final list of user simulations.
-        if steps % 10 == 0:
-            self._dump_simulations()
+        Args:
+            solver (MDPSolver): The solver, not run yet.
+            w (1D numpy.ndarray): Weights of the solver's reward function.
+        """
+        previous = self.simulated_users[-1]
+        if previous.q is None or previous.policy is None:
+            return
+        norm = np.linalg.norm(w)
+        previous_norm = np.linalg.norm(previous.weights)
+        if norm == 0 or previous_norm == 0:
+            return
+        if (np.dot(w, previous.weights) / (norm * previous_norm) <
+                WARM_START_MIN_COSINE):
+            return
+        scale = norm / previous_norm
+        q = {state: scale * np.asarray(q_values)
+             for state, q_values in previous.q.iteritems()}
+        solver.warm_start(q, previous.policy)
 
     @classmethod
     def calc_feature_expectation(cls, user, agent,
-                                 num_sessions=NUM_SESSIONS_FE):
+                                 num_sessions=NUM_SESSIONS_FE,
+                                 mode=FEATURE_EXPECTATION_MODE,
+                                 seed=None, num_workers=NUM_WORKERS,
+                                 use_cache=True, return_variance=False,
+                                 expert_fe=None):
         """Calculates the feature expectation of a user policy against the
         handcoded agent by executing a series of dialog sessions and tracking
         the state-action pairs associated with the user.
@@ -150,29 +411,248 @@ class IRL(object):
             user (:obj: User): The user whose policy's feature expectation
                 needs to be calculated.
             agent (:obj: Agent): The agent against whom the `user` the dialog
-                sessions will be run.
+                sessions will be run. Only used in the `sessions` mode; the
+                other modes always follow the policy of `Agent`.
             num_sessions (int, optional): Number of dialog sessions to be run
-                for the purpose of feature expectation calculation.
+                for the purpose of feature expectation calculation. Ignored in
+                the `exact` and `sequential` modes; the latter runs as many
+                as needed, up to `FE_MAX_SESSIONS`.
+            mode (FeatureExpectationMode, optional): How the feature
+                expectation is calculated.
+            seed (int, optional): Seed for the random states of the dialog
+                sessions. When given, the sessions are split into shards run by
+                `num_workers` processes, and the result only depends on the
+                seed. Otherwise, the global state of `numpy.random` is used.
+                Batch sessions with the same seed share their random numbers
+                across user policies, which makes comparisons of the feature
+                expectations of different policies more accurate.
+            num_workers (int, optional): Number of worker processes; only used
+                along with `seed`.
+            use_cache (bool, optional): Whether to look the feature expectation
+                up in, and add it to, the default `FeatureExpectationCache`.
+                A cached estimate is reused for the same policy, mode, number
+                of sessions and seed, even when no seed is given.
+            return_variance (bool, optional): Whether to also return the
+                variance of the estimate.
+            expert_fe (1D numpy.ndarray, optional): Expert user's feature
+                expectation. In the `sequential` mode, sessions stop once the
+                distance to it is precise enough; see
+                `calc_feature_expectation_sequentially`. Ignored otherwise.
+
+        Returns:
+            numpy.array: Feature expectation of the user's policy; along with
+                the variance of each of its elements if `return_variance` is
+                True.
+        """
+        if mode is FeatureExpectationMode.exact:
+            num_sessions = seed = None
+        estimator = (mode.name, num_sessions, seed)
+        if mode is FeatureExpectationMode.sequential:
+            # The sessions run depend on the targets and the expert instead.
+            estimator = (mode.name, None, seed, FE_TARGET_HALF_WIDTH,
+                         FE_CHUNK_SIZE, FE_MAX_SESSIONS,
+                         None if expert_fe is None else tuple(expert_fe))
+
+        cache = None
+        if use_cache:
+            cache = FeatureExpectationCache.get_default()
+            key = cache.get_key(user.policy, user.features, *estimator)
+            entry = cache.get(key)
+        if cache is None or entry is None:
+            entry = cls._estimate_feature_expectation(
+                user, agent, num_sessions, mode, seed, num_workers, expert_fe)
+            if cache is not None:
+                cache.put(key, *entry)
+
+        if return_variance:
+            return entry
+        return entry[0]
+
+    @classmethod
+    def _estimate_feature_expectation(cls, user, agent, num_sessions, mode,
+                                      seed, num_workers, expert_fe=None):
+        """Estimates the feature expectation of a user policy; see
+        `calc_feature_expectation`.
+
+        Returns:
+            (1D numpy.ndarray, 1D numpy.ndarray): Feature expectation, and the
+                variance of each of its elements.
+        """
+        if mode is FeatureExpectationMode.exact:
+            model = DialogModel.get_model()
+            mean = model.get_feature_expectation(user.policy, user.features)
+            return mean, np.zeros(mean.shape)
+        elif mode is FeatureExpectationMode.control_variate:
+            random_state = None
+            if seed is not None:
+                random_state = np.random.RandomState(seed)
+            mean, stderr = cls.calc_feature_expectation_with_control_variate(
+                user, num_sessions, random_state)
+            return mean, stderr**2
+        elif mode is FeatureExpectationMode.sequential:
+            random_state = None
+            if seed is not None:
+                random_state = np.random.RandomState(seed)
+            mean, stderr, _ = cls.calc_feature_expectation_sequentially(
+                user, expert_fe, random_state=random_state)
+            return mean, stderr**2
+        elif seed is not None:
+            if mode is FeatureExpectationMode.batch:
+                shards = map_shards(_run_batch_sessions,
+                                    (user.policy, user.features),
+                                    num_sessions, seed, num_workers)
+            else:
+                shards = map_shards(_run_sessions, (user, agent),
+                                    num_sessions, seed, num_workers)
+            moments = sum_counted_shards(shards)
+        elif mode is FeatureExpectationMode.batch:
+            sessions = BatchDialogSession(user.policy, num_sessions)
+            sessions.start()
+            moments = _get_moments(
+                sessions.get_session_feature_counts(user.features))
+        else:
+            state_log, action_log = _log_sessions(user, agent, num_sessions)
+            moments = _get_moments(dialog_log.get_session_feature_counts(
+                state_log, action_log, user.features))
+        return _get_mean_and_variance(moments, num_sessions)
+
+    @classmethod
+    def calc_feature_expectation_sequentially(
+            cls, user, expert_fe=None, half_width=FE_TARGET_HALF_WIDTH,
+            chunk_size=FE_CHUNK_SIZE, max_sessions=FE_MAX_SESSIONS,
+            random_state=None):
+        """Estimates the feature expectation of a user policy by running
+        batches of dialog sessions until the estimate is precise enough.
+
+        After each chunk of sessions, the half-width of the confidence interval
+        of the distance between `expert_fe` and the estimate is computed from
+        the running covariance of the discounted feature counts of the
+        sessions, using the delta method. Without `expert_fe`, the root mean
+        squared error of the estimate is used instead. Sessions stop once the
+        half-width drops below `half_width`.
+
+        Args:
+            user (:obj: User): The user whose policy's feature expectation
+                needs to be calculated.
+            expert_fe (1D numpy.ndarray, optional): Expert user's feature
+                expectation.
+            half_width (float, optional): Target half-width of the confidence
+                interval.
+            chunk_size (int, optional): Number of sessions run between checks.
+            max_sessions (int, optional): Maximum number of sessions.
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness. Defaults to the global state of `numpy.random`.
 
         Returns:
-            numpy.array: Feature expectation of the user's policy.
+            (1D numpy.ndarray, 1D numpy.ndarray, int): Feature expectation of
+                the user's policy, standard error of each of its elements, and
+                the number of sessions run.
         """
-        feature_expectation = np.zeros(user.features.dimensions)
-        for _ in xrange(num_sessions):
-            user.reset(reset_policy=False)
-            agent.reset()
-            session = DialogSession(user, agent)
-            session.start()
+        moments = RunningMoments(user.features.dimensions)
+        while moments.count < max_sessions:
+            num_sessions = min(chunk_size, max_sessions - moments.count)
+            sessions = BatchDialogSession(user.policy, num_sessions,
+                                          random_state)
+            sessions.start()
+            moments.update(sessions.get_session_feature_counts(user.features))
+            if cls._get_half_width(moments, expert_fe) <= half_width:
+                break
+        return moments.mean, moments.get_standard_error(), moments.count
 
-            for t, (state, action) in enumerate(session.user_log):
-                feature_vector = user.features.get_vector(state, action)
-                feature_expectation += ((GAMMA**t) * feature_vector)
+    @classmethod
+    def calc_feature_expectation_with_control_variate(
+            cls, user, num_sessions=NUM_SESSIONS_FE, random_state=None,
+            control_policy=None):
+        """Estimates the feature expectation of a user policy, using a policy
+        whose feature expectation is exactly known as a control variate.
+
+        Batches of sessions are run for both policies with the same random
+        numbers, so that the error of the control policy's estimate is highly
+        correlated with that of the user's. This error is known exactly, and
+        is subtracted from the user's estimate after scaling each element by
+        its estimated regression coefficient.
 
-        feature_expectation /= num_sessions
-        return feature_expectation
+        Args:
+            user (:obj: User): The user whose policy's feature expectation
+                needs to be calculated.
+            num_sessions (int, optional): Number of dialog sessions to be run
+                for each policy.
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness. Defaults to the global state of `numpy.random`.
+            control_policy (UserPolicy, optional): Policy used as the control
+                variate. Defaults to the handcrafted policy of the expert.
 
-    def _save_simulated_user(self, user, weights, q, expert_fe, simulated_fe):
-        """Saves the simulated user built during an iteration of IRL algorithm.
+        Returns:
+            (1D numpy.ndarray, 1D numpy.ndarray): Feature expectation of the
+                user's policy, and the standard error of each of its elements.
+        """
+        if control_policy is None:
+            control_policy = UserPolicy(UserPolicyType.handcrafted)
+        if random_state is None:
+            random_state = np.random.RandomState(np.random.randint(2**31))
+        control_fe = DialogModel.get_model().get_feature_expectation(
+            control_policy, user.features)
+
+        # Replay the same random numbers for both policies.
+        counts = []
+        state = random_state.get_state()
+        for policy in (user.policy, control_policy):
+            random_state.set_state(state)
+            sessions = BatchDialogSession(policy, num_sessions, random_state)
+            sessions.start()
+            counts.append(sessions.get_session_feature_counts(user.features))
+        user_counts, control_counts = counts
+
+        user_deviations = user_counts - np.mean(user_counts, axis=0)
+        control_deviations = control_counts - np.mean(control_counts, axis=0)
+        covariance = np.sum(user_deviations * control_deviations, axis=0)
+        control_variance = np.sum(control_deviations ** 2, axis=0)
+        coefficients = np.zeros(control_variance.size)
+        nonzero = control_variance > 0
+        coefficients[nonzero] = covariance[nonzero] / control_variance[nonzero]
+
+        corrected_counts = user_counts - coefficients * (control_counts -
+                                                         control_fe)
+        feature_expectation = np.mean(corrected_counts, axis=0)
+        standard_error = np.std(corrected_counts, axis=0, ddof=1) / \
+            np.sqrt(num_sessions)
+        return feature_expectation, standard_error
+
+    @staticmethod
+    def _get_half_width(moments, expert_fe):
+        """Returns the half-width of the confidence interval of the distance
+        between the expert's feature expectation and the estimated one.
+
+        Args:
+            moments (RunningMoments): Moments of the discounted feature counts
+                of the sessions run so far.
+            expert_fe (1D numpy.ndarray or None): Expert user's feature
+                expectation. If None, the half-width of the root mean squared
+                error of the estimate is returned.
+
+        Returns:
+            float: Half-width of the confidence interval.
+        """
+        if moments.count < 2:
+            return np.inf
+        covariance = moments.get_covariance() / moments.count
+        if expert_fe is None:
+            variance = np.trace(covariance)
+        else:
+            difference = moments.mean - expert_fe
+            distance = np.linalg.norm(difference)
+            if distance == 0:
+                variance = np.trace(covariance)
+            else:
+                gradient = difference / distance
+                variance = gradient.dot(covariance).dot(gradient)
+        return FE_CONFIDENCE_Z * np.sqrt(variance)
+
+    def _save_simulated_user(self, user, weights, q, expert_fe, simulated_fe,
+                             mu_bar, expert_variance=None,
+                             simulated_variance=None, mu_bar_variance=None):
+        """Saves the simulated user built during an iteration of IRL algorithm,
+        and appends the iteration to the checkpoint log.
 
         Args:
             user (:obj: User): The learnt user simulation.
@@ -182,26 +662,166 @@ class IRL(object):
             expert_fe (1d numpy.ndarray): Expert user's feature expectations.
             simulated_fe (1d numpy.ndarray): Simulated user's feature
                 expectations.
+            mu_bar (1d numpy.ndarray): Projection of the expert's feature
+                expectations from which `weights` were computed.
+            expert_variance (1d numpy.ndarray, optional): Variance of each
+                element of `expert_fe`.
+            simulated_variance (1d numpy.ndarray, optional): Variance of each
+                element of `simulated_fe`.
+            mu_bar_variance (1d numpy.ndarray, optional): Variance of each
+                element of `mu_bar`.
         """
         distance_to_expert = np.linalg.norm(expert_fe - simulated_fe)
         simulated_user = UserSimulation(user.policy, q, weights,
                                         distance_to_expert)
         self.simulated_users.append(simulated_user)
+        record = CheckpointRecord(len(self.simulated_users) - 1,
+                                  simulated_user, expert_fe, simulated_fe,
+                                  mu_bar, expert_variance, simulated_variance,
+                                  mu_bar_variance, self.run_seed)
+        self.checkpoint_log.append(record)
+
+    def _print_weights(self, w, t):
+        """Prints the weights of the reward function, the margin of separation
+        and the reward of each state-action pair, at the `details` level.
 
-    def _dump_simulations(self):
-        """Dumps the list of user simulations, i.e., the
-        `IRL.simulated_users` attribute.
+        Args:
+            w (1D numpy.ndarray): Weights of the reward function.
+            t (float): Margin of separation.
         """
-        with open(SIMULATIONS_DUMP_FILE, "w") as fout:
-            pickle.dump(self.simulated_users, fout)
-
-    def _print_reward(self, w):
-        actions = [user_action for user_action in UserActionType]
-        # action_index_map = {action: i for i, action in
-        #                     enumerate(actions)}
-        states = [state for state in AgentActionType]
+        if not self.metrics.is_enabled(Verbosity.details):
+            return
+        self.metrics.log(Verbosity.details, w)
+        self.metrics.log(Verbosity.details, t)
         reward = Reward(UserFeatures, w)
-        print "REWARD:"
-        for state in states:
-            for action in actions:
-                print "{}, {}, {:.3f}".format(state, action, reward.get_reward(state, action))
+        self.metrics.log(Verbosity.details, "REWARD:")
+        for state, rewards in zip(AgentActionType, reward.table):
+            for action, value in zip(UserActionType, rewards):
+                self.metrics.log(Verbosity.details, "{}, {}, {:.3f}".format(
+                    state, action, value))
+
+
+def _get_recorded_variance(variance, feature_expectation):
+    """Returns the variance recorded in a checkpoint record, or zeros if the
+    record predates variances.
+
+    Args:
+        variance (1D numpy.ndarray or None): Recorded variance.
+        feature_expectation (1D numpy.ndarray): Feature expectation whose
+            variance it is.
+
+    Returns:
+        1D numpy.ndarray: The variance.
+    """
+    if variance is None:
+        return np.zeros(feature_expectation.shape)
+    return variance
+
+
+def _run_sessions(user, agent, num_sessions, random_state):
+    """Executes dialog sessions one at a time using the given random state.
+
+    Args:
+        user (:obj: User): The dialog user.
+        agent (:obj: Agent): The dialog agent.
+        num_sessions (int): Number of dialog sessions to be run.
+        random_state (numpy.random.RandomState): Source of randomness.
+
+    Returns:
+        (2D numpy.ndarray, 1D numpy.ndarray): Moments of the sessions'
+            discounted feature counts, see `_get_moments`; and the number of
+            sessions and user turns simulated.
+    """
+    start_counts = get_simulated_counts()
+    user_random_state = user.random_state
+    agent_random_state = agent.random_state
+    user.set_random_state(random_state)
+    agent.random_state = random_state
+    try:
+        state_log, action_log = _log_sessions(user, agent, num_sessions)
+    finally:
+        user.set_random_state(user_random_state)
+        agent.random_state = agent_random_state
+    moments = _get_moments(dialog_log.get_session_feature_counts(
+        state_log, action_log, user.features))
+    return moments, take_simulated_counts(start_counts)
+
+
+def _log_sessions(user, agent, num_sessions):
+    """Executes dialog sessions one at a time and logs them.
+
+    Args:
+        user (:obj: User): The dialog user.
+        agent (:obj: Agent): The dialog agent.
+        num_sessions (int): Number of dialog sessions to be run.
+
+    Returns:
+        (2D numpy.ndarray, 2D numpy.ndarray): State log and action log; see
+            `dialog_log`.
+    """
+    state_log, action_log = dialog_log.create_log(num_sessions)
+    session = DialogSession(user, agent)
+    for i in xrange(num_sessions):
+        user.reset(reset_policy=False)
+        agent.reset()
+        session.clear_user_log()
+        session.start()
+        state_log[i] = session.state_codes
+        action_log[i] = session.action_codes
+    return state_log, action_log
+
+
+def _run_batch_sessions(policy, features, num_sessions, random_state):
+    """Executes a batch of dialog sessions using the given random state.
+
+    Args:
+        policy (UserPolicy): Policy followed by the users.
+        features (UserFeatures): Feature function for dialog users.
+        num_sessions (int): Number of dialog sessions to be run.
+        random_state (numpy.random.RandomState): Source of randomness.
+
+    Returns:
+        (2D numpy.ndarray, 1D numpy.ndarray): Moments of the sessions'
+            discounted feature counts, see `_get_moments`; and the number of
+            sessions and user turns simulated.
+    """
+    start_counts = get_simulated_counts()
+    sessions = BatchDialogSession(policy, num_sessions, random_state)
+    sessions.start()
+    moments = _get_moments(sessions.get_session_feature_counts(features))
+    return moments, take_simulated_counts(start_counts)
+
+
+def _get_moments(session_counts):
+    """Returns the sum and the sum of squares of the sessions' discounted
+    feature counts. Unlike their mean and variance, these can be summed over
+    shards of sessions.
+
+    Args:
+        session_counts (2D numpy.ndarray): Discounted feature counts; one row
+            per session.
+
+    Returns:
+        2D numpy.ndarray: The sum and the sum of squares, as rows.
+    """
+    return np.array([np.sum(session_counts, axis=0),
+                     np.sum(session_counts**2, axis=0)])
+
+
+def _get_mean_and_variance(moments, num_sessions):
+    """Returns the feature expectation estimated from the moments of the
+    sessions' discounted feature counts, along with its variance.
+
+    Args:
+        moments (2D numpy.ndarray): Moments from `_get_moments`.
+        num_sessions (int): Number of sessions.
+
+    Returns:
+        (1D numpy.ndarray, 1D numpy.ndarray): Feature expectation, and the
+            variance of each of its elements.
+    """
+    mean = moments[0] / num_sessions
+    if num_sessions < 2:
+        return mean, np.full(mean.shape, np.inf)
+    scatter = np.maximum(moments[1] - num_sessions * mean**2, 0.)
+    return mean, scatter / (num_sessions * (num_sessions - 1))
@@ -1,10 +1,16 @@
+import sys
+
 from imitation_learning.irl import IRL
 
 
 def main():
-    """Executes the IRL algorithm for building a user simulation."""
+    """Executes the IRL algorithm for building a user simulation. If the path
+    of a checkpoint log is given, resumes the run recorded in it."""
     irl = IRL()
-    irl.run_irl()
+    if len(sys.argv) > 1:
+        irl.run_irl(sys.argv[1])
+    else:
+        irl.run_irl()
 
 
 if __name__ == '__main__':
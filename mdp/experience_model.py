@@ -0,0 +1,78 @@
+import numpy as np
+
+from utils.params import AgentActionType, UserActionType
+
+
+class ExperienceModel(object):
+    """Empirical model of the dialog from the user's point of view, learnt
+    from the logs of dialog sessions.
+
+    The user's state is the type of the agent's most recent action, so the
+    model counts how often each state-action pair of the user is followed by
+    each state. Unlike the `DialogModel`, it makes no assumption about the
+    agent, and it does not depend on the reward function.
+
+    Attributes:
+        counts (3D numpy.ndarray): Entry [s, a, t] is the number of times the
+            action with code a in the state with code s was followed by the
+            state with code t. The last entry along the third axis counts the
+            times the session ended instead.
+        num_sessions (int): Number of sessions learnt from.
+    """
+
+    def __init__(self):
+        self.num_states = len(AgentActionType)
+        self.num_actions = len(UserActionType)
+        self.counts = np.zeros((self.num_states, self.num_actions,
+                                self.num_states + 1))
+        self.num_sessions = 0
+
+    def add_session(self, state_codes, action_codes):
+        """Counts the transitions of a dialog session. Its last transition
+        ends the session.
+
+        Args:
+            state_codes (1D numpy.ndarray): Codes of the user's states, i.e.,
+                values of `AGENT_ACTION_CODES`.
+            action_codes (1D numpy.ndarray): Codes of the user's actions,
+                i.e., values of `USER_ACTION_CODES`.
+        """
+        state_codes = np.asarray(state_codes, dtype=int)
+        action_codes = np.asarray(action_codes, dtype=int)
+        next_state_codes = np.append(state_codes[1:], self.num_states)
+        np.add.at(self.counts, (state_codes, action_codes, next_state_codes),
+                  1.)
+        self.num_sessions += 1
+
+    def get_observed_pairs(self):
+        """Returns the state-action pairs that have been observed.
+
+        Returns:
+            list of (int, int): Codes of the states and actions.
+        """
+        return zip(*np.nonzero(self.counts.sum(axis=2)))
+
+    def get_predecessors(self):
+        """Returns the state-action pairs that have been observed to lead to
+        each state.
+
+        Returns:
+            list of list of (int, int): Codes of the states and actions of the
+                pairs leading to the state with code s, at index s.
+        """
+        return [zip(*np.nonzero(self.counts[:, :, state]))
+                for state in xrange(self.num_states)]
+
+    def get_probabilities(self):
+        """Returns the estimated probabilities of the states following each
+        state-action pair.
+
+        Returns:
+            3D numpy.ndarray: Entry [s, a, t] is the probability that the
+                action with code a in the state with code s is followed by the
+                state with code t. The last entry along the third axis is the
+                probability that the session ends. Pairs that have not been
+                observed have all-zero probabilities.
+        """
+        totals = self.counts.sum(axis=2, keepdims=True)
+        return self.counts / np.maximum(totals, 1.)
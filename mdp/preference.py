@@ -1,21 +1,37 @@
 import numpy as np
 
+from utils.params import AGENT_ACTION_CODES, USER_ACTION_CODES
+
 
 class Preference(object):
     """Prefernce class for MDP.
 
     Prefernce function is assumed to be a linear combination of the feature
     vector for the given state-action pair, parameterized by the weights
-    governing the linear combination.
+    governing the linear combination. The preferences of all state-action
+    pairs are computed whenever the weights are set.
 
     Attributes:
         features (UserFeature): Feature function for the RL agent (here user).
-        weights (numpy.array): Weights parameterizing the preference function.
+        table (2D numpy.ndarray): Preferences; entry [s, a] is for the state
+            with code s and the action with code a.
+        theta (numpy.array): Weights parameterizing the preference function.
+            Use `set_theta` to change them.
     """
 
     def __init__(self, features, theta=None):
         self.features = features
-        self.theta = self._initialize_theta(theta)
+        self.set_theta(self._initialize_theta(theta))
+
+    def set_theta(self, theta):
+        """Sets the weights and recomputes the preferences.
+
+        Args:
+            theta (numpy.array): Weights parameterizing the preference
+                function.
+        """
+        self.theta = theta
+        self.table = self.features.get_pair_values(theta)
 
     def get_preference(self, state, action):
         """Returns the preference for taking the action in the given state.
@@ -28,9 +44,7 @@ class Preference(object):
         Returns:
             float: Preference value for the state-action pair
         """
-
-        feature_vector = self.features.get_vector(state, action)
-        return np.dot(self.theta, feature_vector)
+        return self.table[AGENT_ACTION_CODES[state], USER_ACTION_CODES[action]]
 
     def _initialize_theta(self, theta):
         n = self.features.dimensions
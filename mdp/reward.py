@@ -1,4 +1,4 @@
-import numpy as np
+from utils.params import AGENT_ACTION_CODES, USER_ACTION_CODES
 
 
 class Reward(object):
@@ -6,16 +6,20 @@ class Reward(object):
 
     Reward function is assumed to be a linear combination of the feature
     vector for the given state-action pair, parameterized by the weights
-    governing the linear combination.
+    governing the linear combination. The rewards of all state-action pairs
+    are computed once, when the reward function is built.
 
     Attributes:
         features (UserFeature): Feature function for the RL agent (here user).
+        table (2D numpy.ndarray): Rewards; entry [s, a] is for the state with
+            code s and the action with code a.
         weights (numpy.array): Weights parameterizing the reward function.
     """
 
     def __init__(self, features, weights):
         self.features = features
         self.weights = weights
+        self.table = features.get_pair_values(weights)
 
     def get_reward(self, state, action):
         """Returns the reward for taking the action in the given state.
@@ -26,7 +30,6 @@ class Reward(object):
             action (UserActionType): Type of the action taken by the user.
 
         Returns:
-            TYPE: Description
+            float: Reward for the state-action pair.
         """
-        feature_vector = self.features.get_vector(state, action)
-        return np.dot(self.weights, feature_vector)
+        return self.table[AGENT_ACTION_CODES[state], USER_ACTION_CODES[action]]
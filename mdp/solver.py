@@ -1,12 +1,25 @@
+import heapq
 from abc import abstractmethod
 from copy import deepcopy
 import numpy as np
 
+from experience_model import ExperienceModel
 from reward import Reward
+from successor_features import SuccessorFeatures
+from imitation_learning.dialog_model import DialogModel
+from imitation_learning.batch_dialog_session import BatchDialogSession
 from imitation_learning.dialog_session import DialogSession
+from utils.params import AGENT_ACTION_CODES, USER_ACTION_CODES
 from utils.params import AgentActionType, UserActionType
 from utils.params import EPSILON, EPSILON_DECAY_RATE, GAMMA
 from utils.params import Q_DECAY_RATE, Q_LEARNING_EPISODES, Q_LEARNING_RATE
+from utils.params import Q_CONVERGENCE_TOLERANCE, Q_CONVERGENCE_WINDOW
+from utils.params import POLICY_ITERATION_STEPS
+from utils.params import SARSA_LAMBDA, SARSA_LAMBDA_EPISODES, SOLVER_LANES
+from utils.params import SWEEPING_EPISODES, SWEEPING_PLANNING_STEPS
+from utils.params import SWEEPING_THRESHOLD
+from utils.metrics import count_simulated
+from utils.utils import get_random_state
 
 
 class MDPSolver(object):
@@ -18,6 +31,8 @@ class MDPSolver(object):
     Attributes:
         agent (:obj: Agent): The dialog agent, which acts as the environment
             for the MDP solver.
+        num_episodes_used (int): Number of dialog sessions run by the last
+            call of `solve`; 0 for solvers which run none.
         reward (:obj: Reward): The Reward function.
         user (:obj: User): The dialog user, which acts as the RL agent for
             which a near-optimal policy is desired under the given reward
@@ -31,11 +46,85 @@ class MDPSolver(object):
         self.agent = agent
         self.weights = weights
         self.reward = Reward(self.user.features, self.weights)
+        self.num_episodes_used = 0
 
     @abstractmethod
     def solve(self):
         pass
 
+    def _get_reward_scale(self):
+        """Returns the largest absolute reward, or 1 if all rewards are 0."""
+        scale = np.max(np.abs(self.reward.table))
+        return scale if scale > 0 else 1.
+
+    def warm_start(self, q, policy):
+        """Starts solving from the Q-values and the policy learnt under a
+        similar reward function, e.g., in the previous iteration of IRL.
+        Must be called before `solve`.
+
+        By default, the given Q-values replace those the solver starts with,
+        if it keeps any, and the policy is ignored. The learning rate and the
+        degree of randomness are left as they are, so that the greedy policy
+        can still move away from the given one.
+
+        Args:
+            q (dict): Q-value function, with the same structure as the
+                `UserPolicy.policy` attribute.
+            policy (UserPolicy): Policy learnt along with `q`.
+        """
+        for state, q_values in q.iteritems():
+            if state in self.q:
+                self.q[state][:] = q_values
+
+
+class QValueConvergence(object):
+    """Detector of the convergence of Q-values learnt episode by episode.
+
+    The Q-values have converged once, for `window` consecutive episodes, none
+    of them changed by more than `tolerance` per unit of learning rate, and
+    the greedy action of every state stayed the same. Dividing by the
+    learning rate tests the TD errors themselves: the changes of the Q-values
+    shrink along with a decaying learning rate whether they converged or not.
+
+    Attributes:
+        num_stable (int): Number of consecutive episodes over which the
+            Q-values were stable.
+        tolerance (float): Largest change of a stable Q-value, per unit of
+            learning rate.
+        window (int): Number of stable episodes required.
+    """
+
+    def __init__(self, window=Q_CONVERGENCE_WINDOW,
+                 tolerance=Q_CONVERGENCE_TOLERANCE):
+        self.window = window
+        self.tolerance = tolerance
+        self.num_stable = 0
+        self._q_table = None
+
+    def update(self, q, step_size=1.):
+        """Records the Q-values at the end of an episode.
+
+        Args:
+            q (dict): Q-value function, with the same structure as the
+                `UserPolicy.policy` attribute.
+            step_size (float, optional): Learning rate used during the
+                episode; 1 for full backups.
+
+        Returns:
+            bool: True if the Q-values have converged.
+        """
+        q_table = np.array([q[state] for state in AgentActionType])
+        if self._q_table is not None:
+            change = np.max(np.abs(q_table - self._q_table)) / step_size
+            same_greedy = np.array_equal(np.argmax(q_table, axis=1),
+                                         np.argmax(self._q_table, axis=1))
+            if change <= self.tolerance and same_greedy:
+                self.num_stable += 1
+            else:
+                self.num_stable = 0
+        self._q_table = q_table
+        return self.num_stable >= self.window
+
 
 class QLearningSolver(MDPSolver):
     """Q-Learning class for solving an MDP.
@@ -44,16 +133,19 @@ class QLearningSolver(MDPSolver):
         alpha (float): Learning rate
         epsilon (float): Degree of randomness in policy.
         gamma (float): Discount factor
+        max_episodes (int): Maximum number of episodes to run, if the
+            Q-values don't converge earlier.
         q (dict): Q-value function. The structure of this function should
             be exactly same as that of the `UserPolicy.poliy` attribute.
     """
 
-    def __init__(self, user, agent, weights):
+    def __init__(self, user, agent, weights, max_episodes=Q_LEARNING_EPISODES):
         super(QLearningSolver, self).__init__(user, agent, weights)
 
         self.alpha = Q_LEARNING_RATE
         self.gamma = GAMMA
         self.epsilon = EPSILON
+        self.max_episodes = max_episodes
         self.q = {}
 
         self._initialize_q_values()
@@ -61,7 +153,11 @@ class QLearningSolver(MDPSolver):
     def solve(self):
         """Executes Q-learning to learn a near-optimal policy for the MDP.
         """
-        for _ in xrange(Q_LEARNING_EPISODES):
+        num_turns = 0
+        convergence = QValueConvergence(
+            tolerance=Q_CONVERGENCE_TOLERANCE * self._get_reward_scale())
+        self.num_episodes_used = 0
+        while self.num_episodes_used < self.max_episodes:
             # Reset the agent and the user.
             self.user.reset()
             self.agent.reset()
@@ -83,14 +179,20 @@ class QLearningSolver(MDPSolver):
             while not (curr_state is AgentActionType.CLOSE and
                        action is UserActionType.CLOSE):
                 action, next_state = session.execute_one_step()
+                num_turns += 1
                 reward = self.reward.get_reward(curr_state, action)
                 self._update_q_value(curr_state, action, next_state, reward)
                 curr_state = next_state
 
+            self.num_episodes_used += 1
+            converged = convergence.update(self.q, self.alpha)
             # Decay the learning rate.
             self.alpha *= Q_DECAY_RATE
             # Decay the degree of randomness.
             self.epsilon *= EPSILON_DECAY_RATE
+            if converged:
+                break
+        count_simulated(self.num_episodes_used, num_turns)
 
     def _initialize_q_values(self):
         """Initializes Q-values.
@@ -127,16 +229,19 @@ class SarsaSolver(MDPSolver):
         alpha (float): Learning rate
         epsilon (float): Degree of randomness in policy.
         gamma (float): Discount factor
+        max_episodes (int): Maximum number of episodes to run, if the
+            Q-values don't converge earlier.
         q (dict): Q-value function. The structure of this function should
             be exactly same as that of the `UserPolicy.poliy` attribute.
     """
 
-    def __init__(self, user, agent, weights):
+    def __init__(self, user, agent, weights, max_episodes=Q_LEARNING_EPISODES):
         super(SarsaSolver, self).__init__(user, agent, weights)
 
         self.alpha = Q_LEARNING_RATE
         self.gamma = GAMMA
         self.epsilon = EPSILON
+        self.max_episodes = max_episodes
         self.q = {}
 
         self._initialize_q_values()
@@ -144,7 +249,11 @@ class SarsaSolver(MDPSolver):
     def solve(self):
         """Executes Q-learning to learn a near-optimal policy for the MDP.
         """
-        for _ in xrange(Q_LEARNING_EPISODES):
+        num_turns = 0
+        convergence = QValueConvergence(
+            tolerance=Q_CONVERGENCE_TOLERANCE * self._get_reward_scale())
+        self.num_episodes_used = 0
+        while self.num_episodes_used < self.max_episodes:
             # Reset the agent and the user.
             self.user.reset()
             self.agent.reset()
@@ -166,16 +275,22 @@ class SarsaSolver(MDPSolver):
             while not (curr_state is AgentActionType.CLOSE and
                        action is UserActionType.CLOSE):
                 action, next_state = session.execute_one_step()
+                num_turns += 1
                 reward = self.reward.get_reward(curr_state, action)
                 # print curr_state, action, next_state, reward
                 # raw_input()
                 self._update_q_value(curr_state, action, next_state, reward)
                 curr_state = next_state
 
+            self.num_episodes_used += 1
+            converged = convergence.update(self.q, self.alpha)
             # Decay the learning rate.
             self.alpha *= Q_DECAY_RATE
             # Decay the degree of randomness.
             self.epsilon *= EPSILON_DECAY_RATE
+            if converged:
+                break
+        count_simulated(self.num_episodes_used, num_turns)
         self.user.policy.remove_epsilon_exploration(self.epsilon / EPSILON_DECAY_RATE)
 
     def _initialize_q_values(self):
@@ -210,3 +325,552 @@ class SarsaSolver(MDPSolver):
         td_error = reward + self.gamma * \
             next_q_value - self.q[state][action_ix]
         self.q[state][action_ix] += self.alpha * td_error
+
+
+class SarsaLambdaSolver(MDPSolver):
+    """SARSA(lambda) class for solving an MDP.
+
+    The Q-values and the eligibility traces are dense arrays whose entry
+    [s, a] is for the state with code s and the action with code a. Every
+    turn decays all traces, replaces the trace of the pair just visited and
+    moves every Q-value by its trace times the TD error, so that the reward
+    of a turn reaches all the pairs visited earlier in the session at once.
+    The TD target is the expected Q-value of the next state under the
+    current policy (expected SARSA), since the user samples its next action
+    on its own.
+
+    Attributes:
+        alpha (float): Learning rate
+        epsilon (float): Degree of randomness in policy.
+        gamma (float): Discount factor
+        lambda_ (float): Decay rate of the eligibility traces.
+        max_episodes (int): Maximum number of episodes to run, if the
+            Q-values don't converge earlier.
+        q (dict): Q-value function, with the same structure as the
+            `UserPolicy.policy` attribute. Its values are views of the rows
+            of `q_table`.
+        q_table (2D numpy.ndarray): Q-values.
+        traces (2D numpy.ndarray): Eligibility traces.
+    """
+
+    def __init__(self, user, agent, weights, lambda_=SARSA_LAMBDA,
+                 max_episodes=SARSA_LAMBDA_EPISODES):
+        super(SarsaLambdaSolver, self).__init__(user, agent, weights)
+
+        self.alpha = Q_LEARNING_RATE
+        self.gamma = GAMMA
+        self.epsilon = EPSILON
+        self.lambda_ = lambda_
+        self.max_episodes = max_episodes
+
+        shape = (len(AgentActionType), len(self.user.policy.actions))
+        self.q_table = np.zeros(shape)
+        self.traces = np.zeros(shape)
+        self.q = {state: self.q_table[AGENT_ACTION_CODES[state]]
+                  for state in AgentActionType}
+
+    def solve(self):
+        """Executes SARSA(lambda) to learn a near-optimal policy for the MDP.
+        """
+        rewards = self.reward.table
+        decay = self.gamma * self.lambda_
+        num_turns = 0
+        convergence = QValueConvergence(
+            tolerance=Q_CONVERGENCE_TOLERANCE * self._get_reward_scale())
+        self.num_episodes_used = 0
+        while self.num_episodes_used < self.max_episodes:
+            self.user.reset()
+            self.agent.reset()
+            session = DialogSession(self.user, self.agent)
+            self.user.policy.build_policy_from_q_values(self.q, self.epsilon)
+            policy = self.user.policy.get_policy_matrix()
+            self.traces.fill(0.)
+
+            state = AGENT_ACTION_CODES[session.ask_agent_to_start()]
+            action = None
+            close = (AGENT_ACTION_CODES[AgentActionType.CLOSE],
+                     USER_ACTION_CODES[UserActionType.CLOSE])
+            while (state, action) != close:
+                action_type, next_state_type = session.execute_one_step()
+                num_turns += 1
+                action = USER_ACTION_CODES[action_type]
+                next_state = AGENT_ACTION_CODES[next_state_type]
+
+                expected_q_value = np.dot(policy[next_state],
+                                          self.q_table[next_state])
+                td_error = (rewards[state, action] +
+                            self.gamma * expected_q_value -
+                            self.q_table[state, action])
+                self.traces *= decay
+                self.traces[state, action] = 1.
+                self.q_table += (self.alpha * td_error) * self.traces
+                state = next_state
+
+            self.num_episodes_used += 1
+            converged = convergence.update(self.q, self.alpha)
+            # Decay the learning rate.
+            self.alpha *= Q_DECAY_RATE
+            # Decay the degree of randomness.
+            self.epsilon *= EPSILON_DECAY_RATE
+            if converged:
+                break
+        count_simulated(self.num_episodes_used, num_turns)
+        self.user.policy.remove_epsilon_exploration(
+            self.epsilon / EPSILON_DECAY_RATE)
+
+
+class BatchSarsaSolver(MDPSolver):
+    """Expected-SARSA solver which runs many episodes at once in the lanes of
+    a `BatchDialogSession`, against a shared Q-value table.
+
+    Every step takes one turn in each active lane and applies the TD updates
+    of all lanes with a single scatter-add, moving each Q-value by the mean
+    TD error of the lanes that visited its pair, after which the
+    epsilon-greedy policy is rebuilt from the Q-values. A lane whose session
+    ends starts the next episode right away, until `max_episodes` have been
+    started or the Q-values have converged, so the number of steps grows with
+    the length of the episodes rather than their number. Convergence is
+    checked after every step in which episodes end. The learning rate and the
+    degree of randomness decay with the number of episodes completed, as in
+    `SarsaSolver`.
+
+    Attributes:
+        alpha (float): Learning rate
+        epsilon (float): Degree of randomness in policy.
+        gamma (float): Discount factor
+        max_episodes (int): Maximum number of episodes to run, if the
+            Q-values don't converge earlier.
+        num_lanes (int): Number of episodes run at once.
+        q (dict): Q-value function, with the same structure as the
+            `UserPolicy.policy` attribute. Its values are views of the rows
+            of `q_table`.
+        q_table (2D numpy.ndarray): Q-values.
+    """
+
+    def __init__(self, user, agent, weights, num_lanes=SOLVER_LANES,
+                 max_episodes=Q_LEARNING_EPISODES):
+        super(BatchSarsaSolver, self).__init__(user, agent, weights)
+
+        self.alpha = Q_LEARNING_RATE
+        self.gamma = GAMMA
+        self.epsilon = EPSILON
+        self.num_lanes = num_lanes
+        self.max_episodes = max_episodes
+
+        self.q_table = np.zeros((len(AgentActionType),
+                                 len(self.user.policy.actions)))
+        self.q = {state: self.q_table[AGENT_ACTION_CODES[state]]
+                  for state in AgentActionType}
+
+    def solve(self):
+        """Executes expected SARSA in lockstep episodes to learn a
+        near-optimal policy for the MDP.
+        """
+        rewards = self.reward.table
+        random = get_random_state(self.user.random_state)
+        policy = self._get_epsilon_greedy_policy(random)
+        session = BatchDialogSession(
+            self.user.policy, min(self.num_lanes, self.max_episodes),
+            random_state=self.user.random_state)
+        session.set_policy_matrices([policy])
+        convergence = QValueConvergence(
+            tolerance=Q_CONVERGENCE_TOLERANCE * self._get_reward_scale())
+        max_episodes = self.max_episodes
+        num_started = session.num_sessions
+        num_completed = 0
+
+        while session.active.any():
+            lanes, states, actions, next_states = session.step()
+
+            # Sessions that end have no value afterwards.
+            continuing = next_states >= 0
+            next_values = np.zeros(lanes.size)
+            next_values[continuing] = np.sum(
+                policy[next_states[continuing]] *
+                self.q_table[next_states[continuing]], axis=1)
+            td_errors = (rewards[states, actions] +
+                         self.gamma * next_values -
+                         self.q_table[states, actions])
+
+            pairs = (states.astype(np.intp) * self.q_table.shape[1] +
+                     actions)
+            sums = np.bincount(pairs, weights=td_errors,
+                               minlength=self.q_table.size)
+            counts = np.bincount(pairs, minlength=self.q_table.size)
+            self.q_table += (self.alpha * sums /
+                             np.maximum(counts, 1)).reshape(self.q_table.shape)
+
+            # Decay the learning rate and the degree of randomness once per
+            # completed episode, and start new episodes in the free lanes.
+            ended = lanes[~continuing]
+            # Once the Q-values converge, the running episodes are finished
+            # but no new ones are started.
+            if ended.size and convergence.update(self.q, self.alpha):
+                max_episodes = num_started
+            num_completed += ended.size
+            self.alpha = Q_LEARNING_RATE * Q_DECAY_RATE**num_completed
+            self.epsilon = EPSILON * EPSILON_DECAY_RATE**num_completed
+            restarting = ended[:max(max_episodes - num_started, 0)]
+            session.reset(restarting)
+            num_started += restarting.size
+
+            policy = self._get_epsilon_greedy_policy(random)
+            session.set_policy_matrices([policy])
+
+        self.num_episodes_used = num_started
+        self.user.policy.build_policy_from_q_values(self.q, 0.)
+
+    def _get_epsilon_greedy_policy(self, random):
+        """Returns the epsilon-greedy policy derived from the Q-values, built
+        the same way as by `UserPolicy.build_policy_from_q_values`.
+
+        Args:
+            random (numpy.random.RandomState or module): Source of randomness
+                for breaking ties between the best actions.
+
+        Returns:
+            2D numpy.ndarray: Action probabilities; row s is for the state
+                with code s.
+        """
+        num_states, num_actions = self.q_table.shape
+        best = self.q_table == np.max(self.q_table, axis=1)[:, None]
+        tie_breaks = np.where(best, random.random_sample(best.shape), -1.)
+        greedy = np.argmax(tie_breaks, axis=1)
+
+        policy = np.full((num_states, num_actions), self.epsilon)
+        policy[np.arange(num_states), greedy] += (1. -
+                                                 num_actions * self.epsilon)
+        bad_close = AGENT_ACTION_CODES[AgentActionType.BAD_CLOSE]
+        policy[bad_close] = 0.
+        policy[bad_close, USER_ACTION_CODES[UserActionType.CLOSE]] = 1.
+        return policy
+
+
+class PrioritizedSweepingSolver(MDPSolver):
+    """Model-based solver which learns an `ExperienceModel` of the dialog from
+    real dialog sessions, and plans on it with prioritized sweeping.
+
+    After each session, the Q-values of the pairs it visited are backed up
+    from the model, and so are, in decreasing order of the change expected,
+    those of the pairs leading to states whose values changed. Since the
+    model does not depend on the reward function, it is shared across
+    solvers, e.g., across the iterations of IRL: a new solver starts by
+    planning on everything seen so far before running any session.
+
+    Attributes:
+        epsilon (float): Degree of randomness in policy.
+        gamma (float): Discount factor
+        max_episodes (int): Maximum number of real sessions to run, if the
+            Q-values don't converge earlier.
+        model (ExperienceModel): Model of the dialog.
+        num_backups (int): Number of planning updates made while solving.
+        planning_steps (int): Maximum number of planning updates after each
+            session.
+        q (dict): Q-value function, with the same structure as the
+            `UserPolicy.policy` attribute. Its values are views of the rows
+            of `q_table`.
+        q_table (2D numpy.ndarray): Q-values.
+        threshold (float): Smallest change of a Q-value worth a planning
+            update.
+    """
+
+    _shared_model = None
+
+    def __init__(self, user, agent, weights, model=None,
+                 max_episodes=SWEEPING_EPISODES,
+                 planning_steps=SWEEPING_PLANNING_STEPS,
+                 threshold=SWEEPING_THRESHOLD):
+        """Class constructor
+
+        Args:
+            model (ExperienceModel, optional): Model of the dialog. By
+                default, a model shared by all solvers is used.
+        """
+        super(PrioritizedSweepingSolver, self).__init__(user, agent, weights)
+
+        if model is None:
+            model = self.get_shared_model()
+        self.model = model
+        self.gamma = GAMMA
+        self.epsilon = EPSILON
+        self.max_episodes = max_episodes
+        self.planning_steps = planning_steps
+        self.threshold = threshold
+        self.num_backups = 0
+
+        self.q_table = np.zeros((len(AgentActionType),
+                                 len(self.user.policy.actions)))
+        self.q = {state: self.q_table[AGENT_ACTION_CODES[state]]
+                  for state in AgentActionType}
+
+    @classmethod
+    def get_shared_model(cls):
+        """Returns the model shared by all solvers, creating it on first use.
+
+        Returns:
+            ExperienceModel: The shared model.
+        """
+        if cls._shared_model is None:
+            cls._shared_model = ExperienceModel()
+        return cls._shared_model
+
+    def solve(self):
+        """Executes prioritized sweeping to learn a near-optimal policy for
+        the MDP.
+        """
+        rewards = self.reward.table
+        self._sweep(self.model.get_observed_pairs(), rewards)
+        convergence = QValueConvergence(
+            tolerance=Q_CONVERGENCE_TOLERANCE * self._get_reward_scale())
+        convergence.update(self.q)
+        self.num_episodes_used = 0
+        while self.num_episodes_used < self.max_episodes:
+            self.user.reset()
+            self.agent.reset()
+            session = DialogSession(self.user, self.agent)
+            self.user.policy.build_policy_from_q_values(self.q, self.epsilon)
+            session.start()
+
+            state_codes = session.state_codes[:session.num_turns]
+            action_codes = session.action_codes[:session.num_turns]
+            self.model.add_session(state_codes, action_codes)
+            self._sweep(set(zip(state_codes, action_codes)), rewards)
+
+            # Decay the degree of randomness.
+            self.epsilon *= EPSILON_DECAY_RATE
+            self.num_episodes_used += 1
+            if convergence.update(self.q):
+                break
+        self.user.policy.build_policy_from_q_values(self.q, 0.)
+
+    def _sweep(self, pairs, rewards):
+        """Makes planning updates, starting from the given state-action pairs
+        and moving on to the predecessors of the states whose values change,
+        in decreasing order of the change of their Q-values.
+
+        Args:
+            pairs (iterable of (int, int)): Codes of the states and actions.
+            rewards (2D numpy.ndarray): Reward of each state-action pair.
+        """
+        # The model does not change during a sweep. Sessions that end have
+        # no value afterwards.
+        probabilities = self.model.get_probabilities()[:, :, :-1]
+        predecessors = self.model.get_predecessors()
+        values = np.max(self.q_table, axis=1)
+        q_table = self.q_table
+        gamma = self.gamma
+
+        queue = []
+
+        def push(state, action):
+            backup = (rewards[state, action] + gamma *
+                      np.dot(probabilities[state, action], values))
+            change = abs(backup - q_table[state, action])
+            if change > self.threshold:
+                heapq.heappush(queue, (-change, state, action))
+
+        for state, action in pairs:
+            push(state, action)
+        for _ in xrange(self.planning_steps):
+            if not queue:
+                break
+            _, state, action = heapq.heappop(queue)
+            q_table[state, action] = (
+                rewards[state, action] +
+                gamma * np.dot(probabilities[state, action], values))
+            values[state] = np.max(q_table[state])
+            self.num_backups += 1
+            for prev_state, prev_action in predecessors[state]:
+                push(prev_state, prev_action)
+
+
+class PolicyIterationSolver(MDPSolver):
+    """Model-based solver which runs policy iteration on the `DialogModel`.
+
+    The user only observes the type of the agent's most recent action, so
+    policies are restricted to depend on it alone. Each policy is evaluated
+    exactly on the configurations of the `DialogModel`, and the Q-values of
+    configurations sharing the same `AgentActionType` are averaged, weighted
+    by the discounted number of visits under the policy. The policy is then
+    made greedy with respect to the averaged Q-values. Sessions end once the
+    user has responded to the agent's close, just as in `DialogSession`; the
+    `MAX_DIALOG_STEPS` cutoff is ignored.
+
+    Attributes:
+        gamma (float): Discount factor
+        initial_policy (2D numpy.ndarray): Policy to start from, or None to
+            start from a uniformly random policy.
+        model (DialogModel): Model of the dialog.
+        num_steps (int): Number of policy-iteration steps executed.
+        q (dict): Q-value function. The structure of this function should
+            be exactly same as that of the `UserPolicy.poliy` attribute.
+    """
+
+    def __init__(self, user, agent, weights):
+        super(PolicyIterationSolver, self).__init__(user, agent, weights)
+
+        self.gamma = GAMMA
+        self.model = DialogModel.get_model()
+        self.initial_policy = None
+        self.num_steps = 0
+        self.q = {}
+
+    def warm_start(self, q, policy):
+        """Starts policy iteration from the given policy; the Q-values are
+        recomputed exactly, so the given ones are ignored.
+
+        Args:
+            q (dict): Q-value function learnt along with `policy`.
+            policy (UserPolicy): Policy to start from.
+        """
+        self.initial_policy = policy.get_policy_matrix()
+
+    def solve(self):
+        """Executes policy iteration to learn the optimal policy for the MDP.
+        """
+        states = [state for state in AgentActionType]
+        rewards = self.reward.table
+        config_rewards = rewards[self.model.config_states]
+
+        # Start with a uniformly random policy, unless warm started.
+        if self.initial_policy is not None:
+            policy = self.initial_policy
+        else:
+            policy = np.ones(rewards.shape) / rewards.shape[1]
+        q_values = self._evaluate(policy, config_rewards)
+        self.num_steps = 0
+        for self.num_steps in xrange(1, POLICY_ITERATION_STEPS + 1):
+            greedy_policy = self._improve(policy, q_values)
+            if np.array_equal(greedy_policy, policy):
+                break
+            policy = greedy_policy
+            q_values = self._evaluate(policy, config_rewards)
+
+        self.q = {state: q_values[i] for i, state in enumerate(states)}
+        self.user.policy.build_policy_from_q_values(self.q, 0.)
+
+    def _evaluate(self, policy, config_rewards):
+        """Calculates the Q-values of a policy.
+
+        Args:
+            policy (2D numpy.ndarray): Probabilities of the user's actions;
+                row s is for the state with code s.
+            config_rewards (2D numpy.ndarray): Rewards of the user's actions
+                in each configuration of the dialog model.
+
+        Returns:
+            2D numpy.ndarray: Q-values; row s is for the state with code s.
+        """
+        model = self.model
+        probabilities = policy[model.config_states]
+        chain = model.get_chain(probabilities)
+        system = np.eye(model.num_configs) - self.gamma * chain
+
+        # Value of each configuration, and Q-value of each of its actions.
+        values = np.linalg.solve(
+            system, np.sum(probabilities * config_rewards, axis=1))
+        config_q_values = config_rewards + self.gamma * np.einsum(
+            'cad,d->ca', model.transitions, values)
+
+        visits = model.get_discounted_visits(chain, self.gamma)
+        return model.average_over_states(config_q_values, visits)
+
+    def _improve(self, policy, q_values):
+        """Returns the deterministic policy that is greedy with respect to the
+        Q-values. Ties are broken in favour of the action preferred by the
+        current policy, and then in favour of the first action.
+
+        Args:
+            policy (2D numpy.ndarray): Current policy.
+            q_values (2D numpy.ndarray): Q-values of the current policy.
+
+        Returns:
+            2D numpy.ndarray: Greedy policy.
+        """
+        greedy_policy = np.zeros(policy.shape)
+        for state in xrange(policy.shape[0]):
+            best = np.flatnonzero(q_values[state] == np.max(q_values[state]))
+            current = best[policy[state][best] == np.max(policy[state][best])]
+            greedy_policy[state][current[0]] = 1.
+        return greedy_policy
+
+
+class SuccessorFeatureSolver(MDPSolver):
+    """Solver which derives policies from the successor features of previously
+    learnt policies, using generalized policy improvement (GPI).
+
+    The Q-values under the given reward function are the highest among the
+    stored policies, each being a single dot product of the policy's
+    successor features with the weight vector. The greedy policy is stored
+    in turn, and GPI is repeated until the greedy policy is one that's already
+    stored. The successor features are shared across solvers, so that new
+    weight vectors only cost solves for policies that haven't been seen
+    before.
+
+    Attributes:
+        num_new_policies (int): Number of policies added to the store while
+            solving.
+        q (dict): Q-value function. The structure of this function should
+            be exactly same as that of the `UserPolicy.poliy` attribute.
+        successor_features (SuccessorFeatures): Store of policies and their
+            successor features.
+    """
+
+    _shared_successor_features = None
+
+    def __init__(self, user, agent, weights, successor_features=None):
+        """Class constructor
+
+        Args:
+            successor_features (SuccessorFeatures, optional): Store of policies
+                and their successor features. By default, a store shared by
+                all solvers is used.
+        """
+        super(SuccessorFeatureSolver, self).__init__(user, agent, weights)
+
+        if successor_features is None:
+            successor_features = self.get_shared_successor_features(
+                self.user.features)
+        self.successor_features = successor_features
+        self.num_new_policies = 0
+        self.q = {}
+
+    @classmethod
+    def get_shared_successor_features(cls, features):
+        """Returns the store of successor features shared by all solvers,
+        creating it on first use.
+
+        Args:
+            features (UserFeatures): Feature function for the user.
+
+        Returns:
+            SuccessorFeatures: The shared store.
+        """
+        if cls._shared_successor_features is None:
+            cls._shared_successor_features = SuccessorFeatures(features)
+        return cls._shared_successor_features
+
+    def solve(self):
+        """Executes generalized policy improvement to learn a policy for the
+        MDP.
+        """
+        store = self.successor_features
+        states = [state for state in AgentActionType]
+        num_actions = len(self.user.policy.actions)
+
+        # Start with a uniformly random policy.
+        if len(store) == 0:
+            store.add_policy(np.ones((len(states), num_actions)) / num_actions)
+
+        for _ in xrange(POLICY_ITERATION_STEPS):
+            q_values = store.get_q_values(self.weights)
+            greedy_policy = np.zeros(q_values.shape)
+            greedy_policy[np.arange(len(states)),
+                          np.argmax(q_values, axis=1)] = 1.
+            _, is_new = store.add_policy(greedy_policy)
+            if not is_new:
+                break
+            self.num_new_policies += 1
+
+        self.q = {state: q_values[i] for i, state in enumerate(states)}
+        self.user.policy.build_policy_from_q_values(self.q, 0.)
@@ -0,0 +1,107 @@
+import numpy as np
+
+from imitation_learning.dialog_log import get_feature_tensor
+from imitation_learning.dialog_model import DialogModel
+from utils.params import GAMMA
+
+
+class SuccessorFeatures(object):
+    """Successor features of a set of user policies.
+
+    The successor features psi(s, a) of a policy are the expected discounted
+    sum of feature vectors obtained by taking action a in state s and
+    following the policy thereafter. Since rewards are linear in the features,
+    the Q-values of the policy under any weight vector w are psi(s, a) . w.
+    The successor features are computed exactly on the `DialogModel`, and the
+    values of configurations sharing the same user state are averaged,
+    weighted by their discounted number of visits.
+
+    Attributes:
+        features (UserFeatures): Feature function for the RL agent (here user).
+        gamma (float): Discount factor
+        model (DialogModel): Model of the dialog.
+        policies (list of 2D numpy.ndarray): Stored policies; row s of each
+            contains the action probabilities in the state with code s.
+        psi (4D numpy.ndarray): Successor features. Entry [i, s, a] is the
+            successor feature vector of the i-th policy for the state with
+            code s and the action with code a.
+    """
+
+    def __init__(self, features, gamma=GAMMA):
+        self.features = features
+        self.gamma = gamma
+        self.model = DialogModel.get_model()
+        self._feature_tensor = get_feature_tensor(features)
+        self._config_features = self._feature_tensor[self.model.config_states]
+        self._index = {}
+        self.policies = []
+        self.psi = np.zeros((0,) + self._feature_tensor.shape)
+
+    def __len__(self):
+        return len(self.policies)
+
+    def add_policy(self, policy):
+        """Stores a policy along with its successor features, unless an
+        identical policy is already stored.
+
+        Args:
+            policy (2D numpy.ndarray): Action probabilities; row s is for the
+                state with code s.
+
+        Returns:
+            (int, bool): Index of the policy, and whether it was new.
+        """
+        policy = np.asarray(policy, dtype=float)
+        key = policy.tostring()
+        if key in self._index:
+            return self._index[key], False
+
+        psi = self._compute_successor_features(policy)
+        self._index[key] = len(self.policies)
+        self.policies.append(policy)
+        self.psi = np.concatenate((self.psi, psi[None]))
+        return self._index[key], True
+
+    def get_q_values(self, weights):
+        """Returns the Q-values obtained by generalized policy improvement,
+        i.e., the highest Q-value among the stored policies, for one or many
+        weight vectors.
+
+        Args:
+            weights (numpy.ndarray): Weight vector parameterizing the reward
+                function, or a 2D array with one weight vector per column.
+
+        Returns:
+            numpy.ndarray: Q-values; entry [s, a] is for the state with code s
+                and action with code a. A third axis runs over the weight
+                vectors if more than one is given.
+        """
+        assert len(self.policies) > 0, "No policy has been stored"
+        return np.max(np.dot(self.psi, weights), axis=0)
+
+    def _compute_successor_features(self, policy):
+        """Computes the successor features of a policy.
+
+        Args:
+            policy (2D numpy.ndarray): Action probabilities; row s is for the
+                state with code s.
+
+        Returns:
+            3D numpy.ndarray: Successor features; entry [s, a] is for the
+                state with code s and action with code a.
+        """
+        model = self.model
+        probabilities = policy[model.config_states]
+        chain = model.get_chain(probabilities)
+        system = np.eye(model.num_configs) - self.gamma * chain
+
+        # Successor features of each configuration, and of each of its
+        # actions.
+        expected_features = np.einsum('ca,cak->ck', probabilities,
+                                      self._config_features)
+        config_psi = np.linalg.solve(system, expected_features)
+        config_action_psi = self._config_features + self.gamma * np.einsum(
+            'cad,dk->cak', model.transitions, config_psi)
+
+        visits = model.get_discounted_visits(chain, self.gamma)
+        return model.average_over_states(config_action_psi, visits)
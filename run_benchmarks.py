@@ -0,0 +1,133 @@
+"""Benchmarks the hot paths of the simulation, the solvers and IRL.
+
+Every combination of case, number of slots and number of sessions is run in
+its own process, so that `NUM_SLOTS` and the numbers of sessions can be set
+before the code under test reads them, and so that the peak memory is that
+of the case alone. The number of sessions sets `NUM_SESSIONS_FE` and
+`Q_LEARNING_EPISODES`, as well as the sessions run by the session cases.
+
+Usage:
+    python run_benchmarks.py [--cases CASE ...] [--num-slots N ...]
+        [--sessions N ...] [--output results.json]
+        [--baseline baseline.json] [--threshold 0.1]
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.harness import compare, run_case
+
+CASE_NAMES = ["agent_take_turn", "user_take_turn", "dialog_session",
+              "compiled_dialog_session", "calc_feature_expectation",
+              "sarsa_solve", "batch_sarsa_solve", "irl_iteration",
+              "solve_qp"]
+
+
+def run_worker(case, num_slots, num_sessions, repeat, warmup, seed):
+    """Runs a single benchmark configuration in this process.
+
+    Returns:
+        dict: The benchmark result.
+    """
+    # The parameters must be set before anything reads them.
+    from utils import params
+    params.NUM_SLOTS = num_slots
+    params.NUM_SESSIONS_FE = num_sessions
+    params.Q_LEARNING_EPISODES = num_sessions
+    # Build the transition tables rather than leave them in the working
+    # directory.
+    params.TRANSITION_TABLE_DIR = None
+
+    import numpy as np
+    from benchmarks import cases
+    cases.disable_caches()
+
+    np.random.seed(seed)
+    directory = tempfile.mkdtemp()
+    try:
+        operation = cases.CASES[case](num_sessions, directory)
+        result = run_case(operation, repeat, warmup)
+    finally:
+        shutil.rmtree(directory)
+    result.update({"case": case, "num_slots": num_slots,
+                   "num_sessions": num_sessions, "repeat": repeat,
+                   "seed": seed})
+    return result
+
+
+def run_benchmarks(args):
+    """Runs every benchmark configuration in a separate process.
+
+    Returns:
+        list of dict: The benchmark results.
+    """
+    results = []
+    for num_slots in args.num_slots:
+        for num_sessions in args.sessions:
+            for case in args.cases:
+                command = [sys.executable, __file__, "--worker", case,
+                           "--num-slots", str(num_slots),
+                           "--sessions", str(num_sessions),
+                           "--repeat", str(args.repeat),
+                           "--warmup", str(args.warmup),
+                           "--seed", str(args.seed)]
+                output = subprocess.check_output(command)
+                result = json.loads(output.splitlines()[-1])
+                results.append(result)
+                sys.stderr.write(
+                    "{case} NUM_SLOTS={num_slots} sessions={num_sessions}: "
+                    "{sessions_per_s:.1f} sessions/s, p50 {p50:.3f} ms\n"
+                    .format(p50=result["latency_ms"]["p50"], **result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=CASE_NAMES,
+                        default=CASE_NAMES)
+    parser.add_argument("--num-slots", nargs="+", type=int, default=[3])
+    parser.add_argument("--sessions", nargs="+", type=int, default=[100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="tolerated relative loss of throughput or "
+                             "latency")
+    parser.add_argument("--memory-threshold", type=float, default=0.2,
+                        help="tolerated relative rise of peak memory")
+    parser.add_argument("--worker", choices=CASE_NAMES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.worker, args.num_slots[0], args.sessions[0],
+                            args.repeat, args.warmup, args.seed)
+        print json.dumps(result)
+        return
+
+    results = run_benchmarks(args)
+    report = json.dumps({"results": results}, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fout:
+            fout.write(report + "\n")
+    else:
+        print report
+
+    if args.baseline:
+        with open(args.baseline) as fin:
+            baseline = json.load(fin)["results"]
+        regressions = compare(results, baseline, args.threshold,
+                              args.memory_threshold)
+        for regression in regressions:
+            sys.stderr.write("REGRESSION: {}\n".format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,4 +26,6 @@ def load_best_user_simulation(filepath):
 if __name__ == '__main__':
     user = load_best_user_simulation(sys.argv[1])
     agent = Agent()
-    collect_statistics(user, agent, DialogSession, NUM_SESSIONS_FE)
+    statistics = collect_statistics(user, agent, DialogSession,
+                                    NUM_SESSIONS_FE)
+    print statistics.report()
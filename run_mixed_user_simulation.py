@@ -23,7 +23,7 @@ def load_qp_mixed_user_simulation(filepath):
     simulation = QpMixedUserSimulation(filepath, real_user)
     simulation.solve_qp()
     print simulation.mixture_weights
-    simulation.collect_statistics(NUM_SESSIONS_FE)
+    print simulation.collect_statistics(NUM_SESSIONS_FE).report()
 
 
 def load_gibbs_mixed_user_simulation(filepath):
@@ -38,7 +38,7 @@ def load_gibbs_mixed_user_simulation(filepath):
             closest to that of the expert user.
     """
     simulation = GibbsMixedUserSimulation(filepath)
-    simulation.collect_statistics(NUM_SESSIONS_FE)
+    print simulation.collect_statistics(NUM_SESSIONS_FE).report()
 
 
 if __name__ == '__main__':
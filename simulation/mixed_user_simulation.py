@@ -1,56 +1,231 @@
-import pickle
 import numpy as np
-import cvxopt as cvx
+try:
+    import cvxopt as cvx
+except ImportError:
+    # Only needed by the `qp` mixture solver.
+    cvx = None
 
 from agent.agent import Agent
-from imitation_learning.dialog_session import DialogSession
+from imitation_learning.batch_dialog_session import BatchDialogSession
 from imitation_learning.irl import IRL
+from simulation_store import open_simulation_store
 from user_simulation import UserSimulation
 from user.user_features import UserFeatures
-from utils.params import AgentActionType, UserActionType, TAU
+from utils.params import TAU
+from utils.params import FEATURE_EXPECTATION_MODE, MIXTURE_SOLVER
+from utils.params import NUM_SESSIONS_FE
+from utils.params import MixtureSolver
 from utils import utils
+from utils.statistics import DialogStatistics
+from utils.utils import SimplexLeastSquares
 
-def run_single_session(user):
-    """Executes a single dialog session.
+
+class MixedUserSimulation(UserSimulation):
+    """Mixture of user simulations. Each dialog session is run with one of
+    the components, picked at random according to the mixture weights.
+
+    The weights are compiled once into an alias table, from which the
+    components of all the sessions are drawn up front, and the sessions are
+    then run in a single batch, grouped by component.
+
+    Attributes:
+        component_weights (1D numpy.ndarray): Probability of each component.
+        components (list of UserSimulation): The user simulations with a
+            non-zero weight.
+    """
+
+    def __init__(self):
+        super(MixedUserSimulation, self).__init__()
+        self.components = []
+        self.component_weights = None
+        self._thresholds = None
+        self._aliases = None
+
+    def compile_mixture(self, users, weights):
+        """Sets the components of the mixture and their weights.
+
+        Args:
+            users (list of UserSimulation): The user simulations.
+            weights (list of float): Their weights; need not be normalized.
+        """
+        weights = np.asarray(weights, dtype=float)
+        indices = np.flatnonzero(weights > 0)
+        self.components = [users[i] for i in indices]
+        self.component_weights = weights[indices] / np.sum(weights[indices])
+        self._thresholds, self._aliases = utils.build_alias_table(
+            self.component_weights)
+
+    def assign_components(self, num_sessions, random_state=None):
+        """Draws the components of many sessions at once.
+
+        Args:
+            num_sessions (int): Number of sessions.
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness. Defaults to the global state of `numpy.random`.
+
+        Returns:
+            1D numpy.ndarray: Index of the component of each session, in
+                increasing order.
+        """
+        random = utils.get_random_state(random_state)
+        scaled = random.random_sample(num_sessions) * len(self.components)
+        components = scaled.astype(np.intp)
+        use_alias = (scaled - components) >= self._thresholds[components]
+        components[use_alias] = self._aliases[components[use_alias]]
+        components.sort()
+        return components
+
+    def calc_feature_expectation(self, num_sessions=NUM_SESSIONS_FE,
+                                 random_state=None):
+        """Estimates the feature expectation of the mixture.
+
+        Args:
+            num_sessions (int, optional): Number of sessions.
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness. Defaults to the global state of `numpy.random`.
+
+        Returns:
+            numpy.array: Feature expectation of the mixture.
+        """
+        sessions = self._run_sessions(num_sessions, random_state)
+        return sessions.get_feature_expectation(UserFeatures)
+
+    def collect_statistics(self, num_sessions, random_state=None):
+        """Runs multiple dialog sessions between the user and the agent to
+        collect statistics about user's actions.
+
+        Args:
+            num_sessions (int): Number of dialog sessions to execute.
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness. Defaults to the global state of `numpy.random`.
+
+        Returns:
+            DialogStatistics: Statistics of the sessions.
+        """
+        sessions = self._run_sessions(num_sessions, random_state)
+        statistics = DialogStatistics()
+        statistics.update(sessions.state_log, sessions.action_log)
+        return statistics
+
+    def _run_sessions(self, num_sessions, random_state):
+        """Runs a single batch of sessions, each following the policy of its
+        component.
+
+        Returns:
+            BatchDialogSession: The executed sessions.
+        """
+        components = self.assign_components(num_sessions, random_state)
+        sessions = BatchDialogSession(
+            [user.policy for user in self.components], num_sessions,
+            random_state, components)
+        sessions.start()
+        return sessions
+
+
+class QpMixedUserSimulation(MixedUserSimulation):
+    """Mixture of the learnt user simulations whose feature expectation is
+    closest to that of the real user.
+
+    Attributes:
+        feature_expectations (2D numpy.ndarray): Feature expectation of each
+            simulated user, as rows.
+        mixture_weights (1D numpy.ndarray): Weight of each simulated user.
+        real_user (:obj: User): The real user.
+        users (SimulationStore): The simulated users.
     """
-    agent = Agent()
-    user.reset(reset_policy=False)
-    session = DialogSession(user, agent)
-    session.start()
-    return session.user_log
 
-class QpMixedUserSimulation(UserSimulation):
     def __init__(self, filepath, real_user):
         super(QpMixedUserSimulation, self).__init__()
         self.users = self._load_user_simulations(filepath)
         self.real_user = real_user
         self.mixture_weights = None
+        self.feature_expectations = None
+        self._mixture = None
+        self._fe_args = None
 
-    def solve_qp(self):
-        num_users = len(self.users)
+    def solve_qp(self, mode=FEATURE_EXPECTATION_MODE, seed=None,
+                 solver=MIXTURE_SOLVER):
+        """Finds the mixture of simulated users whose feature expectation is
+        closest to that of the real user.
+
+        Args:
+            mode (FeatureExpectationMode, optional): How the feature
+                expectations are calculated.
+            seed (int, optional): Seed used for the feature expectations of
+                all users, so that they are compared using common random
+                numbers.
+            solver (MixtureSolver, optional): How the mixture weights are
+                found.
+        """
+        self._fe_args = {'mode': mode, 'seed': seed}
 
         # Calculate feature expectations of all simulated users.
-        fe = []
-        for user in self.users:
-            fe.append(IRL.calc_feature_expectation(user, Agent()))
+        self.feature_expectations = self._calc_feature_expectations(
+            self.users)
 
         # Calculate feature expectation of expert user.
-        fe_expert = IRL.calc_feature_expectation(self.real_user, Agent())
+        fe_expert = IRL.calc_feature_expectation(self.real_user, Agent(),
+                                                 **self._fe_args)
+
+        if solver is MixtureSolver.qp:
+            self._mixture = None
+            self.mixture_weights = self._solve_with_cvxopt(
+                self.feature_expectations, fe_expert)
+        else:
+            self._mixture = SimplexLeastSquares(fe_expert)
+            self._mixture.add_vectors(self.feature_expectations)
+            self.mixture_weights = self._mixture.solve().copy()
+        utils.normalize_probabilities(self.mixture_weights)
+        self.compile_mixture(self.users, self.mixture_weights)
+
+    def add_user_simulations(self, user_simulations):
+        """Adds simulated users to the mixture and updates the mixture
+        weights, starting from the current ones. `solve_qp` must have been
+        called with the `frank_wolfe` solver.
+
+        Args:
+            user_simulations (list of UserSimulation): The new simulated
+                users.
+        """
+        assert self._mixture is not None, (
+            "The mixture must first be solved with the frank_wolfe solver")
+        feature_expectations = self._calc_feature_expectations(
+            user_simulations)
+        self.users.extend(user_simulations, feature_expectations)
+        self.feature_expectations = np.concatenate(
+            (self.feature_expectations, feature_expectations))
+        self._mixture.add_vectors(feature_expectations)
+        self.mixture_weights = self._mixture.solve().copy()
+        utils.normalize_probabilities(self.mixture_weights)
+        self.compile_mixture(self.users, self.mixture_weights)
+
+    def _calc_feature_expectations(self, users):
+        """Returns the feature expectations of simulated users, as rows."""
+        return np.array([IRL.calc_feature_expectation(user, Agent(),
+                                                      **self._fe_args)
+                         for user in users])
+
+    def _solve_with_cvxopt(self, fe, fe_expert):
+        """Solves the dense quadratic program for the mixture weights.
+
+        Args:
+            fe (2D numpy.ndarray): Feature expectations of the simulated users,
+                as rows.
+            fe_expert (1D numpy.ndarray): Feature expectation of the real
+                user.
+
+        Returns:
+            1D numpy.ndarray: The mixture weights.
+        """
+        if cvx is None:
+            raise ImportError("The qp mixture solver requires cvxopt")
+        num_users = len(fe)
 
         # Cacluate matrix P in QP formulation of cvxopt
-        P = np.zeros((num_users, num_users))
-        for i in xrange(num_users):
-            for j in xrange(i, num_users):
-                product = np.dot(fe[i], fe[j])
-                P[i][j] = product
-                P[j][i] = product
-        P = cvx.matrix(P)
+        P = cvx.matrix(fe.dot(fe.T))
         # print P
 
-        q = np.zeros(num_users)
-        for i in xrange(num_users):
-            q[i] = -2 * np.dot(fe_expert, fe[i])
-        q = cvx.matrix(q)
+        q = cvx.matrix(-2 * fe.dot(fe_expert))
         # print q
 
         G = np.eye(num_users) * (-1)
@@ -71,177 +246,37 @@ class QpMixedUserSimulation(UserSimulation):
         sol = cvx.solvers.qp(P, q, G, h, A, b)
         print sol
 
-        self.mixture_weights = np.array(sol['x']).reshape(num_users)
-        utils.normalize_probabilities(self.mixture_weights)
-
-    def collect_statistics(self, num_sessions):
-        """Runs multiple dialog sessions between the user and the agent to collect
-        statistics about user's actions.
-
-        Args:
-            user (:obj: User): The dialog user.
-            agent (:obj: Agent): The dialog agent.
-            dialog_session (DialogSession): The dialog session class
-            num_sessions (int): Number of dialog sessions to execute.
-        """
-        user_actions = [user_action for user_action in UserActionType]
-        user_action_map = {action: i for i, action in
-                           enumerate(user_actions)}
-        user_action_stats = {action_type: np.zeros(len(user_actions))
-                             for action_type in AgentActionType}
-
-        agent_actions = [agent_action for agent_action in AgentActionType]
-        agent_action_map = {action: i for i, action in
-                            enumerate(agent_actions)}
-        agent_action_counts = np.zeros(len(agent_actions))
-
-        agent = Agent()
-        # Run multiple dialog sessions to gather user's action statistics.
-        for _ in xrange(num_sessions):
-            # Reset the agent and the user.
-            agent.reset()
-            user = self._pick_user_stochastically()
-            user.reset(reset_policy=False)  # Only reset state, not policy.
-            # Create a new dialog session.
-            session = DialogSession(user, agent)
-            # Start the dialog session by having the dialog agent make the
-            # first move.
-            agent_action = session.ask_agent_to_start()
-            user_action = None
-            while not (agent_action is AgentActionType.CLOSE and
-                       user_action is UserActionType.CLOSE):
-                user_action, next_agent_action = session.execute_one_step()
-
-                # Update action statistics
-                user_action_index = user_action_map[user_action]
-                user_action_stats[agent_action][user_action_index] += 1
-                agent_action_index = agent_action_map[agent_action]
-                agent_action_counts[agent_action_index] += 1
-
-                agent_action = next_agent_action
-
-        print user_action_stats
-        print agent_action_counts
-
-    def temp(self, num_sessions):
-        freq = {}
-        for action in UserActionType:
-            freq[action] = 0
-
-        for _ in xrange(num_sessions):
-            user = self._pick_user_stochastically()
-            user_log = run_single_session(user)
-            for _, action in user_log:
-                freq[action] += 1
-
-        for action in freq.keys():
-            freq[action] /= (1. * num_sessions)
-
-        return freq
-
-    def _pick_user_stochastically(self):
-        return np.random.choice(self.users, 1, p=self.mixture_weights)[0]
+        return np.array(sol['x']).reshape(num_users)
 
     def _load_user_simulations(self, filepath):
-        with open(filepath, "r") as fin:
-            user_simulations = pickle.load(fin)
-            return user_simulations
+        return open_simulation_store(filepath)
 
 
-class GibbsMixedUserSimulation(UserSimulation):
+class GibbsMixedUserSimulation(MixedUserSimulation):
     def __init__(self, filepath):
         super(GibbsMixedUserSimulation, self).__init__()
         self.users = self._build_users_dictionary(filepath)
         self.probabilities = self._build_probability_dictionary()
         print self.users
         print self.probabilities
-
-    def collect_statistics(self, num_sessions):
-        """Runs multiple dialog sessions between the user and the agent to collect
-        statistics about user's actions.
-
-        Args:
-            user (:obj: User): The dialog user.
-            agent (:obj: Agent): The dialog agent.
-            dialog_session (DialogSession): The dialog session class
-            num_sessions (int): Number of dialog sessions to execute.
-        """
-        user_actions = [user_action for user_action in UserActionType]
-        user_action_map = {action: i for i, action in
-                           enumerate(user_actions)}
-        user_action_stats = {action_type: np.zeros(len(user_actions))
-                             for action_type in AgentActionType}
-
-        agent_actions = [agent_action for agent_action in AgentActionType]
-        agent_action_map = {action: i for i, action in
-                            enumerate(agent_actions)}
-        agent_action_counts = np.zeros(len(agent_actions))
-
-        agent = Agent()
-        # Run multiple dialog sessions to gather user's action statistics.
-        for _ in xrange(num_sessions):
-            # Reset the agent and the user.
-            agent.reset()
-            user = self._pick_user_stochastically()
-            user.reset(reset_policy=False)  # Only reset state, not policy.
-            # Create a new dialog session.
-            session = DialogSession(user, agent)
-            # Start the dialog session by having the dialog agent make the
-            # first move.
-            agent_action = session.ask_agent_to_start()
-            user_action = None
-            while not (agent_action is AgentActionType.CLOSE and
-                       user_action is UserActionType.CLOSE):
-                user_action, next_agent_action = session.execute_one_step()
-
-                # Update action statistics
-                user_action_index = user_action_map[user_action]
-                user_action_stats[agent_action][user_action_index] += 1
-                agent_action_index = agent_action_map[agent_action]
-                agent_action_counts[agent_action_index] += 1
-
-                agent_action = next_agent_action
-
-        print user_action_stats
-        print agent_action_counts
-
-    def temp(self, num_sessions):
-        freq = {}
-        for action in UserActionType:
-            freq[action] = 0
-
-        for _ in xrange(num_sessions):
-            user = self._pick_user_stochastically()
-            user_log = run_single_session(user)
-            for _, action in user_log:
-                freq[action] += 1
-
-        for action in freq.keys():
-            freq[action] /= (1. * num_sessions)
-
-        return freq
-
-    def _pick_user_stochastically(self):
-        users = []
-        probabilities = []
-        for k in self.users:
-            users.append(self.users[k])
-            probabilities.append(self.probabilities[k])
-        utils.normalize_probabilities(probabilities)
-        user = np.random.choice(users, 1, p=probabilities)[0]
-        return user
+        signatures = sorted(self.users)
+        self.compile_mixture(
+            [self.users[signature] for signature in signatures],
+            [self.probabilities[signature] for signature in signatures])
 
     def _build_users_dictionary(self, filepath):
         user_simulations = self._load_user_simulations(filepath)
-        distances = [(sim.distance_to_expert, i)
-                     for i, sim in enumerate(user_simulations)]
+        distances = [(distance, i) for i, distance in
+                     enumerate(user_simulations.distances.tolist())]
         distances.sort()
 
-        users = {}
+        # Only build the simulations that end up in the dictionary.
+        indices = {}
         for (distance, i) in distances:
             dist_signature = "{:.3f}".format(distance)
-            users[dist_signature] = user_simulations[i]
-        return users
+            indices[dist_signature] = i
+        return {dist_signature: user_simulations[i]
+                for dist_signature, i in indices.iteritems()}
 
     def _build_probability_dictionary(self):
         s = sum([np.exp(-float(dist_string) / TAU)
@@ -253,6 +288,4 @@ class GibbsMixedUserSimulation(UserSimulation):
         return probabilities
 
     def _load_user_simulations(self, filepath):
-        with open(filepath, "r") as fin:
-            user_simulations = pickle.load(fin)
-            return user_simulations
+        return open_simulation_store(filepath)
@@ -0,0 +1,220 @@
+"""Columnar store of the user simulations learnt by the IRL algorithm.
+
+A store is a directory holding one `.npy` file per column in `COLUMNS`, with
+one row per user simulation, and optionally `METADATA_FILE` describing the
+run that learnt them. The columns are memory-mapped when a store is
+opened, so that simulations can be selected or scored by their distances,
+weights or feature expectations without reading anything else, and a
+`UserSimulation` is only built for the rows that are accessed.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from imitation_learning.checkpoint_log import is_checkpoint_log, read_records
+from imitation_learning.checkpoint_log import load_user_simulations
+from user.user_policy import UserPolicy
+from user_simulation import UserSimulation
+from utils.params import AgentActionType, UserActionType
+
+# Columns of a store, each saved as `<column>.npy`.
+COLUMNS = ('distances', 'weights', 'feature_expectations', 'policies',
+           'q_values')
+
+# JSON file of a store holding its metadata.
+METADATA_FILE = "metadata.json"
+
+
+class SimulationStore(object):
+    """Sequence of user simulations backed by columnar arrays.
+
+    Attributes:
+        distances (1D numpy.ndarray): Distance of each simulation's feature
+            expectation to that of the expert user.
+        feature_expectations (2D numpy.ndarray): Feature expectation of each
+            simulation; NaN where it is unknown.
+        metadata (dict): Description of the run that learnt the simulations,
+            e.g., why it stopped. Values must be serializable as JSON.
+        policies (3D numpy.ndarray): Policy of each simulation. Entry [i, s, a]
+            is the probability of the action with code a in the state with
+            code s.
+        q_values (3D numpy.ndarray): Q-values of each simulation, indexed like
+            `policies`; NaN where they are unknown.
+        weights (2D numpy.ndarray): Weights of the reward function that gave
+            rise to each simulation.
+    """
+
+    def __init__(self, columns, metadata=None):
+        """Class constructor
+
+        Args:
+            columns (dict): Array of each column, indexed by its name.
+            metadata (dict, optional): Description of the run that learnt the
+                simulations.
+        """
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+        self.metadata = {} if metadata is None else metadata
+        self._simulations = {}
+
+    def __len__(self):
+        return len(self.distances)
+
+    def __getitem__(self, index):
+        """Returns a user simulation, building it on first access.
+
+        Args:
+            index (int): Row of the simulation.
+
+        Returns:
+            UserSimulation: The user simulation.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Simulation index out of range")
+        if index not in self._simulations:
+            policy = UserPolicy()
+            policy.policy = {state: np.array(self.policies[index, code])
+                             for code, state in enumerate(AgentActionType)}
+            policy.update_sampler()
+
+            q = None
+            if not np.isnan(self.q_values[index]).any():
+                q = {state: np.array(self.q_values[index, code])
+                     for code, state in enumerate(AgentActionType)}
+            self._simulations[index] = UserSimulation(
+                policy, q, np.array(self.weights[index]),
+                float(self.distances[index]))
+        return self._simulations[index]
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    @classmethod
+    def load(cls, dirpath):
+        """Opens a store, memory-mapping its columns.
+
+        Args:
+            dirpath (str): Path of the store.
+
+        Returns:
+            SimulationStore: The store.
+        """
+        metadata = None
+        metadata_path = os.path.join(dirpath, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as fin:
+                metadata = json.load(fin)
+        return cls({name: np.load(os.path.join(dirpath, name + ".npy"),
+                                  mmap_mode="r")
+                    for name in COLUMNS}, metadata)
+
+    @classmethod
+    def from_user_simulations(cls, user_simulations,
+                              feature_expectations=None):
+        """Builds an in-memory store from user simulations.
+
+        Args:
+            user_simulations (list of UserSimulation): The user simulations.
+            feature_expectations (list of 1D numpy.ndarray, optional): Feature
+                expectation of each simulation; unknown by default.
+
+        Returns:
+            SimulationStore: The store.
+        """
+        weights = np.array([sim.weights for sim in user_simulations],
+                           dtype=float)
+        if feature_expectations is None:
+            feature_expectations = np.full(weights.shape, np.nan)
+        num_states = len(AgentActionType)
+        num_actions = len(UserActionType)
+        q_values = np.full((len(user_simulations), num_states, num_actions),
+                           np.nan)
+        for i, sim in enumerate(user_simulations):
+            if sim.q is not None:
+                q_values[i] = [sim.q[state] for state in AgentActionType]
+        columns = {
+            'distances': np.array([sim.distance_to_expert
+                                   for sim in user_simulations],
+                                  dtype=float),
+            'weights': weights,
+            'feature_expectations': np.array(feature_expectations,
+                                             dtype=float),
+            'policies': np.array([sim.policy.get_policy_matrix()
+                                  for sim in user_simulations]),
+            'q_values': q_values,
+        }
+        store = cls(columns)
+        for i, sim in enumerate(user_simulations):
+            store._simulations[i] = sim
+        return store
+
+    def extend(self, user_simulations, feature_expectations=None):
+        """Appends user simulations. The columns of a memory-mapped store are
+        copied into memory.
+
+        Args:
+            user_simulations (list of UserSimulation): The user simulations.
+            feature_expectations (list of 1D numpy.ndarray, optional): Feature
+                expectation of each simulation; unknown by default.
+        """
+        other = SimulationStore.from_user_simulations(user_simulations,
+                                                      feature_expectations)
+        offset = len(self)
+        for name in COLUMNS:
+            setattr(self, name, np.concatenate((getattr(self, name),
+                                                getattr(other, name))))
+        for index, sim in other._simulations.iteritems():
+            self._simulations[offset + index] = sim
+
+    def save(self, dirpath):
+        """Saves the store, replacing any store at the same path.
+
+        Args:
+            dirpath (str): Path of the store.
+        """
+        parent = os.path.dirname(os.path.abspath(dirpath))
+        tmp_dirpath = tempfile.mkdtemp(dir=parent)
+        for name in COLUMNS:
+            np.save(os.path.join(tmp_dirpath, name + ".npy"),
+                    getattr(self, name))
+        if self.metadata:
+            with open(os.path.join(tmp_dirpath, METADATA_FILE), "w") as fout:
+                json.dump(self.metadata, fout)
+        if os.path.exists(dirpath):
+            shutil.rmtree(dirpath)
+        os.rename(tmp_dirpath, dirpath)
+
+    def get_best_index(self):
+        """Returns the row of the simulation closest to the expert user.
+
+        Returns:
+            int: The row.
+        """
+        return int(np.argmin(self.distances))
+
+
+def open_simulation_store(filepath):
+    """Opens the user simulations learnt by the IRL algorithm as a store.
+
+    Args:
+        filepath (str): Path of a store, of a checkpoint log, or of a pickled
+            list of user simulations. The latter two are read into memory.
+
+    Returns:
+        SimulationStore: The store.
+    """
+    if os.path.isdir(filepath):
+        return SimulationStore.load(filepath)
+    if is_checkpoint_log(filepath):
+        records, _ = read_records(filepath)
+        return SimulationStore.from_user_simulations(
+            [record.simulated_user for record in records],
+            [record.simulated_fe for record in records])
+    return SimulationStore.from_user_simulations(
+        load_user_simulations(filepath))
@@ -0,0 +1,217 @@
+"""Dialog user whose actions and state updates are compiled into tables."""
+
+import os
+
+import numpy as np
+
+from agent.agent_action import AGENT_ACTIONS_BY_CODE, NUM_AGENT_ACTIONS
+from user import User
+from user_action import NUM_USER_ACTIONS, USER_ACTIONS_BY_CODE
+from user_state import ALL_SLOTS_MASK
+from utils.params import AGENT_ACTION_CODES, NUM_SLOTS, TRANSITION_TABLE_DIR
+from utils.params import UserActionType
+from utils.utils import load_arrays, save_arrays
+
+# Version of the format of the cached tables; to be bumped whenever `User`
+# or the format changes.
+TABLE_VERSION = 1
+
+
+class ScriptedUser(User):
+    """User whose randomly picked slot is dictated from outside.
+
+    Attributes:
+        random_slot_id (int): Outcome of the next random choice of slot.
+    """
+
+    def __init__(self):
+        super(ScriptedUser, self).__init__()
+        self.random_slot_id = 0
+
+    def _pick_random_slot(self):
+        return self.random_slot_id
+
+
+class ActionTable(object):
+    """Tables of the actions built by `User` and of its state updates.
+
+    The state update of an action is an assignment of a status to some of
+    the slots; the others keep theirs. The tables are built once per number
+    of slots by driving `User` through every agent action, every type of
+    action and every randomly picked slot, and are cached on disk.
+
+    Attributes:
+        action_codes (list of list of list of int): Entry [a][t][s] is the code
+            of the action built in response to the agent's action with code
+            a, when the type of action has index t in `UserPolicy.actions`
+            and the randomly picked slot is s.
+        confirmed_masks (list of list of int): Entry [a][u] is the bitmask of
+            the slots marked "CONFIRMED" by the action with code u in response
+            to the agent's action with code a.
+        keep_masks (list of list of int): Entry [a][u] is the bitmask of the
+            slots whose status the action keeps.
+        provided_masks (list of list of int): Entry [a][u] is the bitmask of
+            the slots marked "PROVIDED" by the action.
+        state_codes (list of int): Code of the user's state, i.e., of the type
+            of the agent's action, for each agent action.
+    """
+
+    _default_table = None
+
+    def __init__(self, arrays=None):
+        """Class constructor
+
+        Args:
+            arrays (dict, optional): Arrays of a table, as returned by
+                `to_arrays`. The table is built if they are not given.
+        """
+        if arrays is None:
+            arrays = self._build()
+        self.action_codes = arrays["action_codes"].tolist()
+        self.keep_masks = arrays["keep_masks"].tolist()
+        self.provided_masks = arrays["provided_masks"].tolist()
+        self.confirmed_masks = arrays["confirmed_masks"].tolist()
+        self.state_codes = [AGENT_ACTION_CODES[AGENT_ACTIONS_BY_CODE[code].type]
+                            for code in xrange(NUM_AGENT_ACTIONS)]
+
+    @classmethod
+    def get_default(cls):
+        """Returns the table for the current number of slots, loading it from
+        the on-disk cache or building it on first use.
+
+        Returns:
+            ActionTable: The table.
+        """
+        if cls._default_table is None:
+            filepath = cls.get_filepath()
+            arrays = load_arrays(filepath) if filepath is not None else None
+            if arrays is None:
+                cls._default_table = cls()
+                if filepath is not None:
+                    save_arrays(filepath, **cls._default_table.to_arrays())
+            else:
+                cls._default_table = cls(arrays)
+        return cls._default_table
+
+    @staticmethod
+    def get_filepath():
+        """Returns the path of the cached table for the current number of
+        slots, or None if tables are not cached on disk.
+
+        Returns:
+            str or None: Path of the `.npz` file.
+        """
+        if TRANSITION_TABLE_DIR is None:
+            return None
+        return os.path.join(TRANSITION_TABLE_DIR, "user-v{}-{}.npz".format(
+            TABLE_VERSION, NUM_SLOTS))
+
+    def to_arrays(self):
+        """Returns the table as arrays, e.g., to be saved.
+
+        Returns:
+            dict: Arrays indexed by their names.
+        """
+        return {"action_codes": np.array(self.action_codes, dtype=np.int32),
+                "keep_masks": np.array(self.keep_masks),
+                "provided_masks": np.array(self.provided_masks),
+                "confirmed_masks": np.array(self.confirmed_masks)}
+
+    @staticmethod
+    def _build():
+        """Builds the actions and state updates of `User`.
+
+        Returns:
+            dict: Arrays of the table.
+        """
+        user = ScriptedUser()
+        action_codes = np.zeros((NUM_AGENT_ACTIONS, len(UserActionType),
+                                 NUM_SLOTS), dtype=np.int32)
+        shape = (NUM_AGENT_ACTIONS, NUM_USER_ACTIONS)
+        keep_masks = np.zeros(shape, dtype=np.int64)
+        provided_masks = np.zeros(shape, dtype=np.int64)
+        confirmed_masks = np.zeros(shape, dtype=np.int64)
+
+        for agent_code in xrange(NUM_AGENT_ACTIONS):
+            user.state.agent_act = AGENT_ACTIONS_BY_CODE[agent_code]
+            for index, action_type in enumerate(user.policy.actions):
+                for slot_id in xrange(NUM_SLOTS):
+                    user.random_slot_id = slot_id
+                    action_codes[agent_code, index, slot_id] = \
+                        user._build_action(action_type).code
+
+            for code in xrange(NUM_USER_ACTIONS):
+                # Update states in which all slots are "EMPTY", "PROVIDED" and
+                # "CONFIRMED" respectively: a slot keeps its status if it
+                # does in all three.
+                results = []
+                for provided, confirmed in ((0, 0), (ALL_SLOTS_MASK, 0),
+                                            (0, ALL_SLOTS_MASK)):
+                    user.state.provided_mask = provided
+                    user.state.confirmed_mask = confirmed
+                    user._update_state(USER_ACTIONS_BY_CODE[code])
+                    results.append((user.state.provided_mask,
+                                    user.state.confirmed_mask))
+                (provided, confirmed), (all_provided, _), (_, all_confirmed) = \
+                    results
+                keep = ~(provided | confirmed) & all_provided & all_confirmed
+                keep_masks[agent_code, code] = keep
+                provided_masks[agent_code, code] = provided & ~keep
+                confirmed_masks[agent_code, code] = confirmed & ~keep
+
+        return {"action_codes": action_codes, "keep_masks": keep_masks,
+                "provided_masks": provided_masks,
+                "confirmed_masks": confirmed_masks}
+
+
+class CompiledUser(User):
+    """User whose actions and state updates are looked up in an
+    `ActionTable` rather than built by the rules of `User`, which it follows
+    exactly: given the same policy and source of randomness, both take the
+    same actions.
+
+    Attributes:
+        table (ActionTable): Tables of the user's actions.
+    """
+
+    def __init__(self, policy=None, policy_type=None, random_state=None,
+                 table=None):
+        """Class constructor
+
+        Args:
+            policy (UserPolicy, optional): Policy to be followed.
+            policy_type (UserPolicyType or None): Type of user policy, if no
+                policy is given.
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness for the user and its policy. Defaults to the global
+                state of `numpy.random`.
+            table (ActionTable, optional): Tables of the user's actions.
+                Defaults to the ones for the current number of slots.
+        """
+        super(CompiledUser, self).__init__(policy, policy_type, random_state)
+        self.table = table if table is not None else ActionTable.get_default()
+
+    def update_state_and_get_next_action(self, agent_act):
+        """Updates the user-state and returns the next action to be taken.
+
+        Args:
+            agent_act (AgentAction): Dialog agent's most recent action.
+
+        Returns:
+            UserAction: User's next action.
+        """
+        table = self.table
+        state = self.state
+        state.agent_act = agent_act
+        agent_code = agent_act.code
+
+        # Draw the same random numbers, in the same order, as `User`.
+        index = self.policy.get_action_index(table.state_codes[agent_code])
+        code = table.action_codes[agent_code][index][self._pick_random_slot()]
+
+        keep = table.keep_masks[agent_code][code]
+        state.provided_mask = ((state.provided_mask & keep) |
+                               table.provided_masks[agent_code][code])
+        state.confirmed_mask = ((state.confirmed_mask & keep) |
+                                table.confirmed_masks[agent_code][code])
+        return USER_ACTIONS_BY_CODE[code]
@@ -1,13 +1,12 @@
 """Dialog user."""
 
-from numpy.random import randint
-
 from user_action import UserActions
 from user_features import UserFeatures
 from user_policy import UserPolicy
 from user_state import UserState
 from utils.params import AgentActionType, NUM_SLOTS
-from utils.params import UserActionType, UserStateStatus
+from utils.params import UserActionType
+from utils.utils import get_random_state
 
 
 class User(object):
@@ -17,16 +16,25 @@ class User(object):
     Attributes:
         features (UserFeatures): Feature class for user's state-action space.
         policy (UserPolicy): Policy to be followed by the user.
+        random_state (numpy.random.RandomState or None): Source of randomness;
+            None for the global state of `numpy.random`.
         state (UserState): User's current state.
     """
 
-    def __init__(self, policy=None, policy_type=None):
+    # Default for users unpickled from dumps predating the attribute.
+    random_state = None
+
+    def __init__(self, policy=None, policy_type=None, random_state=None):
         """Class constructor
 
         Args:
             policy_type (UserPolicyType or None): Type of user policy.
+            random_state (numpy.random.RandomState, optional): Source of
+                randomness for the user and its policy. Defaults to the global
+                state of `numpy.random`.
         """
         self.state = UserState()
+        self.random_state = None
 
         self.policy = None
 
@@ -36,6 +44,8 @@ class User(object):
             self.policy = policy
 
         self.features = UserFeatures
+        if random_state is not None:
+            self.set_random_state(random_state)
 
     def take_turn(self, agent_act):
         """Executes a user turn based on the agent's most recent action.
@@ -77,6 +87,16 @@ class User(object):
         self._update_state(action)
         return action
 
+    def set_random_state(self, random_state):
+        """Sets the source of randomness of the user and its policy.
+
+        Args:
+            random_state (numpy.random.RandomState or None): A random state, or
+                None for the global state of `numpy.random`.
+        """
+        self.random_state = random_state
+        self.policy.set_random_state(random_state)
+
     def reset(self, reset_policy=True):
         """Resets the user.
 
@@ -102,7 +122,7 @@ class User(object):
         """
         requested_slot_id = self.state.agent_act.ask_id
         confirm_slot_id = self.state.agent_act.confirm_id
-        random_slot_id = randint(NUM_SLOTS)
+        random_slot_id = self._pick_random_slot()
 
         if action_type is UserActionType.SILENT:
             return UserActions.silent.value
@@ -140,6 +160,14 @@ class User(object):
         elif action_type is UserActionType.CLOSE:
             return UserActions.close.value
 
+    def _pick_random_slot(self):
+        """Returns the identifier of a slot picked uniformly at random.
+
+        Returns:
+            int: Slot identifier.
+        """
+        return get_random_state(self.random_state).randint(NUM_SLOTS)
+
     def _update_state(self, action):
         """Updates the user-state based on the action about to be taken.
 
@@ -157,7 +185,7 @@ class User(object):
 
         elif action.type is UserActionType.ONE_SLOT:
             # Mark the requested slot as "PROVIDED"
-            self.state.slots[slot_id] = UserStateStatus.PROVIDED
+            self.state.mark_slot_as_provided(slot_id)
 
             # If the agent asked for an implicit confirmation, and the user
             # responds with information for the requested slot, then in
@@ -165,15 +193,15 @@ class User(object):
             # being implicitly confirmed as "CONFIRMED".
             if self.state.agent_act.type is AgentActionType.CONFIRM_ASK:
                 confirm_slot_id = self.state.agent_act.confirm_id
-                self.state.slots[confirm_slot_id] = UserStateStatus.CONFIRMED
+                self.state.mark_slot_as_confirmed(confirm_slot_id)
 
         elif action.type is UserActionType.CONFIRM:
             # Mark the slot being confirmed as "CONFIRMED"
-            self.state.slots[slot_id] = UserStateStatus.CONFIRMED
+            self.state.mark_slot_as_confirmed(slot_id)
 
         elif action.type is UserActionType.NEGATE:
             # Mark the slot being negated as "EMPTY"
-            self.state.slots[slot_id] = UserStateStatus.EMPTY
+            self.state.mark_slot_as_empty(slot_id)
 
         elif action.type is UserActionType.CLOSE:
             pass
@@ -181,5 +209,4 @@ class User(object):
     def _mark_all_slots_as_provided(self):
         """Sets the status of all slots as "PROVIDED".
         """
-        for id_ in xrange(NUM_SLOTS):
-            self.state.slots[id_] = UserStateStatus.PROVIDED
+        self.state.mark_all_slots_as_provided()
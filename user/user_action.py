@@ -3,6 +3,37 @@
 from enum import Enum
 
 from utils.params import NUM_SLOTS, UserActionType
+from utils.utils import LazyTable
+
+# Number of distinct user actions.
+NUM_USER_ACTIONS = 3 + 3 * NUM_SLOTS
+
+
+def get_user_action_code(type_, slot_id):
+    """Returns the code of a user action, i.e., its index among all user
+    actions: silence, all slots and close, followed by the provision, the
+    confirmation and the negation of each slot.
+
+    Args:
+        type_ (UserActionType): Type of the action.
+        slot_id (int or None): Id of the slot under consideration.
+
+    Returns:
+        int or None: Code of the action; None for an action without a type.
+    """
+    if type_ is UserActionType.SILENT:
+        return 0
+    elif type_ is UserActionType.ALL_SLOTS:
+        return 1
+    elif type_ is UserActionType.CLOSE:
+        return 2
+    elif type_ is UserActionType.ONE_SLOT:
+        return 3 + slot_id
+    elif type_ is UserActionType.CONFIRM:
+        return 3 + NUM_SLOTS + slot_id
+    elif type_ is UserActionType.NEGATE:
+        return 3 + 2 * NUM_SLOTS + slot_id
+    return None
 
 
 class UserAction(object):
@@ -10,6 +41,8 @@ class UserAction(object):
     and the identifier for the slot under consideration.
 
     Attributes:
+        code (int): Index of the action among all user actions; see
+            `get_user_action_code`.
         slot_id (TYPE): Id of slot under consideration.
         type (UserActionType): Type of action.
     """
@@ -17,6 +50,7 @@ class UserAction(object):
     def __init__(self, type_, slot_id):
         self.type = type_
         self.slot_id = slot_id
+        self.code = get_user_action_code(type_, slot_id)
 
     def __str__(self):
         return "Type: {}, Slot_id: {}".format(self.type.value, self.slot_id)
@@ -30,16 +64,33 @@ class UserActions(Enum):
     all_slots = UserAction(UserActionType.ALL_SLOTS, None)
 
     # Multiple `UserAction`s for providing a single slot, one for each slot.
-    one_slot = [UserAction(UserActionType.ONE_SLOT, id_)
-                for id_ in xrange(NUM_SLOTS)]
+    # The slot-parameterized actions are only built when first used.
+    one_slot = LazyTable(
+        lambda id_: UserAction(UserActionType.ONE_SLOT, id_), NUM_SLOTS)
 
     # Multiple `UserAction`s for confirming a single slot, one for each slot.
-    confirm = [UserAction(UserActionType.CONFIRM, id_)
-               for id_ in xrange(NUM_SLOTS)]
+    confirm = LazyTable(
+        lambda id_: UserAction(UserActionType.CONFIRM, id_), NUM_SLOTS)
 
     # Multiple `UserAction`s for negating a single slot, one for each slot.
-    negate = [UserAction(UserActionType.NEGATE, id_)
-              for id_ in xrange(NUM_SLOTS)]
+    negate = LazyTable(
+        lambda id_: UserAction(UserActionType.NEGATE, id_), NUM_SLOTS)
 
     # `UserAction` for terminating the dialog session.
     close = UserAction(UserActionType.CLOSE, None)
+
+
+def _get_user_action(code):
+    """Returns the user action with the given code; see
+    `get_user_action_code`.
+    """
+    fixed = (UserActions.silent, UserActions.all_slots, UserActions.close)
+    if code < 3:
+        return fixed[code].value
+    code -= 3
+    per_slot = (UserActions.one_slot, UserActions.confirm, UserActions.negate)
+    return per_slot[code // NUM_SLOTS].value[code % NUM_SLOTS]
+
+
+# User actions indexed by their codes.
+USER_ACTIONS_BY_CODE = LazyTable(_get_user_action, NUM_USER_ACTIONS)
@@ -1,15 +1,104 @@
 import numpy as np
 
+from utils.params import AGENT_ACTION_CODES, USER_ACTION_CODES
 from utils.params import AgentActionType, UserActionType
 
 
 def deco(cls):
     cls._define_function()
+    cls._index_function()
     return cls
 
 
+class SparseFeatureMatrix(object):
+    """Feature vectors of all state-action pairs in compressed sparse row
+    (CSR) format.
+
+    Row p holds the feature vector of the state-action pair with code p, i.e.,
+    state code * number of actions + action code. Its nonzero elements are
+    `data[indptr[p]:indptr[p + 1]]`, in the columns
+    `indices[indptr[p]:indptr[p + 1]]`.
+
+    Attributes:
+        data (1D numpy.ndarray): Nonzero elements.
+        indices (1D numpy.ndarray): Column of each nonzero element.
+        indptr (1D numpy.ndarray): Offset of the first nonzero element of each
+            row, followed by the number of nonzero elements.
+        rows (1D numpy.ndarray): Row of each nonzero element.
+        shape ((int, int)): Number of rows and of columns.
+    """
+
+    def __init__(self, dense):
+        """Class constructor
+
+        Args:
+            dense (2D numpy.ndarray): Feature vectors, one row per pair.
+        """
+        self.shape = dense.shape
+        self.rows, self.indices = np.nonzero(dense)
+        self.data = dense[self.rows, self.indices]
+        self.indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(self.rows, minlength=dense.shape[0]))))
+
+        order = np.argsort(self.indices, kind="mergesort")
+        self._rows_by_column = self.rows[order]
+        self._data_by_column = self.data[order]
+        self._columns, self._column_starts = np.unique(self.indices[order],
+                                                       return_index=True)
+
+    def dot(self, vector):
+        """Returns the product of the matrix with a vector, e.g., the value
+        of each pair under a weight vector.
+
+        Args:
+            vector (1D numpy.ndarray): One element per column.
+
+        Returns:
+            1D numpy.ndarray: One element per row.
+        """
+        return np.bincount(self.rows, weights=self.data * vector[self.indices],
+                           minlength=self.shape[0])
+
+    def rdot(self, counts):
+        """Returns the product of a matrix with this one, e.g., the feature
+        counts of sessions from their counts of state-action pairs.
+
+        Args:
+            counts (2D numpy.ndarray): One column per row of this matrix.
+
+        Returns:
+            2D numpy.ndarray: One column per column of this matrix.
+        """
+        # Sum the products of the nonzero elements column by column.
+        products = counts[:, self._rows_by_column] * self._data_by_column
+        result = np.zeros((counts.shape[0], self.shape[1]))
+        if products.size:
+            result[:, self._columns] = np.add.reduceat(
+                products, self._column_starts, axis=1)
+        return result
+
+
 @deco
 class UserFeatures(object):
+    """Feature function of the user's state-action pairs.
+
+    Besides the feature vector of a pair, the features can be accessed by the
+    codes of the pairs (see `AGENT_ACTION_CODES` and `USER_ACTION_CODES`):
+    as a dense matrix, as a `SparseFeatureMatrix`, or, if every feature vector
+    is one-hot, as the index of the feature of each pair.
+
+    Attributes:
+        dimensions (int): Number of features.
+        index_table (2D numpy.ndarray): Entry [s, a] is the index of the
+            feature of the pair of the state with code s and the action with
+            code a; None unless the features are one-hot.
+        is_one_hot (bool): Whether each feature vector has a single nonzero
+            element, equal to 1.
+        matrix (2D numpy.ndarray): Feature vectors; row p is for the pair with
+            code p.
+        sparse_matrix (SparseFeatureMatrix): Feature vectors in CSR format.
+    """
+
     dimensions = 0
     _function = {}
 
@@ -31,6 +120,60 @@ class UserFeatures(object):
                   .format(e, state, action))
             raise
 
+    @classmethod
+    def get_index(cls, state, action):
+        """Returns the index of the only feature of a state-action pair;
+        only available for one-hot features.
+
+        Args:
+            state (AgentActionType): User state.
+            action (UserActionType): User action.
+
+        Returns:
+            int: Index of the feature.
+        """
+        assert cls.is_one_hot, "The features are not one-hot"
+        return cls.index_table[AGENT_ACTION_CODES[state],
+                               USER_ACTION_CODES[action]]
+
+    @classmethod
+    def get_pair_values(cls, weights):
+        """Returns the values of all state-action pairs under a linear
+        function of the features, e.g., a reward function.
+
+        Args:
+            weights (1D numpy.ndarray): Weight of each feature.
+
+        Returns:
+            2D numpy.ndarray: Entry [s, a] is for the state with code s and
+                the action with code a.
+        """
+        weights = np.asarray(weights, dtype=float)
+        if cls.is_one_hot:
+            return weights[cls.index_table]
+        return cls.sparse_matrix.dot(weights).reshape(
+            len(AgentActionType), len(UserActionType))
+
+    @classmethod
+    def get_feature_counts(cls, pair_counts):
+        """Converts counts of state-action pairs into counts of features.
+
+        Args:
+            pair_counts (2D numpy.ndarray): Counts of the pairs; column p is
+                for the pair with code p.
+
+        Returns:
+            2D numpy.ndarray: Counts of the features, with the same rows.
+        """
+        if cls.is_one_hot:
+            num_rows = pair_counts.shape[0]
+            columns = (np.arange(num_rows)[:, None] * cls.dimensions +
+                       cls.index_table.ravel())
+            counts = np.bincount(columns.ravel(), weights=pair_counts.ravel(),
+                                 minlength=num_rows * cls.dimensions)
+            return counts.reshape(num_rows, cls.dimensions)
+        return cls.sparse_matrix.rdot(pair_counts)
+
     @classmethod
     def _define_function(cls):
         """Builds the feature function.
@@ -51,3 +194,20 @@ class UserFeatures(object):
                 vec[i] = 1.
                 cls._function[(state, action)] = vec
                 i += 1
+
+    @classmethod
+    def _index_function(cls):
+        """Builds the dense and sparse matrices of the feature function, and
+        the index of the feature of each pair if the features are one-hot.
+        """
+        cls.matrix = np.array([cls.get_vector(state, action)
+                               for state in AgentActionType
+                               for action in UserActionType])
+        cls.sparse_matrix = SparseFeatureMatrix(cls.matrix)
+        num_nonzeros = np.diff(cls.sparse_matrix.indptr)
+        cls.is_one_hot = bool(np.all(num_nonzeros == 1) and
+                              np.all(cls.sparse_matrix.data == 1.))
+        cls.index_table = None
+        if cls.is_one_hot:
+            cls.index_table = cls.sparse_matrix.indices.reshape(
+                len(AgentActionType), len(UserActionType))
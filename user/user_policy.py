@@ -4,6 +4,7 @@ import numpy as np
 
 from user_state import UserState
 from utils.params import AgentActionType, UserActionType, UserPolicyType
+from utils.params import AGENT_ACTION_CODES, UNIFORM_BUFFER_SIZE
 from utils import utils
 
 
@@ -27,7 +28,10 @@ class UserPolicy(object):
             only consequential part of user's state, the dictionary is indexed
             by it. The value of each entry is a list of probability values.
             Each entry in the list is the probability, in that state, of
-            choosing the corresponding action in `actions`.
+            choosing the corresponding action in `actions`. Direct changes
+            to it must be followed by a call to `update_sampler`.
+        random_state (numpy.random.RandomState or None): Source of randomness
+            for sampling actions; None for the global state of `numpy.random`.
     """
 
     def __init__(self, policy_type=None):
@@ -43,12 +47,34 @@ class UserPolicy(object):
                                  enumerate(self.actions)}
         self.policy = {action_type: np.zeros(len(self.actions))
                        for action_type in AgentActionType}
+        self.random_state = None
+
+        # Alias tables of the policy, one per state code, and a buffer of
+        # uniform random numbers for sampling from them.
+        self._thresholds = []
+        self._aliases = []
+        self._uniforms = []
 
         self._build_policy(policy_type)
+        self.update_sampler()
 
     def __str__(self):
         return str(self.policy)
 
+    def __getstate__(self):
+        # The sampler is rebuilt when unpickling.
+        state = self.__dict__.copy()
+        for key in ('_thresholds', '_aliases', '_uniforms'):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Dumps predating the attribute don't have it.
+        self.__dict__.setdefault('random_state', None)
+        self._uniforms = []
+        self.update_sampler()
+
     def get_action(self, user_state):
         """Samples the type of action to be taken from the policy given
         current state.
@@ -64,9 +90,95 @@ class UserPolicy(object):
         elif type(user_state) is AgentActionType:
             state = user_state
 
-        probabilities = self.policy[state]
-        sampled_action = np.random.choice(self.actions, 1, p=probabilities)[0]
-        return sampled_action   # a UserActionType
+        return self.actions[self.get_action_index(AGENT_ACTION_CODES[state])]
+
+    def get_action_index(self, state_code):
+        """Samples the type of action to be taken in a state given by its
+        code.
+
+        Args:
+            state_code (int): Code of the state, i.e., a value of
+                `AGENT_ACTION_CODES`.
+
+        Returns:
+            int: Index, in `actions`, of the sampled type of action.
+        """
+        thresholds = self._thresholds[state_code]
+        if thresholds is None:
+            state = list(AgentActionType)[state_code]
+            raise ValueError("Invalid probabilities for state {}: {}"
+                             .format(state, self.policy[state]))
+
+        if not self._uniforms:
+            random = utils.get_random_state(self.random_state)
+            self._uniforms = random.random_sample(UNIFORM_BUFFER_SIZE).tolist()
+        scaled = self._uniforms.pop() * len(thresholds)
+        index = int(scaled)
+        if scaled - index >= thresholds[index]:
+            index = self._aliases[state_code][index]
+        return index
+
+    def get_actions(self, states):
+        """Samples the types of actions to be taken in many states at once.
+
+        Args:
+            states (1D numpy.ndarray): Codes of the states, i.e., values of
+                `AGENT_ACTION_CODES`.
+
+        Returns:
+            1D numpy.ndarray: Indices, in `actions`, of the sampled types of
+                actions.
+        """
+        states = np.asarray(states)
+        thresholds = np.array([row if row is not None else
+                               np.zeros(len(self.actions))
+                               for row in self._thresholds])
+        aliases = np.array(self._aliases)
+
+        random = utils.get_random_state(self.random_state)
+        scaled = random.random_sample(states.size) * len(self.actions)
+        indices = scaled.astype(int)
+        use_alias = (scaled - indices) >= thresholds[states, indices]
+        indices[use_alias] = aliases[states[use_alias], indices[use_alias]]
+        return indices
+
+    def set_random_state(self, random_state):
+        """Sets the source of randomness for sampling actions.
+
+        Args:
+            random_state (numpy.random.RandomState or None): A random state, or
+                None for the global state of `numpy.random`.
+        """
+        self.random_state = random_state
+        # Discard the numbers drawn from the previous source.
+        self._uniforms = []
+
+    def update_sampler(self):
+        """Compiles the policy into alias tables for sampling actions. Must be
+        called whenever `policy` is changed.
+        """
+        self._thresholds = []
+        self._aliases = []
+        for state in AgentActionType:
+            probabilities = np.asarray(self.policy[state], dtype=float)
+            if np.sum(probabilities) > 0:
+                thresholds, aliases = utils.build_alias_table(probabilities)
+                self._thresholds.append(thresholds.tolist())
+                self._aliases.append(aliases.tolist())
+            else:
+                # Not a valid distribution, e.g., after a reset.
+                self._thresholds.append(None)
+                self._aliases.append(np.arange(len(self.actions)).tolist())
+
+    def get_policy_matrix(self):
+        """Returns the policy as a matrix of probabilities.
+
+        Returns:
+            2D numpy.ndarray: Matrix whose row i contains the probabilities of
+                the `actions` in the i-th member of `AgentActionType`.
+        """
+        return np.array([self.policy[state] for state in AgentActionType],
+                        dtype=float)
 
     def build_policy_from_q_values(self, q_function, epsilon):
         """Defines an epsilon-greedy policy derived from the Q-values.
@@ -116,6 +228,7 @@ class UserPolicy(object):
             utils.normalize_probabilities(probabilities)
             self.policy[state] = probabilities
         self._check_policy_correctness()
+        self.update_sampler()
 
     def softmax(self, w):
         e = np.exp(w)
@@ -143,12 +256,14 @@ class UserPolicy(object):
 
             utils.normalize_probabilities(probabilities)
             self.policy[state] = probabilities
+        self.update_sampler()
 
     def reset(self):
         """Resets the policy to an invalid, all-zero-probabilities policy."""
         for state in self.policy:
             for i in xrange(len(self.actions)):
                 self.policy[state][i] = 0.
+        self.update_sampler()
 
     def _build_policy(self, policy_type):
         """Builds a user policy.
@@ -2,24 +2,30 @@
 
 from utils.params import NUM_SLOTS, UserStateStatus
 
+# Bitmask with the bits of all slots set.
+ALL_SLOTS_MASK = (1 << NUM_SLOTS) - 1
+
 
 class UserState(object):
     """State class for user. The user's state consists of status
         of all the slots and the most recent action of the agent.
 
+    The statuses are kept as two bitmasks, in which bit i is for the slot with
+    identifier i. A slot is "EMPTY" if its bit is set in neither mask.
+
     Attributes:
-        slots (dict): Dictionary of slot-status pairs. The dictionary is keyed
-            by slot identifiers, and the values correspond to the
-            status (`UserStateStatus`) of each slot.
         agent_act (AgentAction): Most recent action taken by the agent.
+        confirmed_mask (int): Bitmask of the "CONFIRMED" slots.
+        provided_mask (int): Bitmask of the "PROVIDED" slots.
+        slots (tuple of UserStateStatus): Status of each slot, indexed by
+            slot identifiers.
     """
 
     def __init__(self):
-        self.slots = {}
+        self.provided_mask = 0
+        self.confirmed_mask = 0
         self.agent_act = None
 
-        self._init_slots()
-
     def __str__(self):
         return "Slots: {}, System-Act: {}".format(self.slots,
                                                   self.agent_act.type.value)
@@ -41,20 +47,49 @@ class UserState(object):
         # Only the `agent_act` attribute is used to test inequality.
         return not (self == other)
 
+    @property
+    def slots(self):
+        return tuple(self.get_slot_status(id_) for id_ in xrange(NUM_SLOTS))
+
+    def get_slot_status(self, slot_id):
+        """Returns the status of a slot.
+
+        Args:
+            slot_id (int): Identifier of the slot under consideration
+
+        Returns:
+            UserStateStatus: Status of the slot.
+        """
+        bit = 1 << slot_id
+        if self.provided_mask & bit:
+            return UserStateStatus.PROVIDED
+        elif self.confirmed_mask & bit:
+            return UserStateStatus.CONFIRMED
+        else:
+            return UserStateStatus.EMPTY
+
     def mark_slot_as_empty(self, slot_id):
-        self.slots[slot_id] = UserStateStatus.EMPTY
+        bit = 1 << slot_id
+        self.provided_mask &= ~bit
+        self.confirmed_mask &= ~bit
 
     def mark_slot_as_provided(self, slot_id):
-        self.slots[slot_id] = UserStateStatus.PROVIDED
+        bit = 1 << slot_id
+        self.provided_mask |= bit
+        self.confirmed_mask &= ~bit
 
-    def mark_slot_as_comfirmed(self, slot_id):
-        self.slots[slot_id] = UserStateStatus.CONFIRMED
+    def mark_slot_as_confirmed(self, slot_id):
+        bit = 1 << slot_id
+        self.provided_mask &= ~bit
+        self.confirmed_mask |= bit
+
+    def mark_all_slots_as_provided(self):
+        """Marks all slots as "PROVIDED"."""
+        self.provided_mask = ALL_SLOTS_MASK
+        self.confirmed_mask = 0
 
     def reset(self):
         """Resets the state by marking all slots EMPTY."""
-        self._init_slots()
+        self.provided_mask = 0
+        self.confirmed_mask = 0
         self.agent_act = None
-
-    def _init_slots(self):
-        for id_ in xrange(NUM_SLOTS):
-            self.mark_slot_as_empty(id_)
@@ -0,0 +1,212 @@
+"""Instrumentation of long-running computations: counts of the simulated
+dialog sessions, console output filtered by verbosity, and per-iteration
+metrics written as JSON lines."""
+
+import cProfile
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from params import Verbosity, VERBOSITY
+
+# Number of dialog sessions and user turns simulated by this process. Shards of
+# sessions run by worker processes are added once they are done; see
+# `take_simulated_counts`.
+_simulated = {"sessions": 0, "turns": 0}
+
+
+def count_simulated(num_sessions, num_turns):
+    """Adds to the number of dialog sessions and user turns simulated.
+
+    Args:
+        num_sessions (int): Number of sessions that ended.
+        num_turns (int): Number of user turns taken.
+    """
+    _simulated["sessions"] += int(num_sessions)
+    _simulated["turns"] += int(num_turns)
+
+
+def get_simulated_counts():
+    """Returns the number of dialog sessions and user turns simulated by this
+    process so far.
+
+    Returns:
+        (int, int): Number of sessions, and of user turns.
+    """
+    return _simulated["sessions"], _simulated["turns"]
+
+
+def take_simulated_counts(start):
+    """Removes the dialog sessions and user turns counted since `start` from
+    the counts of this process, and returns them, e.g., for a shard of
+    sessions to hand them over to the process which added up its results.
+
+    Args:
+        start ((int, int)): Counts returned by `get_simulated_counts`.
+
+    Returns:
+        1D numpy.ndarray: Number of sessions, and of user turns.
+    """
+    sessions, turns = get_simulated_counts()
+    _simulated["sessions"], _simulated["turns"] = start
+    return np.array([sessions - start[0], turns - start[1]])
+
+
+class MetricsLogger(object):
+    """Logger of the iterations of an algorithm.
+
+    The time spent in each phase of an iteration, and the number of dialog
+    sessions simulated in it, are accumulated with `time`. When the iteration
+    ends, these, the number of dialog sessions and user turns simulated during
+    it and any other given values are appended as one JSON object per line to
+    the metrics file. A single iteration can also be profiled with `cProfile`.
+
+    Attributes:
+        filepath (str): Path of the metrics file, or None to not write one.
+        iteration (int): Index of the current iteration, or None between
+            iterations.
+        phase_sessions (OrderedDict): Number of dialog sessions simulated in
+            each phase of the current iteration.
+        profile_file (str): Path where the profile statistics are dumped.
+        profile_iteration (int): Index of the iteration to profile, or None.
+        timings (OrderedDict): Seconds spent in each phase of the current
+            iteration.
+        verbosity (Verbosity): Most detailed level of messages printed.
+    """
+
+    def __init__(self, filepath=None, verbosity=VERBOSITY,
+                 profile_iteration=None, profile_file=None):
+        """Class constructor
+
+        Args:
+            filepath (str, optional): Path of the metrics file. Lines are
+                appended to an existing file.
+            verbosity (Verbosity, optional): Most detailed level of messages
+                printed.
+            profile_iteration (int, optional): Index of the iteration to
+                profile.
+            profile_file (str, optional): Path where the profile statistics
+                are dumped; required along with `profile_iteration`.
+        """
+        assert profile_iteration is None or profile_file is not None, \
+            "The path of the profile is missing"
+        self.filepath = filepath
+        self.verbosity = verbosity
+        self.profile_iteration = profile_iteration
+        self.profile_file = profile_file
+        self.iteration = None
+        self.timings = OrderedDict()
+        self.phase_sessions = OrderedDict()
+        self._file = open(filepath, "a") if filepath is not None else None
+        self._profiler = None
+        self._start_time = None
+        self._start_counts = None
+
+    def is_enabled(self, level):
+        """Returns whether messages of the given level are printed.
+
+        Args:
+            level (Verbosity): Level of the messages.
+
+        Returns:
+            bool: True if the messages are printed.
+        """
+        return level.value <= self.verbosity.value
+
+    def log(self, level, *values):
+        """Prints values, separated by spaces, if their level is enabled.
+
+        Args:
+            level (Verbosity): Level of the message.
+            *values: Values to print.
+        """
+        if self.is_enabled(level):
+            print " ".join(str(value) for value in values)
+
+    def start_iteration(self, iteration):
+        """Starts timing an iteration, and profiling it if requested.
+
+        Args:
+            iteration (int): Index of the iteration.
+        """
+        self.iteration = iteration
+        self.timings = OrderedDict()
+        self.phase_sessions = OrderedDict()
+        self._start_counts = get_simulated_counts()
+        if iteration == self.profile_iteration:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start_time = time.time()
+
+    @contextmanager
+    def time(self, phase):
+        """Context manager adding the time spent in its body, and the dialog
+        sessions simulated in it, to a phase of the current iteration.
+
+        Args:
+            phase (str): Name of the phase.
+        """
+        start = time.time()
+        start_sessions = get_simulated_counts()[0]
+        try:
+            yield
+        finally:
+            self.timings[phase] = (self.timings.get(phase, 0.) +
+                                   time.time() - start)
+            self.phase_sessions[phase] = (self.phase_sessions.get(phase, 0) +
+                                          get_simulated_counts()[0] -
+                                          start_sessions)
+
+    def end_iteration(self, **values):
+        """Ends the current iteration and writes its metrics.
+
+        Args:
+            **values: Other metrics of the iteration, e.g., floats or numpy
+                scalars.
+
+        Returns:
+            OrderedDict: Metrics of the iteration.
+        """
+        seconds = time.time() - self._start_time
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_file)
+            self._profiler = None
+
+        sessions, turns = get_simulated_counts()
+        metrics = OrderedDict([
+            ("iteration", self.iteration),
+            ("seconds", seconds),
+            ("phases", self.timings),
+            ("phase_sessions", self.phase_sessions),
+            ("sessions", sessions - self._start_counts[0]),
+            ("turns", turns - self._start_counts[1]),
+        ])
+        for name in sorted(values):
+            value = values[name]
+            metrics[name] = value.item() if isinstance(value, np.generic) \
+                else value
+
+        if self._file is not None:
+            self._file.write(json.dumps(metrics) + "\n")
+            self._file.flush()
+        summary = ["{:.2f} s".format(seconds),
+                   "{} sessions".format(metrics["sessions"])]
+        summary.extend("{} {}".format(name, metrics[name])
+                       for name in sorted(values))
+        self.log(Verbosity.progress, "Iteration {}:".format(self.iteration),
+                 ", ".join(summary))
+        self.iteration = None
+        return metrics
+
+    def close(self):
+        """Closes the metrics file."""
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
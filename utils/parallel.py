@@ -0,0 +1,119 @@
+"""Sharded execution of dialog sessions on a pool of worker processes."""
+
+import multiprocessing
+
+import numpy as np
+
+from metrics import count_simulated
+from params import NUM_WORKERS, SESSIONS_PER_SHARD
+
+
+def get_shard_random_state(seed, shard):
+    """Returns the random state of a shard.
+
+    Args:
+        seed (int): Seed for the whole run.
+        shard (int): Index of the shard.
+
+    Returns:
+        numpy.random.RandomState: Random state seeded with both the seed and
+            the shard's index, so that shards draw independent streams.
+    """
+    return np.random.RandomState([seed, shard])
+
+
+def get_shard_sizes(num_sessions):
+    """Splits the dialog sessions into shards of `SESSIONS_PER_SHARD`
+    sessions, the last one possibly being smaller.
+
+    Args:
+        num_sessions (int): Total number of dialog sessions.
+
+    Returns:
+        list of int: Number of sessions in each shard.
+    """
+    sizes = [SESSIONS_PER_SHARD] * (num_sessions // SESSIONS_PER_SHARD)
+    if num_sessions % SESSIONS_PER_SHARD:
+        sizes.append(num_sessions % SESSIONS_PER_SHARD)
+    return sizes
+
+
+def map_shards(function, args, num_sessions, seed, num_workers=NUM_WORKERS):
+    """Runs `function(*args, num_sessions=..., random_state=...)` once per
+    shard of sessions, on a pool of worker processes.
+
+    The shards, and their random states, only depend on `num_sessions` and
+    `seed`. Hence, results are identical regardless of `num_workers`.
+
+    Args:
+        function (function): Module-level function running a shard of dialog
+            sessions. It must accept `num_sessions` and `random_state` keyword
+            arguments.
+        args (tuple): Other arguments of `function`. These must be picklable.
+        num_sessions (int): Total number of dialog sessions.
+        seed (int): Seed for the whole run.
+        num_workers (int, optional): Number of worker processes. With a single
+            worker, shards are run in the calling process.
+
+    Returns:
+        list: Results of `function`, in the order of the shards.
+    """
+    tasks = [(function, args, size, seed, shard)
+             for shard, size in enumerate(get_shard_sizes(num_sessions))]
+    if num_workers == 1 or len(tasks) <= 1:
+        return [_run_shard(task) for task in tasks]
+
+    pool = multiprocessing.Pool(min(num_workers, len(tasks)))
+    try:
+        return pool.map(_run_shard, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def sum_shards(results):
+    """Sums the results of shards in their order, so that the outcome doesn't
+    depend on the order in which the shards finished.
+
+    Args:
+        results (list): Results of `map_shards`, e.g., numpy arrays.
+
+    Returns:
+        The sum of the results.
+    """
+    total = results[0]
+    for result in results[1:]:
+        total = total + result
+    return total
+
+
+def sum_counted_shards(results):
+    """Sums the results of shards which also return the number of dialog
+    sessions and user turns they simulated, see `take_simulated_counts`, and
+    adds these to the counts of this process. Otherwise, the sessions run by
+    worker processes would not be counted.
+
+    Args:
+        results (list of tuple): Results of `map_shards`, each along with the
+            counts of its shard.
+
+    Returns:
+        The sum of the results.
+    """
+    count_simulated(*sum_shards([counts for _, counts in results]))
+    return sum_shards([result for result, _ in results])
+
+
+def _run_shard(task):
+    """Runs a single shard of dialog sessions.
+
+    Args:
+        task (tuple): Function, its arguments, the number of sessions, the seed
+            and the index of the shard.
+
+    Returns:
+        Result of the function.
+    """
+    function, args, num_sessions, seed, shard = task
+    return function(*args, num_sessions=num_sessions,
+                    random_state=get_shard_random_state(seed, shard))
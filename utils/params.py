@@ -1,23 +1,78 @@
 """Parameters and global constants used in the codebase."""
 
+import os
+
 from enum import Enum
 from numpy.random import randint
 
 # Number of dialog sessions to be run for calculation of feature expectations.
 NUM_SESSIONS_FE = 1000
 
+# Number of worker processes used to run dialog sessions.
+NUM_WORKERS = 1
+
+# Number of dialog sessions in a shard. Each shard is run by a single worker
+# with its own random state, derived from the seed and the shard's index.
+SESSIONS_PER_SHARD = 250
+
+# Sequential estimation of feature expectations (see
+# `FeatureExpectationMode.sequential`): sessions are run in chunks
+# until the half-width of the confidence interval of the distance to the
+# expert's feature expectation drops below the target, or the maximum number
+# of sessions has been run.
+FE_CHUNK_SIZE = 250
+FE_MAX_SESSIONS = 20000
+FE_TARGET_HALF_WIDTH = 0.05
+FE_CONFIDENCE_Z = 1.96  # z-score of the confidence level (95%).
+
+# Directory of the on-disk caches, in the user's cache directory.
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "inverse-reinforcement-learning")
+
+# Cache of feature expectations: number of entries kept in memory, directory
+# of the on-disk tier (None to disable it) and its maximum size in bytes.
+FE_CACHE_SIZE = 1024
+FE_CACHE_DIR = os.path.join(CACHE_DIR, "fe-cache")
+FE_CACHE_MAX_BYTES = 16 * 2**20
+
+# Directory where the compiled transition tables of the handcrafted agent and
+# of users are cached (None to not cache them on disk).
+TRANSITION_TABLE_DIR = os.path.join(CACHE_DIR, "transition-tables")
+
+# Number of uniform random numbers drawn at once by a user policy's sampler.
+UNIFORM_BUFFER_SIZE = 1024
+
 # Number of slots to be filled.
 NUM_SLOTS = 3
 
+# Number of user turns after which the agent terminates the dialog session
+# with a BAD_CLOSE.
+MAX_DIALOG_STEPS = 100
+
 # Controls the fraction of total confirmations that are explicit.
 AGENT_EXPLICIT_VS_IMPLICIT_CONFIRMATION_PROBABILITY = 0.5
 
 # Discount factor
 GAMMA = 0.95
 
-# Number of episodes to run for Q-learning
+# Maximum number of episodes to run for Q-learning and SARSA, including the
+# batched solver.
 Q_LEARNING_EPISODES = 100
 
+# The TD and prioritized-sweeping solvers stop early once, for this many
+# consecutive episodes, no Q-value changed by more than the tolerance times
+# the learning rate, i.e., no pair's TD errors summed over the episode
+# exceeded the tolerance, relative to the largest absolute reward, and no
+# greedy action changed.
+Q_CONVERGENCE_WINDOW = 10
+Q_CONVERGENCE_TOLERANCE = 0.05
+
+# Minimum cosine similarity between the weights of consecutive IRL iterations
+# for the solver to be warm-started; below it, the previous Q-values point the
+# solver in the wrong direction and it starts from scratch.
+WARM_START_MIN_COSINE = 0.9
+
 # Learning rate for Q-learning
 Q_LEARNING_RATE = 0.1
 
@@ -30,20 +85,100 @@ EPSILON = 0.1
 # Rate of decay for degree of randomness in Q-learning policies.
 EPSILON_DECAY_RATE = 0.99
 
+# Decay rate of the eligibility traces in SARSA(lambda).
+SARSA_LAMBDA = 0.3
+
+# Maximum number of episodes to run for SARSA(lambda), which propagates
+# rewards back much faster than one-step Q-learning and SARSA.
+SARSA_LAMBDA_EPISODES = 30
+
+# Number of dialog sessions run in lockstep by the batched TD solver.
+SOLVER_LANES = 16
+
+# Maximum number of episodes to run for prioritized sweeping, the maximum
+# number of planning updates after each of them, and the smallest change of
+# Q-value worth planning for.
+SWEEPING_EPISODES = 10
+SWEEPING_PLANNING_STEPS = 200
+SWEEPING_THRESHOLD = 1e-4
+
+# Maximum number of policy-iteration steps for the model-based solver.
+POLICY_ITERATION_STEPS = 50
+
 # Threshold for IRL
 THRESHOLD = 0.001
 
-# File where learnt user simulations are dumped periodically
+# Budgets of an IRL run: maximum number of iterations, and of seconds spent
+# by one invocation (None for no limit)
+IRL_MAX_ITERATIONS = 200
+IRL_MAX_SECONDS = None
+
+# An IRL run stops once the margin stalls, i.e., the smallest margin of the
+# last IRL_STALL_WINDOW iterations is not lower by at least the relative
+# IRL_MIN_IMPROVEMENT than the smallest margin before them
+IRL_STALL_WINDOW = 10
+IRL_MIN_IMPROVEMENT = 0.01
+
+# File where learnt user simulations are checkpointed after every iteration
 SIMULATIONS_DUMP_FILE = "./simulations-dump-" + str(randint(1000, 9999))
 
+# Suffix of the path where the simulations of a finished run are stored
+SIMULATIONS_STORE_SUFFIX = ".store"
+
+# Maximum number of checkpoint records written between two syncs to disk
+CHECKPOINT_SYNC_RECORDS = 10
+
+# Suffixes of the paths where the metrics of each iteration of an IRL run
+# are written as JSON lines, and where the profile of an iteration is dumped
+METRICS_SUFFIX = ".metrics"
+PROFILE_SUFFIX = ".prof"
+
 TAU = 1
 
+# Frank-Wolfe solver of the mixture weights of `QpMixedUserSimulation`: it
+# stops once the duality gap drops below the tolerance.
+MIXTURE_TOLERANCE = 1e-10
+MIXTURE_MAX_ITERATIONS = 10000
+
 # User policy types
 class UserPolicyType(Enum):
     handcrafted = 1
     random = 2
 
 
+# Ways of calculating the feature expectation of a user policy.
+class FeatureExpectationMode(Enum):
+    sessions = 1  # One `DialogSession` at a time.
+    batch = 2     # All sessions in lockstep using `BatchDialogSession`.
+    exact = 3     # No sessions; the dialog's Markov chain is solved instead.
+    control_variate = 4  # Batch sessions, corrected using the expert's.
+    sequential = 5  # Batch sessions in chunks, until precise enough.
+
+
+# Solvers of the mixture weights of `QpMixedUserSimulation`.
+class MixtureSolver(Enum):
+    qp = 1           # Dense quadratic program solved by `cvxopt`.
+    frank_wolfe = 2  # Away-step Frank-Wolfe; see `SimplexLeastSquares`.
+
+
+# Reasons for which an IRL run stops.
+class StopReason(Enum):
+    converged = 1       # The margin dropped below THRESHOLD.
+    noise_floor = 2     # The margin can't be told apart from its noise.
+    stalled = 3         # The margin stopped improving.
+    max_iterations = 4  # IRL_MAX_ITERATIONS iterations were run.
+    time_budget = 5     # IRL_MAX_SECONDS seconds were spent.
+
+
+# Levels of detail of the messages printed during long computations; each
+# level includes the ones before it.
+class Verbosity(Enum):
+    quiet = 0     # Nothing.
+    progress = 1  # One line per iteration.
+    details = 2   # Weights, margins and rewards.
+    debug = 3     # Q-values and policies.
+
+
 class UserStateStatus(Enum):
     EMPTY = "empty"
     PROVIDED = "provided"
@@ -74,3 +209,22 @@ class AgentActionType(Enum):
     CONFIRM_ASK = "confirm_and_ask"
     CLOSE = "close"
     BAD_CLOSE = "bad_close"
+
+
+# Default mode for calculating feature expectations.
+FEATURE_EXPECTATION_MODE = FeatureExpectationMode.batch
+
+# Mode for calculating feature expectations in IRL, where each one is compared
+# with the expert's, so that it is only as precise as the comparison needs.
+IRL_FEATURE_EXPECTATION_MODE = FeatureExpectationMode.sequential
+
+# Solver of the mixture weights of `QpMixedUserSimulation`.
+MIXTURE_SOLVER = MixtureSolver.frank_wolfe
+
+# Default level of detail of the printed messages.
+VERBOSITY = Verbosity.progress
+
+# Integer codes of the enum members, i.e., their position in the definition
+# order. These are used by the array-backed dialog machinery.
+AGENT_ACTION_CODES = {action: i for i, action in enumerate(AgentActionType)}
+USER_ACTION_CODES = {action: i for i, action in enumerate(UserActionType)}
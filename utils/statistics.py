@@ -0,0 +1,116 @@
+"""Mergeable statistics of the users' actions in dialog sessions."""
+
+import numpy as np
+
+from imitation_learning import dialog_log
+from params import AgentActionType, UserActionType, MAX_DIALOG_STEPS
+
+
+class DialogStatistics(object):
+    """Statistics of the users' actions in dialog sessions, updated from
+    integer-coded logs of the sessions. Statistics of different shards of
+    sessions can be merged, e.g., using `+`.
+
+    Logs hold one row per session. Entry [i, t] of the state log is the code
+    of the agent's action that the user responded to in the t-th turn of the
+    i-th session, and the same entry of the action log is the code of the
+    user's response. Entries past the end of a session are -1.
+
+    Attributes:
+        length_counts (1D numpy.ndarray): Number of sessions with each number
+            of user turns.
+        num_sessions (int): Number of sessions.
+        response_counts (2D numpy.ndarray): Number of times each user action
+            was taken in response to each agent action. Entry [s, a] is for
+            the agent action with code s and the user action with code a.
+    """
+
+    def __init__(self):
+        self.num_sessions = 0
+        self.response_counts = np.zeros(
+            (len(AgentActionType), len(UserActionType)), dtype=np.int64)
+        self.length_counts = np.zeros(MAX_DIALOG_STEPS + 2, dtype=np.int64)
+
+    def __add__(self, other):
+        total = DialogStatistics()
+        total.merge(self)
+        total.merge(other)
+        return total
+
+    def update(self, state_log, action_log):
+        """Adds sessions.
+
+        Args:
+            state_log (2D numpy.ndarray): Codes of the agent's actions.
+            action_log (2D numpy.ndarray): Codes of the users' actions.
+        """
+        state_log = np.asarray(state_log)
+        action_log = np.asarray(action_log)
+        self.response_counts += dialog_log.get_action_counts(state_log,
+                                                             action_log)
+        self.length_counts += np.bincount(np.sum(state_log >= 0, axis=1),
+                                          minlength=self.length_counts.size)
+        self.num_sessions += state_log.shape[0]
+
+    def merge(self, other):
+        """Adds the sessions seen by another instance.
+
+        Args:
+            other (DialogStatistics): Statistics of other sessions.
+        """
+        self.num_sessions += other.num_sessions
+        self.response_counts += other.response_counts
+        self.length_counts += other.length_counts
+
+    def get_response_statistics(self):
+        """Returns the number of times each user action was taken in response
+        to each agent action.
+
+        Returns:
+            dict: Counts of the user actions, in the order of
+                `UserActionType`, indexed by `AgentActionType`.
+        """
+        return {action_type: self.response_counts[i]
+                for i, action_type in enumerate(AgentActionType)}
+
+    def get_agent_action_counts(self):
+        """Returns the number of user turns that responded to each agent
+        action.
+
+        Returns:
+            1D numpy.ndarray: Counts, in the order of `AgentActionType`.
+        """
+        return np.sum(self.response_counts, axis=1)
+
+    def get_action_frequencies(self):
+        """Returns the average number of times each user action was taken in
+        a session.
+
+        Returns:
+            dict: Average counts indexed by `UserActionType`.
+        """
+        counts = np.sum(self.response_counts, axis=0)
+        return {action_type: counts[i] / (1. * self.num_sessions)
+                for i, action_type in enumerate(UserActionType)}
+
+    def get_mean_length(self):
+        """Returns the average number of user turns in a session.
+
+        Returns:
+            float: Average number of turns.
+        """
+        lengths = np.arange(self.length_counts.size)
+        return lengths.dot(self.length_counts) / (1. * self.num_sessions)
+
+    def report(self):
+        """Returns a printable summary of the statistics.
+
+        Returns:
+            str: The summary.
+        """
+        lines = ["Sessions: {}, mean length: {:.3f}".format(
+            self.num_sessions, self.get_mean_length())]
+        lines.append(str(self.get_response_statistics()))
+        lines.append(str(self.get_agent_action_counts()))
+        lines.append(str(self.get_action_frequencies()))
+        return "\n".join(lines)
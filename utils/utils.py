@@ -1,6 +1,29 @@
+import os
+import tempfile
+
 import numpy as np
 
-from params import AgentActionType, UserActionType
+from params import NUM_WORKERS
+from params import MIXTURE_MAX_ITERATIONS, MIXTURE_TOLERANCE
+from metrics import get_simulated_counts, take_simulated_counts
+from parallel import map_shards, sum_counted_shards
+from statistics import DialogStatistics
+
+
+def get_random_state(random_state):
+    """Returns the source of randomness to be used.
+
+    Args:
+        random_state (numpy.random.RandomState or None): A random state, or
+            None for the global state of `numpy.random`.
+
+    Returns:
+        numpy.random.RandomState or module: `random_state`, or the
+            `numpy.random` module if it is None.
+    """
+    if random_state is None:
+        return np.random
+    return random_state
 
 
 def get_index_of_max_element(arr):
@@ -18,6 +41,53 @@ def get_index_of_max_element(arr):
     return sort_indices[-1]
 
 
+def get_lowest_set_bit(mask):
+    """Returns the position of the lowest bit set in a bitmask.
+
+    Args:
+        mask (int): Non-negative bitmask.
+
+    Returns:
+        int or None: Position of the bit, or None if no bit is set.
+    """
+    if not mask:
+        return None
+    return (mask & -mask).bit_length() - 1
+
+
+def build_alias_table(probabilities):
+    """Builds the alias table of a discrete distribution (Vose's method), so
+    that sampling from it takes a single uniform random number and constant
+    time: for a uniform draw u, let i = floor(u * n) and f = u * n - i; the
+    sample is i if f < `thresholds[i]`, and `aliases[i]` otherwise.
+
+    Args:
+        probabilities (numpy.ndarray): Vector of probabilities.
+
+    Returns:
+        (1D numpy.ndarray, 1D numpy.ndarray): Thresholds and aliases.
+    """
+    n = len(probabilities)
+    scaled = np.asarray(probabilities, dtype=float) * (n / np.sum(probabilities))
+    thresholds = np.ones(n)
+    aliases = np.arange(n)
+
+    small = [i for i in xrange(n) if scaled[i] < 1.]
+    large = [i for i in xrange(n) if scaled[i] >= 1.]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        thresholds[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] += scaled[less] - 1.
+        if scaled[more] < 1.:
+            small.append(more)
+        else:
+            large.append(more)
+    # Whatever remains has a probability of one up to rounding errors.
+    return thresholds, aliases
+
+
 def normalize_probabilities(probabilities):
     """Normalizes the probabilities so that they sum to one.
 
@@ -37,7 +107,244 @@ def normalize_probabilities(probabilities):
         sum_of_probabilities = np.sum(probabilities)
 
 
-def collect_statistics(user, agent, dialog_session, num_sessions):
+def load_arrays(filepath):
+    """Loads arrays saved by `save_arrays`.
+
+    Args:
+        filepath (str): Path of the `.npz` file.
+
+    Returns:
+        dict or None: Arrays indexed by their names, or None if the file is
+            missing or unreadable.
+    """
+    try:
+        with np.load(filepath) as data:
+            return {name: data[name] for name in data.files}
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_arrays(filepath, **arrays):
+    """Saves named arrays in a `.npz` file. The file is written under a
+    temporary name and then renamed, so that readers never see it partially
+    written.
+
+    Args:
+        filepath (str): Path of the file; its directory is created if needed.
+        **arrays: Arrays indexed by their names.
+    """
+    directory = os.path.dirname(filepath) or "."
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_filepath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as fout:
+        np.savez(fout, **arrays)
+    os.rename(tmp_filepath, filepath)
+
+
+class LazyTable(dict):
+    """Table of objects built on first access and shared afterwards, e.g.,
+    the actions parameterized by a slot.
+
+    Entries are looked up like those of a list, and each is built by calling
+    the factory with its index the first time it is accessed.
+
+    Attributes:
+        factory (function): Function building the entry for an index.
+        size (int): Number of entries.
+    """
+
+    def __init__(self, factory, size):
+        super(LazyTable, self).__init__()
+        self.factory = factory
+        self.size = size
+
+    def __missing__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError("Index {} out of range".format(index))
+        entry = self[index] = self.factory(index)
+        return entry
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return (self[index] for index in xrange(self.size))
+
+    # Tables are compared by identity, whatever entries they have built.
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    __hash__ = object.__hash__
+
+
+class SimplexLeastSquares(object):
+    """Finds the convex combination of a set of vectors that is closest to a
+    target vector, i.e., minimizes ||V^T x - target||^2 over the probability
+    simplex, where the rows of V are the vectors.
+
+    The problem is solved by the away-step Frank-Wolfe algorithm with exact
+    line search. Each iteration costs one product of V with the residual,
+    the Gram matrix V V^T is never formed, and only the vectors that take
+    part in the solution get non-zero weights. Vectors can be added after
+    solving, in which case solving again resumes from the previous weights.
+
+    Attributes:
+        max_iterations (int): Maximum number of iterations per solve.
+        target (1D numpy.ndarray): The target vector.
+        tolerance (float): Duality gap below which solving stops.
+        vectors (2D numpy.ndarray): The vectors, as rows.
+        weights (1D numpy.ndarray): Weight of each vector in the current
+            solution.
+    """
+
+    def __init__(self, target, tolerance=MIXTURE_TOLERANCE,
+                 max_iterations=MIXTURE_MAX_ITERATIONS):
+        self.target = np.asarray(target, dtype=float)
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.vectors = np.zeros((0, self.target.size))
+        self.weights = np.zeros(0)
+
+    def add_vectors(self, vectors):
+        """Adds vectors with zero weight.
+
+        Args:
+            vectors (2D numpy.ndarray): The vectors, as rows.
+        """
+        vectors = np.asarray(vectors, dtype=float).reshape(
+            -1, self.target.size)
+        self.vectors = np.concatenate((self.vectors, vectors))
+        self.weights = np.concatenate((self.weights, np.zeros(len(vectors))))
+
+    def get_distance(self):
+        """Returns the distance between the current convex combination and
+        the target.
+        """
+        return np.linalg.norm(self.vectors.T.dot(self.weights) - self.target)
+
+    def solve(self):
+        """Updates the weights to the solution of the problem.
+
+        Returns:
+            1D numpy.ndarray: The weights.
+        """
+        assert len(self.vectors) > 0, "No vectors to combine"
+        if not self.weights.any():
+            # Start from the vector closest to the target.
+            distances = np.sum((self.vectors - self.target)**2, axis=1)
+            self.weights[np.argmin(distances)] = 1.
+
+        x = self.weights
+        for _ in xrange(self.max_iterations):
+            combination = self.vectors.T.dot(x)
+            residual = combination - self.target
+            # Halved gradient of the objective.
+            gradient = self.vectors.dot(residual)
+            average = gradient.dot(x)
+            toward = np.argmin(gradient)
+            support = np.flatnonzero(x)
+            away = support[np.argmax(gradient[support])]
+
+            toward_gap = average - gradient[toward]
+            away_gap = gradient[away] - average
+            if toward_gap <= self.tolerance:
+                break
+            if toward_gap >= away_gap:
+                # Move toward the best vector.
+                direction = self.vectors[toward] - combination
+                max_step = 1.
+            else:
+                # Move away from the worst vector in the support.
+                direction = combination - self.vectors[away]
+                max_step = x[away] / (1. - x[away]) if x[away] < 1. else 0.
+
+            norm = direction.dot(direction)
+            if norm == 0. or max_step == 0.:
+                break
+            step = min(max(-residual.dot(direction) / norm, 0.), max_step)
+            if toward_gap >= away_gap:
+                x *= 1. - step
+                x[toward] += step
+            else:
+                x *= 1. + step
+                x[away] = 0. if step == max_step else x[away] - step
+        return x
+
+
+class RunningMoments(object):
+    """Running mean and covariance of a stream of vectors, updated a batch of
+    vectors at a time.
+
+    Attributes:
+        count (int): Number of vectors seen.
+        mean (1D numpy.ndarray): Mean of the vectors.
+        scatter (2D numpy.ndarray): Sum of outer products of the deviations of
+            the vectors from their mean.
+    """
+
+    def __init__(self, dimensions):
+        self.count = 0
+        self.mean = np.zeros(dimensions)
+        self.scatter = np.zeros((dimensions, dimensions))
+
+    def update(self, vectors):
+        """Adds a batch of vectors.
+
+        Args:
+            vectors (2D numpy.ndarray): One vector per row.
+        """
+        batch = RunningMoments(self.mean.size)
+        batch.count = vectors.shape[0]
+        if batch.count == 0:
+            return
+        batch.mean = np.mean(vectors, axis=0)
+        deviations = vectors - batch.mean
+        batch.scatter = deviations.T.dot(deviations)
+        self.merge(batch)
+
+    def merge(self, other):
+        """Adds the vectors seen by another instance.
+
+        Args:
+            other (RunningMoments): Moments of other vectors.
+        """
+        count = self.count + other.count
+        if other.count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (float(other.count) / count)
+        self.scatter = (self.scatter + other.scatter +
+                        np.outer(delta, delta) *
+                        (float(self.count) * other.count / count))
+        self.count = count
+
+    def get_covariance(self):
+        """Returns the sample covariance of the vectors.
+
+        Returns:
+            2D numpy.ndarray: Covariance matrix.
+        """
+        if self.count < 2:
+            return np.zeros(self.scatter.shape)
+        return self.scatter / (self.count - 1)
+
+    def get_standard_error(self):
+        """Returns the standard error of each element of the mean.
+
+        Returns:
+            1D numpy.ndarray: Standard errors.
+        """
+        if self.count == 0:
+            return np.zeros(self.mean.size)
+        return np.sqrt(np.diag(self.get_covariance()) / self.count)
+
+
+def collect_statistics(user, agent, dialog_session, num_sessions, seed=None,
+                       num_workers=NUM_WORKERS):
     """Runs multiple dialog sessions between the user and the agent to collect
     statistics about user's actions.
 
@@ -46,40 +353,65 @@ def collect_statistics(user, agent, dialog_session, num_sessions):
         agent (:obj: Agent): The dialog agent.
         dialog_session (DialogSession): The dialog session class
         num_sessions (int): Number of dialog sessions to execute.
+        seed (int, optional): Seed for the random states of the dialog
+            sessions. When given, the sessions are split into shards run by
+            `num_workers` processes, and the statistics only depend on the
+            seed. Otherwise, the global state of `numpy.random` is used.
+        num_workers (int, optional): Number of worker processes; only used
+            along with `seed`.
+
+    Returns:
+        DialogStatistics: Statistics of the sessions.
+    """
+    if seed is None:
+        shards = [_collect_statistics(user, agent, dialog_session,
+                                      num_sessions)]
+    else:
+        shards = map_shards(_collect_statistics,
+                            (user, agent, dialog_session), num_sessions, seed,
+                            num_workers)
+    return sum_counted_shards(shards)
+
+
+def _collect_statistics(user, agent, dialog_session, num_sessions,
+                        random_state=None):
+    """Runs multiple dialog sessions between the user and the agent, and
+    collects statistics from their logs.
+
+    Args:
+        user (:obj: User): The dialog user.
+        agent (:obj: Agent): The dialog agent.
+        dialog_session (DialogSession): The dialog session class
+        num_sessions (int): Number of dialog sessions to execute.
+        random_state (numpy.random.RandomState, optional): Source of
+            randomness. Defaults to the global state of `numpy.random`.
+
+    Returns:
+        (DialogStatistics, 1D numpy.ndarray): Statistics of the sessions, and
+            the number of sessions and user turns simulated.
     """
-    user_actions = [user_action for user_action in UserActionType]
-    user_action_map = {action: i for i, action in
-                       enumerate(user_actions)}
-    user_action_stats = {action_type: np.zeros(len(user_actions))
-                         for action_type in AgentActionType}
-
-    agent_actions = [agent_action for agent_action in AgentActionType]
-    agent_action_map = {action: i for i, action in
-                        enumerate(agent_actions)}
-    agent_action_counts = np.zeros(len(agent_actions))
-
-    # Run multiple dialog sessions to gather user's action statistics.
+    start_counts = get_simulated_counts()
+    user_random_state = user.random_state
+    agent_random_state = agent.random_state
+    if random_state is not None:
+        user.set_random_state(random_state)
+        agent.random_state = random_state
+
+    state_log = []
+    action_log = []
     for _ in xrange(num_sessions):
         # Reset the agent and the user.
         agent.reset()
         user.reset(reset_policy=False)  # Only reset state, not policy.
-        # Create a new dialog session.
         session = dialog_session(user, agent)
-        # Start the dialog session by having the dialog agent make the
-        # first move.
-        agent_action = session.ask_agent_to_start()
-        user_action = None
-        while not (agent_action is AgentActionType.CLOSE and
-                   user_action is UserActionType.CLOSE):
-            user_action, next_agent_action = session.execute_one_step()
-
-            # Update action statistics
-            user_action_index = user_action_map[user_action]
-            user_action_stats[agent_action][user_action_index] += 1
-            agent_action_index = agent_action_map[agent_action]
-            agent_action_counts[agent_action_index] += 1
-
-            agent_action = next_agent_action
-
-    print user_action_stats
-    print agent_action_counts
+        session.start()
+        state_log.append(session.state_codes)
+        action_log.append(session.action_codes)
+
+    user.set_random_state(user_random_state)
+    agent.random_state = agent_random_state
+
+    statistics = DialogStatistics()
+    if num_sessions > 0:
+        statistics.update(state_log, action_log)
+    return statistics, take_simulated_counts(start_counts)